@@ -50,6 +50,11 @@ class ImplementationConfig(BaseConfigSection):
         self.task_inflation_factor = 10
         """int: Submit task_inflation_factor*n_cores number of tasks."""
 
+        self._task_scheduling_type = str
+        self.task_scheduling = "guided"
+        """str: How the image is split into tasks. 'guided' hands out tiles of lines that shrink as the queue
+        drains, 'static' uses task_inflation_factor*n_cores equal tiles."""
+
         self._ip_head_type = str
         self.ip_head = None
         """str: Ray - parameter.  IP-head (for multi-node runs)."""
@@ -76,6 +81,16 @@ class ImplementationConfig(BaseConfigSection):
         buffer size of 1 means pixels are processed independently.  Large buffers can help prevent IO choke points,
         especially if the """
 
+        self._io_writer_queue_size_type = int
+        self.io_writer_queue_size = 4
+        """int: Number of flushed output buffers each output file may queue for its background writer
+        thread before the inversion blocks on disk writes."""
+
+        self._io_prefetch_budget_type = float
+        self.io_prefetch_budget = 64
+        """float: Memory budget in MB for the input rows each worker reads ahead of use in a background thread.
+        0 disables prefetching."""
+
         self._max_hash_table_size_type = int
         self.max_hash_table_size = 50
         """int: The maximum size of inversion hash tables.  Can provide speedups with redundant surfaces, but comes
@@ -115,6 +130,14 @@ class ImplementationConfig(BaseConfigSection):
                 "it may be blank."
             )
 
+        valid_task_scheduling = ["guided", "static"]
+        if self.task_scheduling not in valid_task_scheduling:
+            errors.append(
+                "Invalid task scheduling: {}.  Valid options are: {}".format(
+                    self.task_scheduling, valid_task_scheduling
+                )
+            )
+
         if int(self.ip_head is not None) + int(self.redis_password is not None) == 1:
             errors.append(
                 "If either ip_head or redis_password are specified, both must be"
@@ -128,6 +128,12 @@ class OutputConfig(BaseConfigSection):
         self._mcmc_samples_file_type = str
         self.mcmc_samples_file = None
 
+        self._completion_mask_file_type = str
+        self.completion_mask_file = None
+        """str: Sidecar mask of the pixels whose results are written, used to
+        resume an interrupted run. Defaults to the first output file with a
+        '_complete' suffix."""
+
         self.set_config_options(sub_configdic)
 
     def _check_config_validity(self) -> List[str]:
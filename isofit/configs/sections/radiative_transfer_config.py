@@ -112,6 +112,21 @@ class RadiativeTransferEngineConfig(BaseConfigSection):
         self.lut_complevel = None
         """int: The compression level to use for the chosen method"""
 
+        self._lut_refinement_tolerance_type = float
+        self.lut_refinement_tolerance = None
+        """float: Enables adaptive LUT grid refinement. The lut_grid is simulated as a coarse starting grid,
+        and grid intervals whose relative linear interpolation error (estimated by leave-one-out checks)
+        exceeds this tolerance are refined with midpoints. Only the new points are simulated."""
+
+        self._lut_refinement_iterations_type = int
+        self.lut_refinement_iterations = 3
+        """int: Maximum number of refinement passes when lut_refinement_tolerance is set."""
+
+        self._lut_refinement_max_points_type = int
+        self.lut_refinement_max_points = None
+        """int: Maximum total number of LUT grid points for adaptive refinement. Intervals with the
+        highest errors are refined first."""
+
         # MODTRAN parameters
         self._aerosol_template_file_type = str
         self.aerosol_template_file = None
@@ -198,6 +213,17 @@ class RadiativeTransferEngineConfig(BaseConfigSection):
         self.emulator_batch_size = 4096
         """int: Batch size for sRTMnet predictions. Set smaller to reduce memory usage, larger for faster emulation."""
 
+        # Direct emulation
+        self._direct_emulation_type = bool
+        self.direct_emulation = False
+        """bool: Evaluate the emulator directly during the retrieval instead of building and interpolating
+        a LUT. The lut_grid then only defines the input dimensions, so its size no longer bounds the number
+        of dimensions. Only supported by emulator engines that can be evaluated per point ('KernelFlowsGP')."""
+
+        self._emulator_cache_size_type = int
+        self.emulator_cache_size = 64
+        """int: Number of emulator evaluations memoized per engine when direct_emulation is enabled."""
+
         self.set_config_options(sub_configdic)
 
         if self.lut_names is not None:
@@ -231,6 +257,24 @@ class RadiativeTransferEngineConfig(BaseConfigSection):
                 "radiative_transfer->emulator_batch_size must be a positive integer."
             )
 
+        if self.direct_emulation:
+            if self.engine_name in Engines and not (
+                Engines[self.engine_name]._supports_direct_emulation
+            ):
+                errors.append(
+                    f"radiative_transfer->direct_emulation is not supported by the {self.engine_name} engine"
+                )
+
+            if self.wavelength_range is not None:
+                errors.append(
+                    "radiative_transfer->wavelength_range is not supported with direct_emulation"
+                )
+
+            if not (self.emulator_cache_size > 0):
+                errors.append(
+                    "radiative_transfer->emulator_cache_size must be a positive integer."
+                )
+
         # Only check for missing files when a prebuilt LUT is not provided
         if not os.path.exists(self.lut_path):
             # Check that all input files exist
@@ -296,6 +340,21 @@ class RadiativeTransferEngineConfig(BaseConfigSection):
                         f"Radiative transfer engine file not found on system: {file}"
                     )
 
+        if self.lut_refinement_tolerance is not None:
+            if not (self.lut_refinement_tolerance > 0):
+                errors.append(
+                    "radiative_transfer->lut_refinement_tolerance must be a positive number."
+                )
+            if self.lut_refinement_iterations < 1:
+                errors.append(
+                    "radiative_transfer->lut_refinement_iterations must be a positive integer."
+                )
+            if self.engine_name == "sRTMnet":
+                errors.append(
+                    "radiative_transfer->lut_refinement_tolerance is not supported by sRTMnet, "
+                    "which simulates the full grid in preSim"
+                )
+
         if isinstance(self.lut_complevel, int) and self.lut_complevel < 1:
             errors.append("The LUT complevel must be and int greater than 0")
 
@@ -18,6 +18,7 @@
 # Author: David R Thompson, david.r.thompson@jpl.nasa.gov
 #
 
+import itertools
 import json
 import os
 from collections import OrderedDict
@@ -186,6 +187,75 @@ class VectorInterpolator:
 
         return cube
 
+    def multilinear_batch(self, points, gradient=False):
+        """
+        Vectorized multilinear interpolation of several points at once,
+        optionally with the gradient of the interpolant. Points beyond the grid
+        are clamped to its edges like _multilinear_grid, where the gradient
+        is zero. On a gridpoint, the gradient is that of the cell above it.
+        Does not use the module lookup Cache. Supports style 'mlg'
+
+        Args:
+            points: (N, n_dims) points to interpolate
+            gradient: also return the derivatives with respect to each dimension
+
+        Returns:
+            np.ndarray: (N, n) interpolated values
+            np.ndarray: (N, n_dims, n) derivatives, if gradient
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        N, n_dims = points.shape
+
+        if self.method == -1:
+            values = np.full((N, 1), self.value)
+            if gradient:
+                return values, np.zeros((N, n_dims, 1))
+            return values
+
+        if self.method != 2:
+            raise AttributeError(
+                "multilinear_batch only supports the 'mlg' interpolator version"
+            )
+
+        # Lower gridpoint of the cell and position within it, per dimension
+        lower = np.zeros((N, n_dims), dtype=int)
+        delta = np.zeros((N, n_dims))
+        dgrid = np.zeros((N, n_dims))
+        for i, grid in enumerate(self.gridtuples):
+            if len(grid) < 2:
+                continue
+            j = np.clip(
+                np.searchsorted(grid, points[:, i], side="right") - 1, 0, len(grid) - 2
+            )
+            width = self.binwidth[i][j]
+            lower[:, i] = j
+            delta[:, i] = np.clip((points[:, i] - grid[j]) / width, 0, 1)
+            inside = (points[:, i] >= grid[0]) & (points[:, i] < grid[-1])
+            dgrid[:, i] = inside / width
+
+        single = self.maxbaseinds == 0
+        values = 0
+        grads = np.zeros((N, n_dims, self.n)) if gradient else None
+        for corner in itertools.product((0, 1), repeat=n_dims):
+            corner = np.array(corner)
+            if np.any(corner[single]):
+                continue
+
+            factors = np.where(corner, delta, 1 - delta)
+            cube = self.gridarrays[tuple((lower + corner).T)]
+            values = values + np.prod(factors, axis=1)[:, np.newaxis] * cube
+
+            if gradient:
+                sign = np.where(corner, 1.0, -1.0)
+                for i in range(n_dims):
+                    others = np.prod(np.delete(factors, i, axis=1), axis=1)
+                    weight = sign[i] * others * dgrid[:, i]
+                    grads[:, i] += weight[:, np.newaxis] * cube
+
+        if gradient:
+            return values, grads
+        return values
+
     def __call__(self, *args, **kwargs):
         """
         Passes args to the appropriate interpolation method defined by the version at
@@ -611,6 +681,55 @@ def resample_spectrum(
             return np.dot(H, x).ravel()
 
 
+def fill_spectral_gaps(wl: np.array, spectra: np.array) -> np.array:
+    """Fill the NaN gaps of a set of spectra by linear interpolation over
+       wavelength, extending the first and last segments past the ends, as
+       scipy.interpolate.interp1d(kind="linear", fill_value="extrapolate")
+       does for each spectrum. Spectra with fewer than two valid values are
+       returned unchanged.
+
+    Args:
+        wl: ascending wavelengths
+        spectra: (n, wavelengths) array of spectra
+
+    Returns:
+        np.array: copy of the spectra with the gaps filled
+
+    """
+    spectra = np.array(spectra, dtype=float)
+    gaps = np.isnan(spectra)
+    fill = np.flatnonzero(gaps.any(axis=1) & ((~gaps).sum(axis=1) >= 2))
+    if not len(fill):
+        return spectra
+
+    x, gaps = spectra[fill], gaps[fill]
+    n, n_wl = x.shape
+    band = np.arange(n_wl)
+
+    # Nearest valid band at or below and at or above each band
+    below = np.maximum.accumulate(np.where(gaps, -1, band), axis=1)
+    above = np.minimum.accumulate(np.where(gaps, n_wl, band)[:, ::-1], axis=1)
+    above = above[:, ::-1]
+
+    # Past the ends, the two valid bands nearest the end
+    first, last = above[:, :1], below[:, -1:]
+    second = np.take_along_axis(above, np.minimum(first + 1, n_wl - 1), axis=1)
+    penultimate = np.take_along_axis(below, np.maximum(last - 1, 0), axis=1)
+
+    lo = np.where(below < 0, first, np.where(above >= n_wl, penultimate, below))
+    hi = np.where(below < 0, second, np.where(above >= n_wl, last, above))
+
+    # Valid bands are their own neighbours and are not filled
+    span = np.where(lo == hi, 1, wl[hi] - wl[lo])
+    y_lo, y_hi = np.take_along_axis(x, lo, axis=1), np.take_along_axis(x, hi, axis=1)
+    filled = y_lo + (wl[band] - wl[lo]) / span * (y_hi - y_lo)
+
+    x[gaps] = filled[gaps]
+    spectra[fill] = x
+
+    return spectra
+
+
 def load_spectrum(spectrum_file: str) -> (np.array, np.array):
     """Load a single spectrum from a text file with initial columns giving
        wavelength and magnitude, respectively.
@@ -0,0 +1,148 @@
+#! /usr/bin/env python3
+#
+#  Copyright 2018 California Institute of Technology
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+# ISOFIT: Imaging Spectrometer Optimal FITting
+#
+from __future__ import annotations
+
+from collections import OrderedDict
+
+import numpy as np
+
+from isofit.core.common import svd_inv_sqrt
+
+
+class Covariance:
+    """A covariance matrix C = B + U U^T, kept as its base B and low-rank
+    factor U rather than as a dense matrix. The base is either a diagonal,
+    given as a vector, or a dense matrix. With a diagonal base, inverses and
+    solves use the Woodbury identity at O(n k^2) instead of the O(n^3) of a
+    dense decomposition, k being the number of columns of U.
+
+    Args:
+        base: vector of variances, or a dense (n, n) covariance matrix
+        U: (n, k) low-rank factor, optional
+    """
+
+    def __init__(self, base: np.array, U: np.array = None):
+        self.base = np.asarray(base, dtype=float)
+        self.n = self.base.shape[0]
+
+        if U is None:
+            U = np.zeros((self.n, 0))
+        self.U = np.asarray(U, dtype=float).reshape(self.n, -1)
+
+    @property
+    def diagonal_base(self) -> bool:
+        return self.base.ndim == 1
+
+    def __add__(self, other: Covariance | np.array) -> Covariance:
+        """Sum of covariances. Dense arrays are added to the base."""
+        if not isinstance(other, Covariance):
+            other = Covariance(other)
+
+        if self.diagonal_base and other.diagonal_base:
+            base = self.base + other.base
+        else:
+            base = self.full_base() + other.full_base()
+
+        return Covariance(base, np.hstack([self.U, other.U]))
+
+    __radd__ = __add__
+
+    def add_low_rank(self, U: np.array) -> Covariance:
+        """Add U U^T. Columns of U with a single nonzero entry are diagonal
+        contributions and are folded into a diagonal base."""
+        U = np.asarray(U, dtype=float).reshape(self.n, -1)
+        base = self.base
+
+        if self.diagonal_base:
+            single = np.count_nonzero(U, axis=0) <= 1
+            base = base + np.sum(U[:, single] ** 2, axis=1)
+            U = U[:, ~single]
+
+        return Covariance(base, np.hstack([self.U, U]))
+
+    def window(self, idx: np.array) -> Covariance:
+        """Covariance of the subset idx of the variables."""
+        if self.diagonal_base:
+            base = self.base[idx]
+        else:
+            base = self.base[np.ix_(idx, idx)]
+
+        return Covariance(base, self.U[idx])
+
+    def full_base(self) -> np.array:
+        if self.diagonal_base:
+            return np.diag(self.base)
+        return self.base
+
+    def full(self) -> np.array:
+        """Dense (n, n) matrix."""
+        return self.full_base() + self.U @ self.U.T
+
+    def _woodbury(self):
+        """Thin SVD of D^-1/2 U, such that C = D^1/2 (I + Q diag(s^2) Q^T) D^1/2.
+        Returns None if the base is not a positive diagonal."""
+        if not self.diagonal_base or np.any(self.base <= 0):
+            return None
+
+        d_inv_sqrt = 1 / np.sqrt(self.base)
+        Q, s, _ = np.linalg.svd(d_inv_sqrt[:, np.newaxis] * self.U, full_matrices=False)
+        return d_inv_sqrt, Q, s
+
+    def inv_sqrt(
+        self, hashtable: OrderedDict = None, max_hash_size: int = None
+    ) -> (np.array, np.array):
+        """Inverse and a square root S of the inverse, S S^T = C^-1. Unlike
+        svd_inv_sqrt, S is not symmetric when the low-rank part is not empty.
+        Covariances without a positive diagonal base fall back to svd_inv_sqrt,
+        using hashtable and max_hash_size."""
+        factors = self._woodbury()
+        if factors is None:
+            return svd_inv_sqrt(self.full(), hashtable, max_hash_size)
+
+        d_inv_sqrt, Q, s = factors
+        Qd = d_inv_sqrt[:, np.newaxis] * Q
+
+        # S = D^-1/2 (I + Q diag(s^2) Q^T)^-1/2, the latter factor being
+        # I + Q diag((1 + s^2)^-1/2 - 1) Q^T
+        Cinv_sqrt = (Qd * (1 / np.sqrt(1 + s**2) - 1)) @ Q.T
+        Cinv_sqrt[np.diag_indices(self.n)] += d_inv_sqrt
+
+        Cinv = (Qd * (1 / (1 + s**2) - 1)) @ Qd.T
+        Cinv[np.diag_indices(self.n)] += d_inv_sqrt**2
+
+        return Cinv, Cinv_sqrt
+
+    def inv(self, hashtable: OrderedDict = None, max_hash_size: int = None):
+        """Inverse of the covariance."""
+        return self.inv_sqrt(hashtable, max_hash_size)[0]
+
+    def solve(self, B: np.array) -> np.array:
+        """C^-1 B, for a vector or matrix B."""
+        factors = self._woodbury()
+        if factors is None:
+            return np.linalg.solve(self.full(), B)
+
+        d_inv_sqrt, Q, s = factors
+        B = np.asarray(B, dtype=float)
+        scale = d_inv_sqrt.reshape((-1,) + (1,) * (B.ndim - 1))
+
+        # C^-1 = D^-1/2 (I + Q diag(1 / (1 + s^2) - 1) Q^T) D^-1/2
+        X = scale * B
+        w = (1 / (1 + s**2) - 1).reshape((-1,) + (1,) * (B.ndim - 1))
+        return scale * (X + Q @ (w * (Q.T @ X)))
@@ -19,14 +19,19 @@
 #
 from __future__ import annotations
 
+import atexit
 import logging
 import os
+import queue
+import threading
+import time
 from collections import OrderedDict
 from typing import List
 
 import numpy as np
 import scipy.io
 import xarray as xr
+import zarr
 from spectral.io import envi
 
 import isofit
@@ -34,6 +39,7 @@ from isofit.core import units
 from isofit.core.common import (
     envi_header,
     eps,
+    fill_spectral_gaps,
     load_spectrum,
     load_wavelen,
     resample_spectrum,
@@ -63,8 +69,248 @@ typemap = {
 
 max_frames_size = 100
 
+# Default number of flushed batches an output file may hold in its write queue
+writer_queue_size = 4
+
+# Default memory budget, in MB, for rows of input files read ahead of use
+prefetch_budget = 64
+
+# Pixels whose measurement misses more than this fraction of the channels are
+# skipped, the gaps of the others are filled
+max_gap_fraction = 0.25
+
+# Number of pixels screened at once
+screen_block_size = 4096
+
+# Lines per chunk of zarr outputs. Tiles are blocks of whole lines, so chunks
+# of single lines never straddle two tiles
+zarr_chunk_lines = 1
+
 
 ### Classes ###
+class BackgroundWriter:
+    """Writes the flushed rows of an output file to its memory map from a
+    background thread, so that callers only block when the bounded queue is
+    full. Each batch is a dictionary of row frames, NaN where a pixel was not
+    written. Contiguous rows of a batch are written as a single memmap slice.
+
+    Args:
+        memmap: writable (rows, cols, bands) memory map
+        max_queue: maximum number of batches waiting to be written
+        name: file name, for logging
+    """
+
+    def __init__(self, memmap, max_queue: int = writer_queue_size, name: str = ""):
+        self.memmap = memmap
+        self.name = name
+        self.queue = queue.Queue(maxsize=max(1, max_queue))
+        self.error = None
+        self.metrics = {
+            "max_depth": 0,
+            "batches": 0,
+            "rows": 0,
+            "slices": 0,
+            "blocked_time": 0.0,
+        }
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+        # Write out anything still queued when the process shuts down
+        atexit.register(self.close)
+
+    @property
+    def depth(self) -> int:
+        """Number of batches waiting to be written"""
+        return self.queue.qsize()
+
+    def put(self, frames: dict):
+        """Queue a batch of row frames, blocking only if the queue is full"""
+        self.check()
+
+        start = time.time()
+        self.queue.put(frames)
+        self.metrics["blocked_time"] += time.time() - start
+        self.metrics["max_depth"] = max(self.metrics["max_depth"], self.depth)
+
+    def _run(self):
+        while True:
+            frames = self.queue.get()
+            try:
+                if frames is None:
+                    return
+                self.write(frames)
+            except Exception as err:
+                Logger.exception(f"Background write to {self.name} failed")
+                self.error = err
+            finally:
+                self.queue.task_done()
+
+    def write(self, frames: dict):
+        """Write the valid pixels of a batch, one slice per run of rows"""
+        rows = np.array(sorted(frames), dtype=int)
+        for run in np.split(rows, np.where(np.diff(rows) != 1)[0] + 1):
+            block = np.stack([frames[row] for row in run])
+            valid = np.logical_not(np.isnan(block[:, :, :1]))
+            np.copyto(self.memmap[run[0] : run[-1] + 1], block, where=valid)
+            self.metrics["slices"] += 1
+
+        self.metrics["batches"] += 1
+        self.metrics["rows"] += len(rows)
+
+    def check(self):
+        """Raise the error of a failed background write, if any"""
+        if self.error is not None:
+            raise IOError(f"Background write to {self.name} failed") from self.error
+
+    def flush_target(self):
+        """Flush the written batches to disk"""
+        self.memmap.flush()
+
+    def join(self):
+        """Wait until all queued batches are written, and flush them to disk"""
+        self.queue.join()
+        self.flush_target()
+        self.check()
+
+    def close(self):
+        """Write the remaining batches and stop the thread"""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+            self.flush_target()
+        atexit.unregister(self.close)
+
+
+class ZarrWriter(BackgroundWriter):
+    """BackgroundWriter for a chunked, compressed zarr array. Runs of rows
+    written across all columns are stored as a single slice, other rows one
+    slice per run of written columns. zarr merges partial chunks with what
+    is stored, under the chunk locks of the array's synchronizer, so workers
+    writing different pixels of the same chunk do not overwrite each other.
+
+    Args:
+        array: writable (rows, cols, bands) zarr array
+        max_queue: maximum number of batches waiting to be written
+        name: file name, for logging
+    """
+
+    def write(self, frames: dict):
+        """Write the valid pixels of a batch"""
+        rows = np.array(sorted(frames), dtype=int)
+        valid = np.stack([~np.isnan(frames[row][:, 0]) for row in rows])
+        full = valid.all(axis=1)
+
+        breaks = np.where((np.diff(rows) != 1) | (full[1:] != full[:-1]))[0] + 1
+        for run in np.split(np.arange(len(rows)), breaks):
+            if full[run[0]]:
+                block = np.stack([frames[row] for row in rows[run]])
+                self.memmap[rows[run[0]] : rows[run[-1]] + 1] = block
+                self.metrics["slices"] += 1
+                continue
+
+            for i in run:
+                cols = np.flatnonzero(valid[i])
+                for span in np.split(cols, np.where(np.diff(cols) != 1)[0] + 1):
+                    if len(span):
+                        span = slice(span[0], span[-1] + 1)
+                        self.memmap[rows[i], span] = frames[rows[i]][span]
+                        self.metrics["slices"] += 1
+
+        self.metrics["batches"] += 1
+        self.metrics["rows"] += len(rows)
+
+    def flush_target(self):
+        """Chunks are stored as they are written"""
+        pass
+
+
+class RowPrefetcher:
+    """Reads the upcoming rows of a set of input files from a background
+    thread, ahead of their use, keeping at most a memory budget of rows that
+    have been read but not used yet. Rows are used through take, which falls
+    back to None for rows that have not been read in time.
+
+    Args:
+        files: input SpectrumFiles to read from
+        rows: rows in the order they will be used
+        budget: maximum size in bytes of the rows read ahead
+    """
+
+    def __init__(self, files: list, rows: list, budget: float):
+        self.files = files
+        self.slots = {id(fi): i for i, fi in enumerate(files)}
+        self.rows = list(dict.fromkeys(int(row) for row in rows))
+        self.position = {row: i for i, row in enumerate(self.rows)}
+
+        row_bytes = sum(fi.n_cols * fi.n_bands * fi.memmap.itemsize for fi in files)
+        self.max_rows = max(1, int(budget // max(row_bytes, 1)))
+
+        # row: [frames per file, number of files yet to take it]
+        self.ready = {}
+        self.consumed = -1
+        self.stopped = False
+        self.metrics = {"hits": 0, "misses": 0}
+        self.condition = threading.Condition()
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        for pos, row in enumerate(self.rows):
+            with self.condition:
+                while not self.stopped and len(self.ready) >= self.max_rows:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                if pos <= self.consumed:
+                    continue
+
+            try:
+                frames = [np.array(fi.memmap[row, :, :]) for fi in self.files]
+            except Exception:
+                Logger.exception(f"Prefetching row {row} failed")
+                return
+
+            with self.condition:
+                if pos > self.consumed:
+                    self.ready[row] = [frames, len(frames)]
+
+    def take(self, fi: SpectrumFile, row: int):
+        """Frame of row in file fi if it has been read ahead, else None"""
+        with self.condition:
+            pos = self.position.get(row)
+            if pos is not None and pos > self.consumed:
+                self.consumed = pos
+
+                # Rows that were passed over will not be used
+                for stale in [r for r in self.ready if self.position[r] < pos]:
+                    del self.ready[stale]
+                self.condition.notify()
+
+            entry = self.ready.get(row)
+            if entry is None or entry[0][self.slots[id(fi)]] is None:
+                self.metrics["misses"] += 1
+                return None
+
+            frames, remaining = entry
+            frame, frames[self.slots[id(fi)]] = frames[self.slots[id(fi)]], None
+            entry[1] = remaining - 1
+            if entry[1] == 0:
+                del self.ready[row]
+                self.condition.notify()
+
+            self.metrics["hits"] += 1
+            return frame
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.ready = {}
+            self.condition.notify()
+        self.thread.join()
+
+
 class SpectrumFile:
     """A buffered file object that contains configuration information about formatting, etc."""
 
@@ -87,11 +333,16 @@ class SpectrumFile:
         map_info="{}",
         engine_name=None,
         isofit_version=None,
+        max_writer_queue=writer_queue_size,
     ):
         """."""
 
         self.frames = OrderedDict()
         self.write = write
+        self.dirty = set()
+        self.writer = None
+        self.max_writer_queue = max_writer_queue
+        self.prefetcher = None
         self.fname = os.path.abspath(fname)
         self.wl = wavelengths
         self.band_names = band_names
@@ -198,6 +449,56 @@ class SpectrumFile:
 
                 # Initialize the file
                 self.dataset.to_netcdf(self.fname)
+        elif self.fname.endswith(".zarr"):
+            # The .zarr suffix implies a chunked, compressed zarr array of
+            # (rows, cols, bands), with the metadata in its attributes.  It
+            # is buffered in self.frames like an ENVI file, with the array
+            # taking the place of the memory map.
+            logging.debug(f"Inferred ZARR file format for {self.fname}")
+            self.format = "ZARR"
+
+            if not self.write:
+                self.memmap = zarr.open_array(self.fname, mode="r")
+                self.n_rows, self.n_cols, self.n_bands = self.memmap.shape
+
+            else:
+                if not os.path.exists(self.fname):
+                    meta = {
+                        "description": (
+                            f"L2A per-pixel surface retrieval (engine={engine_name}, isofit_version={isofit_version})"
+                        ),
+                        "interleave": "bip",
+                        "map info": map_info,
+                        "wavelength units": "Nanometers",
+                        "z plot range": zrange,
+                        "z plot titles": ztitles,
+                        "fwhm": None if fwhm is None else np.asarray(fwhm).tolist(),
+                        "bbl": bad_bands,
+                        "band names": band_names,
+                        "wavelength": (
+                            None if self.wl is None else np.asarray(self.wl).tolist()
+                        ),
+                        "data ignore value": self.flag,
+                    }
+                    array = zarr.open_array(
+                        self.fname,
+                        mode="w",
+                        shape=(n_rows, n_cols, n_bands),
+                        chunks=(zarr_chunk_lines, n_cols, n_bands),
+                        dtype=dtype,
+                        fill_value=0,
+                    )
+                    array.attrs.update(meta)
+
+                self.memmap = zarr.open_array(
+                    self.fname,
+                    mode="r+",
+                    synchronizer=zarr.ProcessSynchronizer(self.fname + ".sync"),
+                )
+
+            self.meta = self.memmap.attrs.asdict()
+            self.flag = float(self.meta.get("data ignore value", -9999.0))
+
         else:
             # Otherwise we assume it is an ENVI-format file, which is
             # basically just a binary data cube with a detached human-
@@ -286,8 +587,12 @@ class SpectrumFile:
 
         if row not in self.frames:
             if not self.write:
-                d = self.memmap[row, :, :]
-                self.frames[row] = d.copy()
+                d = None
+                if self.prefetcher is not None:
+                    d = self.prefetcher.take(self, row)
+                if d is None:
+                    d = self.memmap[row, :, :].copy()
+                self.frames[row] = d
             else:
                 self.frames[row] = np.nan * np.zeros((self.n_cols, self.n_bands))
         return self.frames[row]
@@ -314,6 +619,7 @@ class SpectrumFile:
             if x.ndim == 2:
                 x = x[:, -1]
             frame[col, :] = x
+            self.dirty.add(row)
 
     def read_spectrum(self, row, col):
         """Get a spectrum from the frame list or ASCII file. Note that if
@@ -328,22 +634,131 @@ class SpectrumFile:
             frame = self.get_frame(row)
             return frame[col]
 
-    def flush_buffers(self):
-        """Write to file, and refresh the memory map object."""
+    def read_spectra(self, indices: np.array) -> np.array:
+        """Get the spectra of an (n, 2) array of rows and columns at once, as
+        an (n, bands) array."""
 
-        if self.format == "ENVI":
-            if self.write:
-                for row, frame in self.frames.items():
-                    valid = np.logical_not(np.isnan(frame[:, 0]))
-                    self.memmap[row, valid, :] = frame[valid, :]
+        if self.format == "ASCII":
+            return np.broadcast_to(self.data, (len(indices),) + np.shape(self.data))
+        elif self.format == "ENVI" and not self.write:
+            return np.asarray(self.memmap[indices[:, 0], indices[:, 1], :])
+        else:
+            return np.array([self.read_spectrum(row, col) for row, col in indices])
+
+    def flush_buffers(self):
+        """Hand the rows written since the last flush to the background
+        writer, and drop the buffered frames. The memory map stays open, so
+        the cost is proportional to the number of dirty rows."""
+
+        if self.format in ("ENVI", "ZARR"):
+            if self.write and self.dirty:
+                if self.writer is None:
+                    writer = ZarrWriter if self.format == "ZARR" else BackgroundWriter
+                    self.writer = writer(self.memmap, self.max_writer_queue, self.fname)
+                self.writer.put({row: self.frames[row] for row in self.dirty})
             self.frames = OrderedDict()
-            del self.file
-            self.file = envi.open(envi_header(self.fname), self.fname)
-            self.open_map_with_retries()
+            self.dirty = set()
 
         elif self.format == "NETCDF":
             self.dataset.to_netcdf(self.fname)
 
+    def flush(self):
+        """Wait for the queued output rows and flush the writable memory map
+        to disk. Read-only maps are left alone."""
+
+        if self.format in ("ENVI", "ZARR") and self.write and self.writer is not None:
+            self.writer.join()
+
+    def sync(self):
+        """Flush the buffers and wait until all output rows are on disk."""
+
+        self.flush_buffers()
+        self.flush()
+
+    def close(self):
+        """Write out all output rows and stop the background writer."""
+
+        self.flush_buffers()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer.check()
+            self.writer = None
+
+    def writer_metrics(self) -> dict:
+        """Queue depth and throughput of the background writer"""
+
+        if self.writer is None:
+            return {}
+        return {"depth": self.writer.depth, **self.writer.metrics}
+
+
+class CompletionMask:
+    """Sidecar mask of the pixels whose results are on disk, one byte per
+    pixel. The driver marks the pixels of each task when the task returns,
+    which is after its outputs are synced, so that an interrupted run can
+    resume by skipping the marked pixels.
+
+    Args:
+        fname: mask file
+        n_rows: number of rows of the image, to create the mask. Without
+            it, an existing mask is opened read-only
+        n_cols: number of columns of the image
+        resume: keep an existing mask of the same size rather than starting
+            with an empty one
+    """
+
+    def __init__(
+        self,
+        fname: str,
+        n_rows: int = None,
+        n_cols: int = None,
+        resume: bool = False,
+    ):
+        self.fname = fname
+        self.write = n_rows is not None
+        self.resumed = False
+
+        if self.write:
+            if resume and self.shape() == (n_rows, n_cols):
+                self.resumed = True
+            else:
+                meta = {
+                    "lines": n_rows,
+                    "samples": n_cols,
+                    "bands": 1,
+                    "interleave": "bip",
+                    "data type": typemap[np.uint8],
+                    "band names": "{Complete}",
+                }
+                envi.create_image(envi_header(fname), meta, ext="", force=True)
+
+        file = envi.open(envi_header(fname))
+        self.memmap = file.open_memmap(interleave="bip", writable=self.write)[..., 0]
+        if self.write and not self.resumed:
+            self.memmap[:] = 0
+            self.memmap.flush()
+
+    def shape(self) -> tuple:
+        """(rows, cols) of an existing mask, None if there is none"""
+        if not (os.path.isfile(envi_header(self.fname)) and os.path.isfile(self.fname)):
+            return None
+        meta = envi.open(envi_header(self.fname)).metadata
+        return int(meta["lines"]), int(meta["samples"])
+
+    def done(self, indices: np.array) -> np.array:
+        """Whether each of an (n, 2) array of rows and columns is complete"""
+        return self.memmap[indices[:, 0], indices[:, 1]] > 0
+
+    def mark(self, indices: np.array):
+        """Mark an (n, 2) array of rows and columns as complete"""
+        if len(indices):
+            self.memmap[indices[:, 0], indices[:, 1]] = 1
+            self.memmap.flush()
+
+    def count(self) -> int:
+        """Number of complete pixels"""
+        return int(np.count_nonzero(self.memmap))
+
 
 class InputData:
     def __init__(self):
@@ -387,6 +802,9 @@ class IO:
         self.n_sv = len(self.full_statevec)
         self.n_chan = len(self.meas_wl)
         self.flush_rate = config.implementation.io_buffer_size
+        self.writer_queue_size = config.implementation.io_writer_queue_size
+        self.prefetch_budget = config.implementation.io_prefetch_budget
+        self.prefetcher = None
 
         self.simulation_mode = config.implementation.mode == "simulation"
 
@@ -394,6 +812,9 @@ class IO:
 
         self.current_input_data = InputData()
 
+        # Measurements with spectral gaps filled by screen_pixels
+        self.filled_meas = {}
+
         # Names of either the wavelength or statevector outputs
         wl_names = [("Channel %i" % i) for i in range(self.n_chan)]
         sv_names = self.full_statevec.copy()
@@ -450,6 +871,7 @@ class IO:
                 ztitles=ztitle,
                 engine_name=self.engine_name,
                 isofit_version=config.implementation.isofit_version,
+                max_writer_queue=self.writer_queue_size,
             )
 
         # Do we apply a radiance correction?
@@ -460,13 +882,79 @@ class IO:
         # Load the earth sun distance data
         self.esd = self.load_esd()
 
-    def get_components_at_index(self, row: int, col: int) -> InputData:
+    def screen_pixels(self, indices: np.array) -> np.array:
+        """
+        Vectorized pre-pass over a set of pixels before their inversions.
+        Drops the pixels get_components_at_index would reject, those without
+        a measurement or with an input entirely at its nodata flag, and those
+        missing more than max_gap_fraction of the measurement. The spectral
+        gaps of the remaining measurements are filled, and
+        get_components_at_index returns the filled measurement.
+
+        The inputs of the valid pixels are read again by the inversions. The
+        blocks are not kept, so that memory stays bounded by screen_block_size
+        rather than by the size of the set.
+
+        Args:
+            indices: (n, 2) array of the rows and columns of the pixels
+
+        Returns:
+            np.array: rows and columns of the valid pixels
+        """
+        self.filled_meas = {}
+        source = (
+            "reflectance_file" if self.simulation_mode else "measured_radiance_file"
+        )
+        if source not in self.input_datasets:
+            return indices[:0]
+
+        valid = np.ones(len(indices), dtype=bool)
+        for start in range(0, len(indices), screen_block_size):
+            block = indices[start : start + screen_block_size]
+            keep = valid[start : start + screen_block_size]
+
+            for fi in self.input_datasets.values():
+                data = fi.read_spectra(block).reshape(len(block), -1)
+                keep &= ~np.all(np.isclose(data, fi.flag), axis=1)
+
+            meas = self.input_datasets[source].read_spectra(block).astype(float)
+            if (
+                not self.simulation_mode
+                and "radiometry_correction_file" in self.input_datasets
+            ):
+                correction = self.input_datasets["radiometry_correction_file"]
+                meas = meas * correction.read_spectra(block)
+            keep &= ~np.all(meas < -49, axis=1)
+
+            gaps = np.isnan(meas).sum(axis=1)
+            sparse = keep & (gaps > max_gap_fraction * meas.shape[1])
+            if sparse.any():
+                logging.warning(
+                    f"Input data gap >{max_gap_fraction:.0%} for {sparse.sum()}"
+                    " pixels. Skipping their inversions, their results will be"
+                    " all zeros."
+                )
+            keep &= ~sparse
+
+            fill = keep & (gaps > 0)
+            if fill.any():
+                filled = fill_spectral_gaps(self.meas_wl, meas[fill])
+                for (row, col), spectrum in zip(block[fill], filled):
+                    self.filled_meas[(row, col)] = spectrum
+
+        return indices[valid]
+
+    def get_components_at_index(
+        self, row: int, col: int, screened: bool = False
+    ) -> InputData:
         """
         Load data from input files at the specified (row, col) index.
 
         Args:
             row: row to retrieve data from
             col: column to retrieve data from
+            screened: the pixel passed screen_pixels, so the validity checks
+                are skipped and its measurement is the gap-filled one
 
         Returns:
             InputData: object containing all current data reads
@@ -500,18 +988,22 @@ class IO:
             if data["radiometry_correction_file"] is not None:
                 meas *= data["radiometry_correction_file"]
 
-        self.current_input_data.meas = meas
+        if screened:
+            meas = self.filled_meas.pop((row, col), meas)
 
-        if self.current_input_data.meas is None or np.all(
-            self.current_input_data.meas < -49
-        ):
-            return None
+        self.current_input_data.meas = meas
 
-        ## Check for any bad data flags
-        for source in self.input_datasets:
-            if np.allclose(data[source], self.input_datasets[source].flag):
+        if not screened:
+            if self.current_input_data.meas is None or np.all(
+                self.current_input_data.meas < -49
+            ):
                 return None
 
+            ## Check for any bad data flags
+            for source in self.input_datasets:
+                if np.allclose(data[source], self.input_datasets[source].flag):
+                    return None
+
         # Check if Sky view is used, else it is equal to 1.0.
         if "skyview_factor_file" not in data or data["skyview_factor_file"] is None:
             data["skyview_factor_file"] = 1.0
@@ -534,6 +1026,40 @@ class IO:
 
         return self.current_input_data
 
+    def prefetch(self, rows: np.array):
+        """Start reading the given rows of all ENVI input files ahead of use
+        in a background thread, within the io_prefetch_budget memory budget.
+
+        Args:
+            rows: rows in the order they will be read
+        """
+
+        self.stop_prefetch()
+
+        files = [
+            fi
+            for fi in self.input_datasets.values()
+            if fi.format == "ENVI" and not fi.write
+        ]
+        if not self.prefetch_budget or not files or not len(rows):
+            return
+
+        self.prefetcher = RowPrefetcher(files, rows, self.prefetch_budget * 1e6)
+        for fi in files:
+            fi.prefetcher = self.prefetcher
+
+    def stop_prefetch(self):
+        """Stop reading ahead and release the rows read ahead of use."""
+
+        if self.prefetcher is None:
+            return
+
+        self.prefetcher.stop()
+        logging.debug(f"IO: Prefetched rows {self.prefetcher.metrics}")
+        for fi in self.input_datasets.values():
+            fi.prefetcher = None
+        self.prefetcher = None
+
     def flush_buffers(self):
         """Write all buffered output data to disk, and erase read buffers."""
 
@@ -543,6 +1069,30 @@ class IO:
         self.reads = 0
         self.writes = 0
 
+    def sync(self):
+        """Write all buffered output data and wait until it is on disk."""
+
+        self.flush_buffers()
+        for fi in self.output_datasets.values():
+            fi.sync()
+        logging.debug(f"IO: Background writers {self.writer_metrics()}")
+
+    def close(self):
+        """Write all buffered output data and stop the background writers."""
+
+        self.flush_buffers()
+        for fi in self.output_datasets.values():
+            fi.close()
+
+    def writer_metrics(self) -> dict:
+        """Background writer queue depth and throughput per output file"""
+
+        return {
+            name: metrics
+            for name, fi in self.output_datasets.items()
+            if (metrics := fi.writer_metrics())
+        }
+
     def write_datasets(
         self, row: int, col: int, output: dict, states: List, flush_immediately=False
     ):
@@ -571,7 +1121,9 @@ class IO:
             scipy.io.savemat(self.config.output.mcmc_samples_file, mdict)
 
         self.writes += 1
-        if self.writes >= self.flush_rate or flush_immediately:
+        if flush_immediately:
+            self.sync()
+        elif self.writes >= self.flush_rate:
             self.flush_buffers()
 
     def build_output(
@@ -851,6 +1403,29 @@ class IO:
                 isofit_version=config.implementation.isofit_version,
             )
 
+    @staticmethod
+    def completion_mask_file(config):
+        """Completion mask file of the outputs of a config, None without
+        outputs"""
+        if config.output.completion_mask_file:
+            return config.output.completion_mask_file
+
+        elements, _, _ = config.output.get_output_files()
+        if not elements:
+            return None
+        return elements[0] + "_complete"
+
+    @staticmethod
+    def resumable_outputs(config):
+        """Whether all outputs of a config keep their contents when opened for
+        writing, as ENVI and ZARR files do, so that a run can resume. NETCDF
+        outputs are rewritten, and ASCII and MATLAB ones written whole"""
+        elements, _, _ = config.output.get_output_files()
+        return not any(
+            os.path.splitext(element)[1] in (".txt", ".mat", ".nc")
+            for element in elements
+        )
+
     @staticmethod
     def load_esd(file=None):
         """
@@ -20,6 +20,7 @@
 from __future__ import annotations
 
 import logging
+from collections import OrderedDict
 from copy import deepcopy
 
 import numpy as np
@@ -35,6 +36,9 @@ from isofit.surface import Surface
 
 Logger = logging.getLogger(__file__)
 
+# Max. number of prior covariance templates kept, one per surface component
+max_Sa_templates = 64
+
 
 class ForwardModel:
     """ForwardModel contains all the information about how to calculate
@@ -145,6 +149,9 @@ class ForwardModel:
             + len(self.RT_b_inds)
         )
 
+        # Prior covariance templates, see Sa_template
+        self.Sa_templates = OrderedDict()
+
         # Load model discrepancy correction
         if full_config.forward_model.model_discrepancy_file is not None:
             D = loadmat(full_config.forward_model.model_discrepancy_file)
@@ -190,30 +197,61 @@ class ForwardModel:
         Sa_surface, Sa_surf_inv_norm, Sa_surf_inv_sqrt_norm = self.surface.Sa(
             x_surface, geom
         )
-        Sa_RT = self.RT.Sa()
-        Sa_instrument = self.instrument.Sa()
-        Sa_state = block_diag(Sa_surface[:, :], Sa_RT[:, :], Sa_instrument[:, :])
+        Sa_state, Sa_inv_state, Sa_inv_sqrt_state = self.Sa_template(
+            Sa_surf_inv_norm, Sa_surf_inv_sqrt_norm
+        )
 
-        # per block variance scaling for normalization
+        # per block variance scaling for normalization. Only the surface block
+        # varies with the state, as a scaling of its normalized inverses
+        n = len(Sa_surface)
         scale_surf = np.sqrt(np.mean(np.diag(Sa_surface[:, :])))
-        scale_RT = np.sqrt(np.mean(np.diag(Sa_RT[:, :])))
-        scale_inst = np.sqrt(np.mean(np.diag(Sa_instrument[:, :])))
-
-        # Compute the Sa inv and Sa inv sqrt for measurement
-        Sa_inv_state = block_diag(
-            Sa_surf_inv_norm / scale_surf**2,
-            self.RT.Sa_inv_normalized / scale_RT**2,
-            self.instrument.Sa_inv_normalized / scale_inst**2,
-        )
 
-        Sa_inv_sqrt_state = block_diag(
-            Sa_surf_inv_sqrt_norm / scale_surf,
-            self.RT.Sa_inv_sqrt_normalized / scale_RT,
-            self.instrument.Sa_inv_sqrt_normalized / scale_inst,
-        )
+        Sa_state[:n, :n] = Sa_surface
+        Sa_inv_state[:n, :n] /= scale_surf**2
+        Sa_inv_sqrt_state[:n, :n] /= scale_surf
 
         return Sa_state, Sa_inv_state, Sa_inv_sqrt_state
 
+    def Sa_template(self, Sa_surf_inv_norm, Sa_surf_inv_sqrt_norm):
+        """Copies of the block diagonal Sa, Sa inv and Sa inv sqrt of the state
+        vector, holding the constant RT and instrument blocks and the unscaled
+        normalized surface inverses. The surface covariance block is left
+        empty. Templates are cached for each of the normalized surface inverses,
+        which surfaces keep per component.
+        """
+
+        key = id(Sa_surf_inv_norm)
+        template = self.Sa_templates.get(key)
+        if template is None or template[0] is not Sa_surf_inv_norm:
+            Sa_RT = self.RT.Sa()
+            Sa_instrument = self.instrument.Sa()
+            n = len(Sa_surf_inv_norm)
+
+            scale_RT = np.sqrt(np.mean(np.diag(Sa_RT[:, :])))
+            scale_inst = np.sqrt(np.mean(np.diag(Sa_instrument[:, :])))
+
+            template = (
+                Sa_surf_inv_norm,
+                block_diag(np.zeros((n, n)), Sa_RT[:, :], Sa_instrument[:, :]),
+                block_diag(
+                    Sa_surf_inv_norm,
+                    self.RT.Sa_inv_normalized / scale_RT**2,
+                    self.instrument.Sa_inv_normalized / scale_inst**2,
+                ),
+                block_diag(
+                    Sa_surf_inv_sqrt_norm,
+                    self.RT.Sa_inv_sqrt_normalized / scale_RT,
+                    self.instrument.Sa_inv_sqrt_normalized / scale_inst,
+                ),
+            )
+            self.Sa_templates[key] = template
+            while len(self.Sa_templates) > max_Sa_templates:
+                self.Sa_templates.popitem(last=False)
+        else:
+            self.Sa_templates.move_to_end(key)
+
+        return tuple(np.copy(t) for t in template[1:])
+
     def Sb(self, x, meas, geom):
         """Accumulate the uncertainty due to unmodeled variables within
         respective forward model portions."""
@@ -291,23 +329,29 @@ class ForwardModel:
 
         return self.surface.calc_lamb(x[self.idx_surface], geom)
 
-    def Seps(self, x, meas, geom):
+    def Seps(self, x, meas, geom, structured=False):
         """Calculate the total uncertainty of the observation, including
         up to three terms: (1) the instrument noise; (2) the uncertainty
         due to explicit unmodeled variables, i.e. the S_epsilon matrix of
         Rodgers et al.; and (3) an aggregate 'model discrepancy' term,
-        Gamma."""
+        Gamma.
 
-        if self.model_discrepancy is not None:
-            Gamma = self.model_discrepancy
-        else:
-            Gamma = 0
+        With structured, a Covariance is returned that keeps the unmodeled
+        variables term as the low-rank factor Kb Sb^1/2, as Sb is diagonal.
+        Otherwise, the dense matrix is returned."""
 
         Sb = self.Sb(x, meas, geom)
         Kb = self.Kb(x, geom)
-        Sy = self.instrument.Sy(meas, geom)
+        Sy = self.instrument.Sy(meas, geom, structured=True)
 
-        return Sy + Kb.dot(Sb).dot(Kb.T) + Gamma
+        Seps = Sy.add_low_rank(Kb * np.sqrt(np.diag(Sb)))
+        if self.model_discrepancy is not None:
+            Seps = Seps + self.model_discrepancy
+
+        if structured:
+            return Seps
+
+        return Seps.full()
 
     def K(self, x, geom):
         """Derivative of observation with respect to state vector. This is
@@ -384,6 +428,8 @@ class ForwardModel:
             L_dir_dif=L_dir_dif,
             L_dif_dir=L_dif_dir,
             L_dif_dif=L_dif_dif,
+            rho_dir_dir=rho_dir_dir_hi,
+            bg_rfl=geom.bg_rfl,
         )
 
         # To get derivatives w.r.t. instrument, downsample to instrument wavelengths
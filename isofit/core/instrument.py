@@ -20,14 +20,17 @@
 from __future__ import annotations
 
 import logging
+from collections import OrderedDict
 
 import numpy as np
 from scipy.interpolate import interp1d, splev, splrep
 from scipy.io import loadmat
+from scipy.ndimage import convolve1d
 from scipy.signal import convolve
 
 from isofit.core import units
 from isofit.core.common import (
+    calculate_resample_matrix,
     emissive_radiance,
     eps,
     load_wavelen,
@@ -35,12 +38,20 @@ from isofit.core.common import (
     spectral_response_function,
     svd_inv_sqrt,
 )
+from isofit.core.covariance import Covariance
 
 ### Variables ###
 
 # Max. wavelength difference (nm) that does not trigger expensive resampling
 wl_tol = 0.01
 
+# Max. number of resampling matrices cached for varying calibrations
+resample_cache_size = 32
+
+# Decimals (nm) the calibration is rounded to when looking up a cached
+# resampling matrix, fine enough to tell apart slightly perturbed calibrations
+resample_cache_decimals = 8
+
 
 ### Classes ###
 
@@ -60,6 +71,12 @@ class Instrument:
 
         self.fast_resample = config.fast_resample
 
+        # Resampling matrices keyed on the calibration, least recently used first
+        self.resample_cache = OrderedDict()
+
+        # Calibration spline bases, see spline_basis
+        self.spline_bases = {}
+
         self.bounds = config.statevector.get_all_bounds()
         self.scale = config.statevector.get_all_scales()
         self.init = config.statevector.get_all_inits()
@@ -100,12 +117,13 @@ class Instrument:
                 "rcc_wl",
             ]
             bad = [
-                1 if np.any(~np.isfinite(dn_uncertainty_mat[key])) else 0
+                key not in dn_uncertainty_mat
+                or np.any(~np.isfinite(dn_uncertainty_mat[key]))
                 for key in keys
             ]
             if np.sum(bad):
                 er = f"""
-                    Invalid value found in dn_uncertainty_mat keys: {[keys[i] for i in bad if i]}.
+                    Missing or invalid value found in dn_uncertainty_mat keys: {[key for key, b in zip(keys, bad) if b]}.
                     Check file at: {config.unknowns.dn_uncertainty_file}
                 """
                 logging.error(er)
@@ -194,6 +212,37 @@ class Instrument:
                 self.cal_stray_idx = len(self.bval) + 1
                 self.bval = np.hstack([self.bval, self.unknowns.stray_srf_uncertainty])
 
+        # Radiometric uncertainties add in quadrature, so we sum their squared
+        # values. The constant ones are loaded and summed once here, leaving
+        # the measurement-dependent terms to Sb.
+        self.bval_radiometric = np.zeros(self.n_chan)
+        if self.unknowns:
+            # Systematic radiometric uncertainties account for differences in
+            # sampling and radiative transfer that manifest predictably as a
+            # function of wavelength.
+            if self.unknowns.channelized_radiometric_uncertainty_file is not None:
+                f = self.unknowns.channelized_radiometric_uncertainty_file
+                u = np.loadtxt(f, comments="#")
+                if u.ndim > 1 and u.shape[1] > 1:
+                    u = u[:, 1]
+                u = u.ravel()
+
+                if len(u) != self.n_chan or np.any(~np.isfinite(u)):
+                    er = (
+                        f"Channelized radiometric uncertainty file {f} must provide"
+                        f" {self.n_chan} finite values, one per channel"
+                    )
+                    logging.error(er)
+                    raise ValueError(er)
+
+                self.bval_radiometric += pow(u, 2)
+
+            # Uncorrelated radiometric uncertainties are consistent and
+            # independent in all channels.
+            if self.unknowns.uncorrelated_radiometric_uncertainty:
+                u = self.unknowns.uncorrelated_radiometric_uncertainty
+                self.bval_radiometric += pow(np.ones(self.n_chan) * u, 2)
+
         # Determine whether the calibration is fixed.  If it is fixed,
         # and the wavelengths of radiative transfer modeling and instrument
         # are the same, then we can bypass computationally expensive sampling
@@ -221,38 +270,21 @@ class Instrument:
     def Sb(self, meas):
         """Uncertainty due to unmodeled variables."""
         bval = self.bval.copy()
-        # First we take care of radiometric uncertainties, which add
-        # in quadrature.  We sum their squared values.  Systematic
-        # radiometric uncertainties account for differences in sampling
-        # and radiative transfer that manifest predictably as a function
-        # of wavelength.
-        if self.unknowns:
-            if self.unknowns.channelized_radiometric_uncertainty_file is not None:
-                f = self.unknowns.channelized_radiometric_uncertainty_file
-                u = np.loadtxt(f, comments="#")
-                if len(u.shape) > 0 and u.shape[1] > 1:
-                    u = u[:, 1]
-                bval[: self.n_chan] = bval[: self.n_chan] + pow(u, 2)
-
-            # Uncorrelated radiometric uncertainties are consistent and
-            # independent in all channels.
-            if self.unknowns.uncorrelated_radiometric_uncertainty:
-                u = self.unknowns.uncorrelated_radiometric_uncertainty
-                bval[: self.n_chan] = bval[: self.n_chan] + pow(
-                    np.ones(self.n_chan) * u, 2
-                )
-
-            # Uncertainty due to imperfect knowledge of linearity correction
-            if self.dn_uncertainty_embedding == "Sb":
-                bval[: self.n_chan] += np.power(
-                    self.DN_additive_uncertainty(
-                        meas,
-                        self.dn_uncertainty_rcc,
-                        self.dn_uncertainty_interp,
-                        self.dn_uncertainty_inflation,
-                    ),
-                    2,
-                )
+        # The constant radiometric uncertainties are precomputed, see
+        # __init__. Only the measurement-dependent terms remain.
+        bval[: self.n_chan] = bval[: self.n_chan] + self.bval_radiometric
+
+        # Uncertainty due to imperfect knowledge of linearity correction
+        if self.dn_uncertainty_embedding == "Sb":
+            bval[: self.n_chan] += np.power(
+                self.DN_additive_uncertainty(
+                    meas,
+                    self.dn_uncertainty_rcc,
+                    self.dn_uncertainty_interp,
+                    self.dn_uncertainty_inflation,
+                ),
+                2,
+            )
 
         # Radiometric uncertainties combine via Root Sum Square...
         # Be careful to avoid square roots of zero!
@@ -262,14 +294,16 @@ class Instrument:
 
         return np.diagflat(np.power(bval, 2))
 
-    def Sy(self, meas, geom):
+    def Sy(self, meas, geom, structured=False):
         """Calculate measuremment error covariance.  Kelvin Man Yiu Leung and
             Jayanth Jagalur Mohan (MIT) developed the noise clipping strategy.
 
         Input: meas, the instrument measurement
+               structured, return a Covariance rather than a dense matrix
         Returns: Sy, the measurement error covariance due to instrument noise
         """
 
+        # Diagonal noise models are kept as a vector of variances
         Sy = None
         if self.model_type == "SNR":
             nedl = (1.0 / self.snr) * meas
@@ -281,7 +315,7 @@ class Instrument:
                     " to avoid /0."
                 )
             nedl[bad] = minimum_noise
-            Sy = np.diagflat(np.power(nedl, 2))
+            Sy = np.power(nedl, 2)
 
         elif self.model_type == "parametric":
             noise_plus_meas = self.noise[:, 1] + meas
@@ -295,52 +329,126 @@ class Instrument:
                 self.noise[:, 0] * np.sqrt(noise_plus_meas) + self.noise[:, 2]
             )
             nedl = nedl / np.sqrt(self.integrations)
-            Sy = np.diagflat(np.power(nedl, 2))
+            Sy = np.power(nedl, 2)
 
         elif self.model_type == "pushbroom":
             C = np.squeeze(self.covs.mean(axis=0))
             Sy = C / np.sqrt(self.integrations)
 
         elif self.model_type == "NEDT":
-            Sy = np.diagflat(np.power(self.noise_NESR, 2))
+            Sy = np.power(self.noise_NESR, 2)
 
         if self.dn_uncertainty_embedding:
             # Uncertainty due to imperfect knowledge of linearity correction
-            np.fill_diagonal(
-                Sy,
-                (
-                    Sy.diagonal()
-                    + self.DN_additive_uncertainty(
-                        meas,
-                        self.dn_uncertainty_rcc,
-                        self.dn_uncertainty_interp,
-                        self.dn_uncertainty_inflation,
-                    )
-                ),
+            dn_uncertainty = self.DN_additive_uncertainty(
+                meas,
+                self.dn_uncertainty_rcc,
+                self.dn_uncertainty_interp,
+                self.dn_uncertainty_inflation,
             )
+            if Sy.ndim == 1:
+                Sy = Sy + dn_uncertainty
+            else:
+                Sy = Sy.copy()
+                np.fill_diagonal(Sy, Sy.diagonal() + dn_uncertainty)
+
+        if structured:
+            return Covariance(Sy)
+
+        if Sy.ndim == 1:
+            Sy = np.diagflat(Sy)
 
         return Sy
 
     def dmeas_dinstrument(self, x_instrument, wl_hi, rdn_hi):
         """Jacobian of measurement with respect to the instrument
-        free parameter state vector. We use finite differences for now."""
+        free parameter state vector. The Gaussian SRF resampling is
+        differentiated analytically with respect to the channel centers and
+        widths, which are linear in the calibration parameters."""
 
         dmeas_dinstrument = np.zeros((self.n_chan, self.n_state), dtype=float)
         if self.n_state == 0:
             return dmeas_dinstrument
 
-        meas = self.sample(x_instrument, wl_hi, rdn_hi) + self.eof_offset(x_instrument)
-        for ind in range(self.n_state):
-            x_instrument_perturb = x_instrument.copy()
-            x_instrument_perturb[ind] = x_instrument_perturb[ind] + eps
-            meas_perturb = self.sample(
-                x_instrument_perturb, wl_hi, rdn_hi
-            ) + self.eof_offset(x_instrument_perturb)
+        # Empirical orthogonal functions are additive
+        for i in self.eof_idx:
+            dmeas_dinstrument[:, i] += self.eof[:, i]
 
-            dmeas_dinstrument[:, ind] = (meas_perturb - meas) / eps
+        if not self.resamples(wl_hi) or len(rdn_hi) <= 1:
+            return dmeas_dinstrument
+
+        if rdn_hi.ndim != 1:
+            raise ValueError(
+                "The instrument Jacobian takes a single radiance spectrum, got an"
+                f" array of shape {rdn_hi.shape}"
+            )
+
+        wl, fwhm = self.calibration(x_instrument)
+        dwl, dfwhm = self.dcalibration_dinstrument(x_instrument)
+        H = self.resample_matrix(wl_hi, wl, fwhm)
+        sigma = fwhm / 2.355
+
+        # Each row of H is a normalized Gaussian h, so for d log(h_j) = a_j,
+        # d(h . rdn) = h . (a * rdn) - (h . a) (h . rdn)
+        offset = wl_hi[np.newaxis, :] - wl[:, np.newaxis]
+        meas = H @ rdn_hi
+        da_dwl = offset / sigma[:, np.newaxis] ** 2
+        da_dsigma = offset**2 / sigma[:, np.newaxis] ** 3
+        dmeas_dwl = (H * da_dwl) @ rdn_hi - np.sum(H * da_dwl, axis=1) * meas
+        dmeas_dsigma = (H * da_dsigma) @ rdn_hi - np.sum(H * da_dsigma, axis=1) * meas
+
+        dmeas_dinstrument += dmeas_dwl[:, np.newaxis] * dwl
+        dmeas_dinstrument += dmeas_dsigma[:, np.newaxis] * dfwhm / 2.355
 
         return dmeas_dinstrument
 
+    def dcalibration_dinstrument(self, x_instrument):
+        """Derivatives of the measured wavelengths and FWHM, see calibration,
+        with respect to the instrument state vector. Both are linear in it."""
+
+        dwl = np.zeros((self.n_chan, self.n_state))
+        dfwhm = np.zeros((self.n_chan, self.n_state))
+
+        if "GROW_FWHM" in self.statevec_names:
+            dfwhm[:, self.statevec_names.index("GROW_FWHM")] = 1.0
+        elif any([v.startswith("FWHMSPL") for v in self.statevec_names]):
+            idx, basis = self.spline_basis("FWHMSPL")
+            dfwhm[:, idx] = basis
+
+        if "WL_SPACE" in self.statevec_names:
+            dwl[:, self.statevec_names.index("WL_SPACE")] = (
+                self.wl_init - self.wl_init[0]
+            )
+
+        if "WL_SHIFT" in self.statevec_names:
+            dwl[:, self.statevec_names.index("WL_SHIFT")] = 1.0
+        elif any([v.startswith("WLSPL") for v in self.statevec_names]):
+            idx, basis = self.spline_basis("WLSPL")
+            dwl[:, idx] = basis
+
+        return dwl, dfwhm
+
+    def spline_basis(self, prefix):
+        """Indices of the spline state elements named prefix_<channel> and the
+        (n_chan, n_elements) matrix mapping their values to the perturbation
+        of each channel. The interpolating cubic spline is linear in the
+        values, so the matrix is built once from unit vectors."""
+
+        if prefix not in self.spline_bases:
+            idx, channels = [], []
+            for i, v in enumerate(self.statevec_names):
+                if v.startswith(prefix):
+                    idx.append(i)
+                    channels.append(float(v.split("_")[1]))
+
+            xnew = np.arange(self.n_chan)
+            basis = np.array(
+                [splev(xnew, splrep(channels, e, s=0)) for e in np.eye(len(idx))]
+            ).T
+            self.spline_bases[prefix] = (np.array(idx), basis)
+
+        return self.spline_bases[prefix]
+
     def dmeas_dinstrumentb(self, x_instrument, wl_hi, rdn_hi):
         """Jacobian of radiance with respect to the instrument parameters
         that are unknown and not retrieved, i.e., the inevitable persisting
@@ -384,12 +492,7 @@ class Instrument:
     def sample(self, x_instrument, wl_hi, rdn_hi):
         """Apply instrument sampling to a radiance spectrum, returning predicted measurement."""
 
-        if (
-            self.calibration_fixed
-            and (len(self.wl_init) == len(wl_hi))
-            and all((self.wl_init - wl_hi) < wl_tol)
-        ):
-
+        if not self.resamples(wl_hi):
             return rdn_hi
 
         wl, fwhm = self.calibration(x_instrument)
@@ -400,23 +503,91 @@ class Instrument:
 
         # If rdn_hi is a vector of length > 1, return it resampled to instrument
         elif rdn_hi.ndim == 1 and len(rdn_hi) > 1:
-            return resample_spectrum(rdn_hi, wl_hi, wl, fwhm)
+            H = self.resample_matrix(wl_hi, wl, fwhm)
+            return resample_spectrum(rdn_hi, wl_hi, wl, fwhm, H=H)
 
         # If rdn_hi is a multidim array, do the multidim resampling
         else:
-            resamp = []
             # The "fast resample" option approximates a complete resampling
             # by a convolution with a uniform FWHM.
+            # All rows are convolved at once, then linearly interpolated to
+            # the instrument wavelengths with a single matrix product.
             if self.fast_resample:
-                for i, r in enumerate(rdn_hi):
-                    ssrf = spectral_response_function(np.arange(-10, 11), 0, fwhm[0])
-                    blur = convolve(r, ssrf, mode="same")
-                    resamp.append(interp1d(wl_hi, blur)(wl))
-            else:
-                for i, r in enumerate(rdn_hi):
-                    r2 = resample_spectrum(r, wl_hi, wl, fwhm)
-                    resamp.append(r2)
-            return np.array(resamp)
+                ssrf = spectral_response_function(np.arange(-10, 11), 0, fwhm[0])
+                blur = convolve1d(rdn_hi, ssrf, axis=-1, mode="constant")
+                return blur @ self.interpolation_matrix(wl_hi, wl).T
+
+            # All rows are resampled with a single matrix product
+            H = self.resample_matrix(wl_hi, wl, fwhm)
+            return resample_spectrum(rdn_hi, wl_hi, wl, fwhm, H=H)
+
+    def resamples(self, wl_hi):
+        """Whether spectra at wl_hi are resampled to the instrument, rather than
+        already being at a fixed instrument calibration."""
+
+        return not (
+            self.calibration_fixed
+            and (len(self.wl_init) == len(wl_hi))
+            and all((self.wl_init - wl_hi) < wl_tol)
+        )
+
+    def resample_matrix(self, wl_hi, wl, fwhm):
+        """Resampling matrix from the wl_hi grid to the calibration (wl, fwhm).
+        Matrices are cached on the rounded calibration, as states with a varying
+        calibration and their Jacobian perturbations revisit the same ones."""
+
+        key = (
+            np.round(wl, resample_cache_decimals).tobytes(),
+            np.round(fwhm, resample_cache_decimals).tobytes(),
+            np.asarray(wl_hi).tobytes(),
+        )
+        return self.cached_matrix(
+            key, lambda: calculate_resample_matrix(wl_hi, wl, fwhm)
+        )
+
+    def interpolation_matrix(self, wl_hi, wl):
+        """Linear interpolation matrix from the ascending wl_hi grid to the
+        wavelengths wl, cached the same way as the resampling matrices."""
+
+        def build():
+            if np.any(wl < wl_hi[0]) or np.any(wl > wl_hi[-1]):
+                raise ValueError(
+                    "Instrument wavelengths are outside of the wavelength range"
+                    " to resample from"
+                )
+
+            right = np.clip(np.searchsorted(wl_hi, wl), 1, len(wl_hi) - 1)
+            left = right - 1
+            weight = (wl - wl_hi[left]) / (wl_hi[right] - wl_hi[left])
+
+            M = np.zeros((len(wl), len(wl_hi)))
+            rows = np.arange(len(wl))
+            M[rows, left] = 1 - weight
+            M[rows, right] = weight
+            return M
+
+        key = (
+            "interpolation",
+            np.round(wl, resample_cache_decimals).tobytes(),
+            np.asarray(wl_hi).tobytes(),
+        )
+        return self.cached_matrix(key, build)
+
+    def cached_matrix(self, key, build):
+        """Return the matrix cached under key, else build and cache it. The
+        cache holds up to resample_cache_size matrices, least recently used
+        first."""
+
+        if key in self.resample_cache:
+            self.resample_cache.move_to_end(key)
+            return self.resample_cache[key]
+
+        matrix = build()
+        self.resample_cache[key] = matrix
+        while len(self.resample_cache) > resample_cache_size:
+            self.resample_cache.popitem(last=False)
+
+        return matrix
 
     def simulate_measurement(self, meas, geom):
         """Simulate a measurement by the given sensor, for a true radiance
@@ -439,15 +610,8 @@ class Instrument:
             fwhm = fwhm + x_instrument[ind]
         elif any([v.startswith("FWHMSPL") for v in self.statevec_names]):
             # cubic spline perturbation
-            channels, vals = [], []
-            for i, v in enumerate(self.statevec_names):
-                if v.startswith("FWHMSPL"):
-                    chan = float(v.split("_")[1])
-                    channels.append(chan)
-                    vals.append(x_instrument[i])
-            sp = splrep(channels, vals, s=0)
-            xnew = np.arange(len(wl))
-            fwhm = fwhm + splev(xnew, sp)
+            idx, basis = self.spline_basis("FWHMSPL")
+            fwhm = fwhm + basis @ x_instrument[idx]
 
         if "WL_SPACE" in self.statevec_names:
             ind = self.statevec_names.index("WL_SPACE")
@@ -460,15 +624,8 @@ class Instrument:
             shift = x_instrument[ind]
         elif any([v.startswith("WLSPL") for v in self.statevec_names]):
             # cubic spline perturbation
-            channels, vals = [], []
-            for i, v in enumerate(self.statevec_names):
-                if v.startswith("WLSPL"):
-                    chan = int(v.split("_")[1])
-                    channels.append(chan)
-                    vals.append(x_instrument[i])
-            sp = splrep(channels, vals, s=0)
-            xnew = np.arange(len(wl))
-            shift = splev(xnew, sp)
+            idx, basis = self.spline_basis("WLSPL")
+            shift = basis @ x_instrument[idx]
         else:
             shift = 0.0
 
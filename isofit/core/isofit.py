@@ -19,11 +19,12 @@
 #          Philip G Brodrick, philip.brodrick@jpl.nasa.gov
 #          Adam Erickson, adam.m.erickson@nasa.gov
 #
+import json
 import logging
 import multiprocessing
 import os
 import time
-from copy import deepcopy
+from copy import copy, deepcopy
 
 # Explicitly set the number of threads to be 1, so we more effectively run in parallel
 # Must be executed before importing numpy, otherwise doesn't work
@@ -33,17 +34,19 @@ if not os.environ.get("ISOFIT_NO_SET_THREADS"):
 
 import click
 import numpy as np
-import scipy
 
 from isofit import checkNumThreads, ray
 from isofit.configs import configs
-from isofit.core.fileio import IO, SpectrumFile
+from isofit.core.fileio import IO, CompletionMask, SpectrumFile
 from isofit.core.forward import ForwardModel
 from isofit.core.multistate import (
     construct_full_state,
-    index_spectra_by_surface,
+    count_spectra_by_surface,
+    index_tile_by_surface,
+    surface_classes_memmap,
     update_config_for_surface,
 )
+from isofit.core.scheduler import load_balance, surface_tasks
 from isofit.data import env
 from isofit.inversion import Inversion
 
@@ -55,9 +58,11 @@ class Isofit:
         config_file: isofit configuration file in JSON or YAML format
         level: logging level (ERROR, WARNING, INFO, DEBUG)
         logfile: file to write output logs to
+        pool: WorkerPool to run with, kept alive after the run. By default,
+            the workers are started for the run and stopped after it
     """
 
-    def __init__(self, config_file, level="INFO", logfile=None):
+    def __init__(self, config_file, level="INFO", logfile=None, pool=None):
         # Check the MKL/OMP env vars and raise a warning if not set properly
         checkNumThreads()
 
@@ -104,9 +109,10 @@ class Isofit:
 
         ray.init(**rayargs)
 
+        self.pool = pool
         self.workers = None
 
-    def run(self, row_column=None):
+    def run(self, row_column=None, resume=False):
         """
         Iterate over spectra, reading and writing through the IO
         object to handle formatting, buffering, and deferred write-to-file.
@@ -122,6 +128,10 @@ class Isofit:
               sample_end) all values are inclusive.
 
             If none of the above, the whole cube will be analyzed.
+
+        resume: Skip the pixels that the completion mask of the outputs marks
+            as complete from an earlier, interrupted run. All outputs must be
+            ENVI or ZARR files
         """
 
         # Get the number of workers from config
@@ -130,6 +140,14 @@ class Isofit:
         else:
             n_cores = self.config.implementation.n_cores
 
+        # The completion mask is only valid while the outputs keep the
+        # results it marks, which initialize_output_files would wipe otherwise
+        if resume and not IO.resumable_outputs(self.config):
+            raise ValueError(
+                "Resuming needs all outputs to be ENVI or ZARR files, which"
+                " keep their contents when reopened"
+            )
+
         rdn = SpectrumFile(self.config.input.measured_radiance_file, write=False)
         self.rows = range(rdn.n_rows)
         self.cols = range(rdn.n_cols)
@@ -138,136 +156,159 @@ class Isofit:
         IO.initialize_output_files(
             self.config, rdn.n_rows, rdn.n_cols, self.full_statevector
         )
+
+        # Pixels whose results are on disk, marked as each task completes
+        mask = None
+        mask_file = IO.completion_mask_file(self.config)
+        if mask_file:
+            mask = CompletionMask(mask_file, rdn.n_rows, rdn.n_cols, resume)
+            if mask.resumed:
+                logging.info(f"Resuming with {mask.count()} complete spectra")
+            elif resume:
+                logging.warning(
+                    f"No completion mask of the image size at {mask_file},"
+                    " running all spectra"
+                )
         del rdn
 
         # Handle case where you only want to run part of an image
-        # TODO Clean this, not sure if currently functioning.
         if row_column is not None:
             ranges = row_column.split(",")
             if len(ranges) == 1:
-                self.rows, self.cols = [int(ranges[0])], None
+                self.rows = range(int(ranges[0]), int(ranges[0]) + 1)
             if len(ranges) == 2:
                 row_start, row_end = ranges
-                self.rows, self.cols = range(int(row_start), int(row_end)), None
+                self.rows = range(int(row_start), int(row_end))
             elif len(ranges) == 4:
                 row_start, row_end, col_start, col_end = ranges
                 self.rows = range(int(row_start), int(row_end) + 1)
                 self.cols = range(int(col_start), int(col_end) + 1)
 
-        # Form the row-column pairs (pixels to run)
-        # Need to allocate cols of index_pairs together
-        # to make them memory contiguous
-        # This speeds up the surface indexing
-        index_pairs = np.empty(
-            (len([i for i in self.rows]) * len([i for i in self.cols]), 2), dtype=int
-        )
-        meshgrid = np.meshgrid(self.rows, self.cols)
-        index_pairs[:, 0] = meshgrid[0].flatten(order="f")
-        index_pairs[:, 1] = meshgrid[1].flatten(order="f")
-        del meshgrid
-
-        index_pairs = np.vstack(
-            [x.flatten(order="f") for x in np.meshgrid(self.rows, self.cols)]
-        ).T
-
         # Save this for logging
-        total_samples = index_pairs.shape[0]
+        total_samples = len(self.rows) * len(self.cols)
 
         # Keep track of the input version of the config
         input_config = deepcopy(self.config)
 
-        # Loop through index pairs and run workers
+        # Run all surface classes in one pool of workers
         outer_loop_start_time = time.time()
 
-        cache_RT = None
-        surface_index = index_spectra_by_surface(input_config, index_pairs)
-        for i, (surface_class_str, class_idx_pairs) in enumerate(surface_index.items()):
-            logging.info(f"Running surfaces: {surface_class_str}")
-            if not len(class_idx_pairs):
+        pool = self.pool or WorkerPool(self.loglevel, self.logfile)
+
+        # If multisurface, each class gets its own config and forward model,
+        # all sharing the radiative transfer of the first, or of the last run
+        # of the pool if it had the same one
+        cache_RT = pool.RT.get(radiative_transfer_key(input_config))
+
+        # Building a LUT runs its simulations as Ray tasks, which need the
+        # cores that the idle actors of the pool hold
+        if cache_RT is None and not lut_files_exist(input_config):
+            pool.shutdown()
+
+        surface_models = {}
+        surface_counts = count_spectra_by_surface(
+            input_config,
+            self.rows,
+            self.cols,
+            done=mask.memmap if mask is not None and mask.resumed else None,
+        )
+        for surface_class_str, n_class in surface_counts.items():
+            if not n_class:
                 logging.info(
                     f"No pixels found in image for surface: {surface_class_str}"
                 )
                 continue
+            logging.info(f"Surface {surface_class_str}: {n_class} spectra")
 
-            # Don't want more workers than tasks
-            n_iter = class_idx_pairs.shape[0]
-            n_workers = min(n_cores, n_iter)
-
-            # The number of tasks to be initialized
-            n_tasks = min(
-                (n_workers * input_config.implementation.task_inflation_factor), n_iter
-            )
-
-            # Get indices to pass to each worker
-            index_sets = np.linspace(0, n_iter, num=n_tasks, dtype=int)
-            if len(index_sets) == 1:
-                indices_to_run = [class_idx_pairs[0:1, :]]
-            else:
-                indices_to_run = [
-                    class_idx_pairs[index_sets[l] : index_sets[l + 1], :]
-                    for l in range(len(index_sets) - 1)
-                ]
-
-            # If multisurface, update config to reflect surface.
-            # Otherwise, returns itself
             config = update_config_for_surface(
                 deepcopy(input_config), surface_class_str
             )
-
-            # Set forward model
             fm = ForwardModel(config, cache_RT=cache_RT)
+            if cache_RT is None:
+                cache_RT = fm.RT
 
-            logging.debug(f"Surface: {surface_class_str}")
-
-            # Put worker args into Ray object
-            params = [
-                ray.put(obj)
-                for obj in [
-                    config,
-                    fm,
-                    self.loglevel,
-                    self.logfile,
-                    self.full_statevector,
-                    len(class_idx_pairs),
-                    n_workers,
-                ]
-            ]
+            surface_models[surface_class_str] = (config, fm)
 
-            # Initialize Ray actor pool (Worker class)
-            self.workers = ray.util.ActorPool(
-                [Worker.remote(*params, n) for n in range(n_workers)]
-            )
+        n_iter = sum(surface_counts[name] for name in surface_models)
+        n_workers = min(n_cores, n_iter)
 
-            start_time = time.time()
-            logging.info(
-                f"Beginning {n_iter} inversions in {n_tasks} chunks "
-                f"using {n_workers} cores"
-            )
+        # Actors of a failed run must not keep holding their cores
+        try:
+            if n_iter:
+                # The number of tasks to be initialized per class
+                n_tasks = n_workers * input_config.implementation.task_inflation_factor
 
-            # Kick off actor pool
-            res = list(
-                self.workers.map_unordered(
-                    lambda a, b: a.run_set_of_spectra.remote(b), indices_to_run
+                # Tiles of whole lines of every class, handed to idle workers in order
+                tasks = surface_tasks(
+                    self.rows,
+                    self.cols,
+                    {name: surface_counts[name] for name in surface_models},
+                    n_workers,
+                    n_tasks,
+                    input_config.implementation.task_scheduling,
                 )
-            )
 
-            total_time = time.time() - start_time
-            logging.info(f"Pixel class: {surface_class_str} inversions complete.")
-            logging.info(f"{round(total_time,2)}s total")
-            logging.info(f"{round(n_iter/total_time,4)} spectra/s")
-            logging.info(f"{round(n_iter/total_time/n_workers,4)} spectra/s/core")
+                # Building the radiative transfer may have written its LUTs
+                rt_key = radiative_transfer_key(input_config)
+                pool.RT = {rt_key: cache_RT}
 
-            # Not sure if it's best practice to null out these vars
-            self.workers = None
-            params = None
+                # Configure the actors of the pool (Worker class) for this run
+                self.workers = pool.configure(
+                    surface_models, self.full_statevector, n_iter, n_workers, rt_key
+                )
+                del surface_models, fm
 
-            # Cache RT
-            if not i:
-                cache_RT = fm.RT
+                start_time = time.time()
+                logging.info(
+                    f"Beginning {n_iter} inversions in {len(tasks)} tiles "
+                    f"using {n_workers} cores"
+                )
+
+                # Kick off actor pool, which routes each tile to its surface class.
+                # Tasks return once their results are synced, so they are
+                # marked complete as they come in
+                res = []
+                for stats in self.workers.map_unordered(
+                    lambda a, b: a.run_tile.remote(*b), tasks
+                ):
+                    indices = stats.pop("indices")
+                    if mask is not None:
+                        mask.mark(indices)
+                    res.append(stats)
+
+                total_time = time.time() - start_time
+                logging.info(f"Inversions complete.")
+                logging.info(f"{round(total_time,2)}s total")
+
+                for surface_class_str in surface_counts:
+                    busy = sum(
+                        r["time"] for r in res if r["surface"] == surface_class_str
+                    )
+                    if busy:
+                        logging.info(
+                            f"Pixel class: {surface_class_str}: {round(busy, 2)}s busy"
+                        )
 
-            del fm
+                balance = load_balance(res)
+                for worker_id, load in sorted(balance["workers"].items()):
+                    logging.debug(
+                        f"Worker {worker_id}: {load['tasks']} tiles, {load['pixels']}"
+                        f" spectra, {round(load['time'], 2)}s busy"
+                    )
+                logging.info(
+                    f"Load imbalance (max/mean worker busy time):"
+                    f" {round(balance['imbalance'], 3)}"
+                )
+                logging.info(f"{round(n_iter/total_time,4)} spectra/s")
+                logging.info(f"{round(n_iter/total_time/n_workers,4)} spectra/s/core")
+        finally:
+            self.workers = None
+            if self.pool is None:
+                pool.shutdown()
+            else:
+                pool.release()
 
-        if len(index_pairs):
+        if n_iter:
             outer_loop_total_time = time.time() - outer_loop_start_time
             logging.info(f"All Inversions complete.")
             logging.info(f"{round(outer_loop_total_time,2)}s total")
@@ -277,28 +318,143 @@ class Isofit:
             )
 
 
-@ray.remote(num_cpus=1)
-class Worker(object):
-    def __init__(
+def radiative_transfer_key(config: configs.Config) -> str:
+    """Key of the radiative transfer model a config builds, from the
+    radiative transfer and instrument sections and the modification times of
+    the LUT files, so that a model is only reused while its LUTs are unchanged.
+    """
+    rt = config.forward_model.radiative_transfer
+    engines = rt.radiative_transfer_engines
+    mtimes = [
+        os.path.getmtime(engine.lut_path) if os.path.isfile(engine.lut_path) else None
+        for engine in engines
+        if engine.lut_path
+    ]
+    sections = {
+        "radiative_transfer": rt.get_config_as_dict(),
+        "engines": [engine.get_config_as_dict() for engine in engines],
+        "instrument": config.forward_model.instrument.get_config_as_dict(),
+        "n_cores": config.implementation.n_cores,
+        "mtimes": mtimes,
+    }
+    sections["radiative_transfer"].pop("radiative_transfer_engines", None)
+
+    return json.dumps(sections, sort_keys=True, default=str)
+
+
+def lut_files_exist(config: configs.Config) -> bool:
+    """Whether the LUT files of all radiative transfer engines of a config
+    exist, so that building its radiative transfer model runs no simulations
+    """
+    engines = config.forward_model.radiative_transfer.radiative_transfer_engines
+    return all(
+        engine.lut_path and os.path.isfile(engine.lut_path) for engine in engines
+    )
+
+
+class WorkerPool:
+    """Long-lived Worker actors, reconfigured in place for each run so that
+    consecutive runs (e.g. the presolve and full retrievals of apply_oe) do
+    not pay for actor startup again. The driver keeps the last radiative
+    transfer model, and actors whose last configuration had the same
+    radiative transfer key keep theirs, so it is neither rebuilt nor sent.
+
+    Args:
+        loglevel: output logging level of the workers
+        logfile: output logging file of the workers
+    """
+
+    def __init__(self, loglevel: str = "INFO", logfile: str = None):
+        self.loglevel = loglevel
+        self.logfile = logfile
+
+        self.actors = []
+        self.rt_keys = []
+        self.RT = {}
+
+    def configure(
         self,
-        config: configs.Config,
-        forward_model: ForwardModel,
-        loglevel: str,
-        logfile: str,
-        full_statevector: np.array = [],
-        total_samples: int = 1,
-        total_workers: int = 1,
-        worker_id: int = None,
+        surface_models: dict,
+        full_statevector: list,
+        total_samples: int,
+        n_workers: int,
+        rt_key: str,
     ):
+        """Configure the first n_workers actors for a run, starting more if
+        needed.
+
+        Args:
+            surface_models: (config, forward model) of each surface class,
+                all sharing one radiative transfer model
+            full_statevector: statevector of all surfaces
+            total_samples: number of spectra of the run, for logging
+            n_workers: number of workers of the run
+            rt_key: radiative transfer key of the forward models
+
+        Returns:
+            ray.util.ActorPool of the configured actors
         """
-        Worker class to help run a subset of spectra.
+        while len(self.actors) < n_workers:
+            self.actors.append(
+                Worker.remote(self.loglevel, self.logfile, len(self.actors))
+            )
+            self.rt_keys.append(None)
+
+        full, light = None, None
+        jobs = []
+        for n in range(n_workers):
+            if self.rt_keys[n] == rt_key:
+                if light is None:
+                    light = {}
+                    for name, (config, fm) in surface_models.items():
+                        light[name] = (config, copy(fm))
+                        light[name][1].RT = None
+                    light = ray.put(light)
+                models = light
+            else:
+                if full is None:
+                    full = ray.put(surface_models)
+                models = full
+
+            jobs.append(
+                self.actors[n].configure.remote(
+                    models, full_statevector, total_samples, n_workers, rt_key
+                )
+            )
+            self.rt_keys[n] = rt_key
+        ray.get(jobs)
+
+        return ray.util.ActorPool(self.actors[:n_workers])
+
+    def release(self):
+        """Close the output files of all actors"""
+        if self.actors:
+            ray.get([actor.close.remote() for actor in self.actors])
+
+    def shutdown(self):
+        """Stop all actors, freeing their cores"""
+        try:
+            self.release()
+        finally:
+            for actor in self.actors:
+                ray.kill(actor)
+
+            self.actors = []
+            self.rt_keys = []
+            self.RT = {}
+
+
+@ray.remote(num_cpus=1)
+class Worker(object):
+    def __init__(self, loglevel: str, logfile: str, worker_id: int = None):
+        """
+        Worker class to help run a subset of spectra. Workers are configured
+        for a run with configure, and can be reconfigured for the next.
 
         Args:
-            config: isofit configuration
             loglevel: output logging level
             logfile: output logging file
             worker_id: worker ID for logging reference
-            total_workers: the total number of workers running, for logging reference
         """
 
         logging.basicConfig(
@@ -308,49 +464,129 @@ class Worker(object):
             datefmt="%Y-%m-%d,%H:%M:%S",
         )
 
+        self.worker_id = worker_id
+        self.io = None
+        self.RT = None
+        self.rt_key = None
+
+    def configure(
+        self,
+        surface_models: dict,
+        full_statevector: np.array = [],
+        total_samples: int = 1,
+        total_workers: int = 1,
+        rt_key: str = None,
+    ):
+        """
+        Configure the worker for a run.
+
+        Args:
+            surface_models: (config, forward model) of each surface class. A
+                forward model without a radiative transfer model reuses the
+                one of the last configuration, with the same rt_key
+            full_statevector: statevector of all surfaces
+            total_samples: number of spectra of the run, for logging reference
+            total_workers: the total number of workers running, for logging reference
+            rt_key: radiative transfer key of the forward models
+        """
+        self.close()
+
+        for config, fm in surface_models.values():
+            if fm.RT is None:
+                if rt_key != self.rt_key:
+                    raise ValueError(
+                        "Worker has no radiative transfer model for this configuration"
+                    )
+                fm.RT = self.RT
+        self.RT = fm.RT
+        self.rt_key = rt_key
+
+        # Inversions are built on the first tile of each class
+        self.surface_models = surface_models
+        self.inversions = {}
+        self.set_surface(next(iter(surface_models)))
+
         # If full image statevector isn't passed, use forward model
         if not len(full_statevector):
-            full_statevector = forward_model.statevec
+            full_statevector = self.fm.statevec
 
-        self.config = config
-        self.fm = forward_model
-        self.iv = Inversion(self.config, self.fm)
+        # Output files are shared by all classes
         self.io = IO(self.config, self.fm, full_statevec=full_statevector)
 
+        # The classification is opened once for all tiles of the run
+        self.classes = None
+        if self.config.forward_model.surface.surface_class_file:
+            self.classes = surface_classes_memmap(self.config)
+
+        # Pixels already complete when resuming are skipped
+        self.mask = None
+        mask_file = IO.completion_mask_file(self.config)
+        if mask_file and os.path.isfile(mask_file):
+            self.mask = CompletionMask(mask_file)
+
         self.total_samples = None
         if total_workers is not None:
             self.total_samples = np.floor(total_samples / total_workers)
 
-        self.worker_id = worker_id
         self.completed_spectra = 0
 
+    def close(self):
+        """Close the output files of the last configuration"""
+        if self.io is not None:
+            self.io.close()
+            self.io = None
+
+    def set_surface(self, surface_class_str: str):
+        """Switch the config, forward model and inversion to a surface class."""
+        self.config, self.fm = self.surface_models[surface_class_str]
+        if surface_class_str not in self.inversions:
+            self.inversions[surface_class_str] = Inversion(self.config, self.fm)
+        self.iv = self.inversions[surface_class_str]
+
+    def run_tile(self, tile: tuple, surface_class_str: str):
+        """Run the pixels of a surface class within a tile of the image.
+
+        Args:
+            tile: (row_start, row_end, col_start, col_end), ends exclusive
+            surface_class_str: surface class of the pixels to run
+
+        Returns:
+            dictionary of the worker id, surface class, indices and number of
+            the pixels run and run time
+        """
+        start_time = time.time()
+        self.set_surface(surface_class_str)
+        indices = index_tile_by_surface(self.classes, tile, surface_class_str)
+        if self.mask is not None:
+            indices = indices[~self.mask.done(indices)]
+        if len(indices):
+            self.run_set_of_spectra(indices)
+
+        return {
+            "worker": self.worker_id,
+            "surface": surface_class_str,
+            "indices": indices,
+            "pixels": len(indices),
+            "time": time.time() - start_time,
+        }
+
     def run_set_of_spectra(self, indices: np.array):
+        # Drop invalid pixels and fill spectral gaps for the whole set at once
+        indices = self.io.screen_pixels(indices)
+        if not len(indices):
+            return
+
+        # Read the rows of this chunk ahead of the inversions
+        self.io.prefetch(indices[:, 0])
+
         for index in range(0, indices.shape[0]):
             logging.debug("Read chunk of spectra")
             row, col = indices[index, 0], indices[index, 1]
 
-            input_data = self.io.get_components_at_index(row, col)
+            input_data = self.io.get_components_at_index(row, col, screened=True)
 
             self.completed_spectra += 1
             if input_data is not None:
-                nan_locs = np.where(np.isnan(input_data.meas))
-                if len(nan_locs) > 0:
-                    if len(nan_locs) > 0.25 * len(input_data.meas):
-                        logging.exception(
-                            f"Input data gap >25% for pixel at index ({row}, {col}). "
-                            f"Skipping inversion. Results for this pixel will be all zeros."
-                        )
-                        continue
-                    else:
-                        non_nan_locs = np.where(np.isnan(input_data.meas) == False)
-                        interp = scipy.interpolate.interp1d(
-                            self.io.meas_wl[non_nan_locs],
-                            input_data.meas[non_nan_locs],
-                            kind="linear",
-                            fill_value="extrapolate",
-                        )
-                        input_data.meas = interp(self.io.meas_wl)
-
                 logging.debug("Run model")
                 # The inversion returns a list of states, which are
                 # intepreted either as samples from the posterior (MCMC case)
@@ -388,7 +624,10 @@ class Worker(object):
             f" {index}/{indices.shape[0]}"
         )
 
-        self.io.flush_buffers()
+        self.io.stop_prefetch()
+
+        # Results must be on disk before the task is reported complete
+        self.io.sync()
 
 
 @click.command(name="run")
@@ -403,12 +642,17 @@ class Worker(object):
     default="INFO",
 )
 @click.option("--log_file")
-def cli(config_file, level, log_file):
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Skip the spectra completed by an earlier, interrupted run",
+)
+def cli(config_file, level, log_file, resume):
     """Execute ISOFIT core"""
 
     click.echo(
         f"Running ISOFIT(config_file={config_file!r}, level={level}, logfile={log_file})"
     )
-    Isofit(config_file=config_file, level=level, logfile=log_file).run()
+    Isofit(config_file=config_file, level=level, logfile=log_file).run(resume=resume)
 
     click.echo("Done")
@@ -186,6 +186,83 @@ def index_spectra_by_surface(config, index_pairs, force_full_res=False):
     return class_groups
 
 
+def surface_classes_memmap(config, force_full_res=False):
+    """(rows, cols) memory map of the surface classification file"""
+    surface_config = config.forward_model.surface
+    if force_full_res:
+        class_file = surface_config.base_surface_class_file
+    else:
+        class_file = surface_config.surface_class_file
+
+    return np.squeeze(
+        envi.open(envi_header(class_file)).open_memmap(interleave="bip"), axis=-1
+    )
+
+
+def count_spectra_by_surface(config, rows, cols, block_size=256, done=None):
+    """
+    Counts the pixels of each surface class within a window of the image,
+    reading the classification file a block of lines at a time.
+    Args:
+        config: (Config object) Full isofit config object.
+        rows: (range) rows of the window
+        cols: (range) columns of the window
+        block_size: (int) number of lines read at once
+        done: (array) optional (rows, cols) mask of the image, nonzero for
+              pixels that are complete and not counted
+    Returns:
+        class_counts: (dict) where keys are the pixel classification (name)
+                      and values are the number of pixels of the class.
+    """
+    surface_config = config.forward_model.surface
+    if not surface_config.surface_class_file:
+        if done is None:
+            return {"uniform_surface": len(rows) * len(cols)}
+        window = done[rows.start : rows.stop, cols.start : cols.stop]
+        return {"uniform_surface": int(np.count_nonzero(window == 0))}
+
+    classes = surface_classes_memmap(config)
+
+    class_counts = {surface_name: 0 for surface_name in surface_config.Surfaces}
+    for start in range(rows.start, rows.stop, block_size):
+        end = min(start + block_size, rows.stop)
+        block = np.asarray(classes[start:end, cols.start : cols.stop]).astype(int)
+        if done is not None:
+            block[np.asarray(done[start:end, cols.start : cols.stop]) > 0] = -1
+        for surface_name in class_counts:
+            class_counts[surface_name] += int(
+                np.count_nonzero(block == SurfaceMapping[surface_name])
+            )
+
+    del classes
+
+    return class_counts
+
+
+def index_tile_by_surface(classes, tile, surface_class_str):
+    """
+    Pixels of a rectangular tile of the image that belong to a surface
+    class, in row-major order.
+    Args:
+        classes: (array) (rows, cols) surface classes of the image, e.g. from
+                 surface_classes_memmap, or None for a uniform surface
+        tile: (tuple) (row_start, row_end, col_start, col_end), ends exclusive
+        surface_class_str: (str) surface class name, ignored without classes
+    Returns:
+        index_pairs: (n, 2) array of the rows and columns of the pixels
+    """
+    row_start, row_end, col_start, col_end = tile
+    rows, cols = np.mgrid[row_start:row_end, col_start:col_end]
+    index_pairs = np.stack([rows.ravel(), cols.ravel()], axis=1)
+
+    if classes is None:
+        return index_pairs
+
+    block = np.asarray(classes[row_start:row_end, col_start:col_end]).astype(int)
+
+    return index_pairs[(block == SurfaceMapping[surface_class_str]).ravel()]
+
+
 def index_spectra_by_surface_view(config, index_pairs, force_full_res=False):
     """
     Indexes an image by a provided surface class file.
@@ -0,0 +1,171 @@
+#! /usr/bin/env python3
+#
+#  Copyright 2018 California Institute of Technology
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+# ISOFIT: Imaging Spectrometer Optimal FITting
+#
+from __future__ import annotations
+
+from typing import List
+
+import numpy as np
+
+# Each guided tile takes 1 / (guided_factor * n_workers) of the remaining lines
+guided_factor = 2
+
+
+def line_blocks(rows: range, cols: range, n_tasks: int) -> List[tuple]:
+    """Split a window of the image into at most n_tasks tiles. A tile is a
+    (row_start, row_end, col_start, col_end) rectangle with exclusive ends.
+    Tiles are blocks of whole lines, so that each task reads and writes
+    contiguous rows. Only when there are fewer lines than tasks are the
+    lines split across columns.
+
+    Args:
+        rows: rows of the window
+        cols: columns of the window
+        n_tasks: maximum number of tiles
+
+    Returns:
+        list of tiles, in row-major order
+    """
+    n_rows, n_cols = len(rows), len(cols)
+    n_tasks = max(1, min(n_tasks, n_rows * n_cols))
+
+    if n_tasks <= n_rows:
+        edges = rows.start + np.linspace(0, n_rows, n_tasks + 1, dtype=int)
+        return [
+            (int(start), int(end), cols.start, cols.stop)
+            for start, end in zip(edges[:-1], edges[1:])
+        ]
+
+    per_row = min(-(-n_tasks // n_rows), n_cols)
+    edges = cols.start + np.linspace(0, n_cols, per_row + 1, dtype=int)
+    return [
+        (row, row + 1, int(start), int(end))
+        for row in rows
+        for start, end in zip(edges[:-1], edges[1:])
+    ]
+
+
+def guided_blocks(
+    rows: range,
+    cols: range,
+    n_workers: int,
+    factor: int = guided_factor,
+    min_lines: int = 1,
+) -> List[tuple]:
+    """Guided scheduling of a window of the image. Each tile takes
+    1 / (factor * n_workers) of the lines that remain, so tiles start large
+    and shrink towards min_lines as the queue drains. Handed to idle workers
+    in order, the last tiles are small, which evens out the finishing times
+    when the cost of the pixels varies.
+
+    Args:
+        rows: rows of the window
+        cols: columns of the window
+        n_workers: number of workers
+        factor: number of tiles per worker each share of the remaining lines
+            is split into
+        min_lines: minimum number of lines of a tile
+
+    Returns:
+        list of (row_start, row_end, col_start, col_end) tiles, largest first
+    """
+    tiles = []
+    start = rows.start
+    while start < rows.stop:
+        remaining = rows.stop - start
+        size = max(min_lines, -(-remaining // (factor * n_workers)))
+        end = min(start + size, rows.stop)
+        tiles.append((start, end, cols.start, cols.stop))
+        start = end
+
+    return tiles
+
+
+def surface_tasks(
+    rows: range,
+    cols: range,
+    surface_counts: dict,
+    n_workers: int,
+    n_tasks: int,
+    scheduling: str = "guided",
+) -> List[tuple]:
+    """Tasks of all surface classes for a single shared pool of workers. Each
+    class with pixels in the window is tiled on its own, and a task is a
+    (tile, surface class) pair. With guided scheduling, the tasks of all
+    classes are ordered by their expected number of pixels, the tile area
+    times the fraction of the window the class covers, largest first. Small
+    classes then fill in the gaps left by the large ones rather than running
+    on a few cores after them.
+
+    Args:
+        rows: rows of the window
+        cols: columns of the window
+        surface_counts: number of pixels of each surface class in the window
+        n_workers: number of workers
+        n_tasks: maximum number of tiles per class for static scheduling
+        scheduling: "guided" or "static"
+
+    Returns:
+        list of (tile, surface class) tasks
+    """
+    window = len(rows) * len(cols)
+    tasks = []
+    for surface_class_str, count in surface_counts.items():
+        if not count:
+            continue
+
+        if scheduling == "guided" and len(rows) >= n_workers * guided_factor:
+            tiles = guided_blocks(rows, cols, n_workers)
+        else:
+            tiles = line_blocks(rows, cols, min(n_tasks, count))
+
+        density = count / window
+        tasks += [
+            (
+                (tile[1] - tile[0]) * (tile[3] - tile[2]) * density,
+                tile,
+                surface_class_str,
+            )
+            for tile in tiles
+        ]
+
+    if scheduling == "guided":
+        tasks.sort(key=lambda task: -task[0])
+
+    return [(tile, surface_class_str) for _, tile, surface_class_str in tasks]
+
+
+def load_balance(stats: List[dict]) -> dict:
+    """Summarize the per-worker load from the statistics returned by each
+    task, dictionaries of the worker id, number of pixels and run time.
+
+    Returns:
+        dictionary of the per-worker tasks, pixels and busy time, and the
+        imbalance, the maximum over the mean busy time
+    """
+    workers = {}
+    for task in stats:
+        load = workers.setdefault(task["worker"], {"tasks": 0, "pixels": 0, "time": 0})
+        load["tasks"] += 1
+        load["pixels"] += task["pixels"]
+        load["time"] += task["time"]
+
+    busy = np.array([load["time"] for load in workers.values()])
+    imbalance = busy.max() / busy.mean() if len(busy) and busy.mean() > 0 else 1.0
+
+    return {"workers": workers, "imbalance": imbalance}
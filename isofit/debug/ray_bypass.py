@@ -30,7 +30,17 @@ class Remote:
         Returns a Remote object on the key being requested. This enables
         ray.remote(Class).func.remote()
         """
-        return Remote(getattr(self.obj, key))
+        return Remote(getattr(self.instance().obj, key))
+
+    def instance(self):
+        """
+        Creates the object of a wrapped class on first use, so that an actor
+        keeps its state across calls like a Ray actor does
+        """
+        if isinstance(self.obj, type):
+            self.obj = self.obj(*self.args, **self.kwargs)
+            self.args, self.kwargs = (), {}
+        return self
 
     def remote(self, *args, **kwargs):
         return Remote(self.obj, *args, **kwargs)
@@ -83,6 +93,10 @@ def put(obj):
     return obj
 
 
+def kill(*args, **kwargs):
+    pass
+
+
 def shutdown(*args, **kwargs):
     pass
 
@@ -99,7 +113,7 @@ class util:
                 List of Remote objects to call
             """
             # Only need one actor function
-            self.actors = Remote(actors[0].get())
+            self.actors = actors[0].instance()
 
         def map_unordered(self, func, iterable):
             return [func(self.actors, item).get() for item in iterable]
@@ -169,11 +169,9 @@ class Inversion:
         xa = self.fm.xa(x, geom)
         Sa, Sa_inv, Sa_inv_sqrt = self.fm.Sa(x, geom)
         K = self.fm.K(x, geom)
-        Seps = self.fm.Seps(x, meas, geom)
+        Seps = self.fm.Seps(x, meas, geom, structured=True)
 
-        Seps_inv = svd_inv(
-            Seps, hashtable=self.hashtable, max_hash_size=self.max_table_size
-        )
+        Seps_inv = Seps.inv(hashtable=self.hashtable, max_hash_size=self.max_table_size)
 
         # Gain matrix G reflects current state, so we use the state-dependent
         # Jacobian matrix K
@@ -199,15 +197,12 @@ class Inversion:
         """Calculate (zero-mean) measurement distribution in radiance terms.
         This depends on the location in the state space. This distribution is
         calculated over one or more subwindows of the spectrum. Return the
-        inverse covariance and its square root."""
-
-        Seps = self.fm.Seps(x, meas, geom)
-        wn = len(self.winidx)
-        Seps_win = np.zeros((wn, wn))
-        for i in range(wn):
-            Seps_win[i, :] = Seps[self.winidx[i], self.winidx]
-        return svd_inv_sqrt(
-            Seps_win, hashtable=self.hashtable, max_hash_size=self.max_table_size
+        inverse covariance and its square root. The square root S satisfies
+        S S^T = Seps^-1, but is not necessarily symmetric."""
+
+        Seps = self.fm.Seps(x, meas, geom, structured=True)
+        return Seps.window(self.winidx).inv_sqrt(
+            hashtable=self.hashtable, max_hash_size=self.max_table_size
         )
 
     def jacobian(self, x_free, geom, Seps_inv_sqrt) -> np.ndarray:
@@ -235,7 +230,7 @@ class Inversion:
         # jacobian of measurment cost term WRT full state vector.
         K = self.fm.K(x, geom)[self.winidx, :]
         K = K[:, self.inds_free]
-        meas_jac = Seps_inv_sqrt.dot(K)
+        meas_jac = Seps_inv_sqrt.T.dot(K)
 
         # jacobian of prior cost term with respect to state vector.
         xa_free, Sa_free, Sa_free_inv, Sa_free_inv_sqrt = self.calc_conditional_prior(
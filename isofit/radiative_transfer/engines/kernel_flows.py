@@ -107,47 +107,98 @@ def bounds_check(
         grid["observer_zenith"] = [180 - x for x in grid["observer_zenith"]]
 
 
-def predict_M(
-    M_Z,
-    M_lambda,
-    M_theta,
-    M_h,
-    points,
-    G_Xproj_vectors,
-    G_Xproj_values,
-    G_Xmean,
-    G_Xstd,
-):
-    Z_tr = M_Z.T  # training inputs
+def stack_MVM(MVM: dict, transfs: np.array) -> dict:
+    """Materializes the GPs of a single MVM into stacked, contiguous arrays so that
+    all output components can be evaluated in one batched kernel computation.
+
+    Components may differ in their reduced input dimension and number of training
+    points; these are zero-padded to a common size. Padded input dimensions are zero
+    for both training and test inputs, and padded training points carry zero weight
+    in h, so the padding does not change the predictions.
+
+    Args:
+        MVM (dict): MVM group of the emulator file, containing the component GPs
+            "M1".."Mn" and the shared geometry "G"
+        transfs (np.array): input transformation indices of this MVM
+
+    Returns:
+        dict: stacked arrays, leading dimension is the output component
+    """
+    G = MVM["G"]
+    ncomp = len(MVM.keys()) - 1  # take out GPGeometry from list of GPs
+    Ms = [MVM[f"M{i + 1}"] for i in range(ncomp)]
+
+    ndim = max(np.size(M["lambda"]) for M in Ms)
+    ntrain = max(np.shape(M["Z"])[1] for M in Ms)
+    nx = np.size(G["Xmean"])
+
+    Z = np.zeros((ncomp, ntrain, ndim))
+    proj = np.zeros((ncomp, nx, ndim))
+    h = np.zeros((ncomp, ntrain))
+    theta = np.zeros((ncomp, 3))
+    for i, M in enumerate(Ms):
+        d, n = np.shape(M["Z"])
+        Xproj = G[f"Xproj{i + 1}"]
+
+        Z[i, :n, :d] = np.asarray(M["Z"]).T  # training inputs
+        # Input reduction (standardized inputs @ Xproj), with the lambda scaling folded in
+        proj[i, :, :d] = (
+            np.asarray(Xproj["vectors"]).T / np.asarray(Xproj["values"]) * M["lambda"]
+        )
+        h[i, :n] = M["h"]
+        theta[i] = np.asarray(M["theta"])[:3]
+
+    return {
+        "transfs": np.asarray(transfs).astype(int),
+        "Z": Z,
+        "Z_sq": np.sum(Z * Z, axis=2),
+        "proj": proj,
+        "h": h,
+        "theta": theta,
+        "Xmean": np.asarray(G["Xmean"]),
+        "Xstd": np.asarray(G["Xstd"]),
+        "Yproj_vectors": np.asarray(G["Yproj"]["vectors"]),
+        "Yproj_values": np.asarray(G["Yproj"]["values"]),
+        "Ymean": np.asarray(G["Ymean"]),
+        "Ystd": np.asarray(G["Ystd"]),
+    }
+
+
+def predict_MVM(MVM: dict, points: np.array) -> np.array:
+    """Evaluates all output components of a stacked MVM (see stack_MVM) at once
+
+    Args:
+        MVM (dict): stacked MVM arrays
+        points (np.array): transformed input points, shape (n_points, n_inputs)
 
-    Z_te = reduce_points(points, G_Xproj_vectors, G_Xproj_values, G_Xmean, G_Xstd)
-    Z_te = Z_te * M_lambda  # scale test inputs
-    theta = M_theta
+    Returns:
+        np.array: reduced-space predictions, shape (n_points, n_components)
+    """
+    # Reduce and scale the test inputs for every component: (ncomp, npoints, ndim)
+    Z_te = ((points - MVM["Xmean"]) / MVM["Xstd"]) @ MVM["proj"]
+
+    # Cross products between testing and training inputs: (ncomp, npoints, ntrain)
+    ZZ = Z_te @ MVM["Z"].transpose(0, 2, 1)
 
     # RBF component to cross covariance matrix. Start by computing
     # Euclidean distances between testing and training inputs
     wb = np.sqrt(
-        (-2 * (Z_tr @ Z_te.T).T + np.sum(Z_tr * Z_tr, axis=1)).T
-        + np.sum(Z_te * Z_te, axis=1)
+        -2 * ZZ + MVM["Z_sq"][:, None, :] + np.sum(Z_te * Z_te, axis=2)[:, :, None]
     )
 
     # Figure out a way to read kernel type from M["kernel"]["k"]
     # Matern32
-    wb = np.sqrt(3.0) / theta[1] * wb  # h in kernel_functions.jl
-    wb = theta[0] * (1.0 + wb) * np.exp(-wb)
+    theta = MVM["theta"][:, :, None, None]
+    wb = np.sqrt(3.0) / theta[:, 1] * wb  # h in kernel_functions.jl
+    wb = theta[:, 0] * (1.0 + wb) * np.exp(-wb)
     # Matern52
-    # wb = sqrt(5.) / theta[1] * wb # h in kernel_functions.jl
-    # wb = theta[0] * (1. + wb + wb**2 / sqrt(3.)) * exp(-wb)
+    # wb = sqrt(5.) / theta[:, 1] * wb # h in kernel_functions.jl
+    # wb = theta[:, 0] * (1. + wb + wb**2 / sqrt(3.)) * exp(-wb)
 
     # linear component to cross covariance matrix
-    wb2 = theta[2] * Z_tr @ Z_te.T
-    return (wb + wb2).T @ M_h
-
+    wb += theta[:, 2] * ZZ
 
-def reduce_points(points, Xproj_vectors, Xproj_values, Xmu, Xsigma):
-    Z = (points - Xmu) / Xsigma
-    H = Xproj_vectors.T / Xproj_values
-    return Z @ H
+    return (wb @ MVM["h"][:, :, None])[:, :, 0].T
 
 
 class KernelFlowsRT(RadiativeTransferEngine):
@@ -160,11 +211,21 @@ class KernelFlowsRT(RadiativeTransferEngine):
         and cross validation (2024). Submitted to Atmospheric Measurement Techniques.
     """
 
+    # The emulator can be evaluated directly at any point, see emulate()
+    _supports_direct_emulation = True
+
     def __init__(self, engine_config: RadiativeTransferEngineConfig, **kwargs):
 
         # read VSWIREmulator struct from jld2 file into a dictionary
         self.f = self.h5_to_dict(h5py.File(engine_config.emulator_file, "r"))
 
+        # Materialize the MVMs once into stacked arrays, dropping the raw copies
+        self.n_MVMs = len(self.f.keys()) - 6
+        self.MVMs = [
+            stack_MVM(self.f.pop(f"MVM{i}"), self.f["input_transfs"][i - 1, :])
+            for i in range(1, 1 + self.n_MVMs)
+        ]
+
         self.emulator_wl = self.f["wls"]
         self.emulator_internal_idx = self.f["inputdims"].astype(int)
         self.emulator_names = [
@@ -284,13 +345,30 @@ class KernelFlowsRT(RadiativeTransferEngine):
         self.lut.setAttr("KernelFlows", str(self.engine_config.emulator_file))
 
         logging.info(f"KF Presim")
+        self.prepare_emulator()
+        return False
+
+    def preEmulate(self):
+        """Direct emulation needs the same preparation as the LUT simulations"""
+        logging.info(f"KF preparing direct emulation")
+        self.prepare_emulator()
+        return {"solar_irr": np.zeros(len(self.wl))}
+
+    def prepare_emulator(self):
+        """Builds the output SRF reconstruction and the default fills of the emulator
+        inputs that are not part of the lut_grid
+        """
         self.srf_matrix = np.array(
             [
                 spectral_response_function(self.emulator_wl, wi, fwhmi / 2.355)
                 for wi, fwhmi in zip(self.wl, self.fwhm)
             ]
         )
-        self.ga = list()
+        # Output reconstruction, same as recover() in dimension_reduction.jl
+        for MVM in self.MVMs:
+            MP = self.srf_matrix @ MVM["Yproj_vectors"].T
+            MVM["H"] = MP * MVM["Yproj_values"]
+            MVM["srfmean"] = self.srf_matrix @ MVM["Ymean"]
 
         default_lut_val = {}
         for key in self.emulator_internal_idx:
@@ -310,7 +388,6 @@ class KernelFlowsRT(RadiativeTransferEngine):
                 )
 
         self.assign_bounds()
-        return False
 
     def makeSim(self, point: np.array, template_only: bool = False):
         # Kernel Flows doesn't need to make the simulation, as it can execute
@@ -328,14 +405,7 @@ class KernelFlowsRT(RadiativeTransferEngine):
         """
 
         np.set_printoptions(suppress=True)
-        point = self.default_fills.copy()
-        point[self.emulator_inds_to_point_inds] = in_point
-
-        # observer zenith in LUT grid comes in ANG OBS file convention.
-        # convert to MODTRAN convention as KF emulator is trained on that
-        point[self.emulator_names.index("observer_zenith")] = (
-            180 - point[self.emulator_names.index("observer_zenith")]
-        )
+        point = self.to_emulator_points(in_point)[0]
 
         if np.any(point < self.points_bound_min) or np.any(
             point > self.points_bound_max
@@ -344,28 +414,71 @@ class KernelFlowsRT(RadiativeTransferEngine):
             outstr = f"Input point is out of bounds. \n keys: {self.emulator_names} \n point: {fm_l(point)} \n xmin: {fm_l(self.points_bound_min)} \n xmax: {fm_l(self.points_bound_max)} \n oob_low: {point < self.points_bound_min} \n oob_high: {point > self.points_bound_max}"
             raise ValueError(outstr)
 
-        nMVMs = len(self.f.keys()) - 6
-        for i in range(1, 1 + nMVMs):
-            MVM = self.predict_single_MVM(
-                self.f["MVM" + str(i)], point, self.f["input_transfs"][i - 1, :]
-            )
-            self.ga.append(MVM)
-        self.ga[1] = self.output_transfs[0](self.ga[1][:, :])
-        self.ga[2] = self.output_transfs[0](self.ga[2][:, :])
+        ga = [self.predict_single_MVM(MVM, point) for MVM in self.MVMs]
+        ga[1] = self.output_transfs[0](ga[1][:, :])
+        ga[2] = self.output_transfs[0](ga[2][:, :])
 
         combined = {
-            "rhoatm": self.ga[0],
-            "sphalb": self.ga[3],
-            "transm_down_dir": self.ga[1],
-            "transm_down_dif": self.ga[2],
-            "transm_up_dir": np.zeros(self.ga[0].shape),
-            "transm_up_dif": np.zeros(self.ga[0].shape),
-            "thermal_upwelling": np.zeros(self.ga[0].shape),
-            "thermal_downwelling": np.zeros(self.ga[0].shape),
+            "rhoatm": ga[0],
+            "sphalb": ga[3],
+            "transm_down_dir": ga[1],
+            "transm_down_dif": ga[2],
+            "transm_up_dir": np.zeros(ga[0].shape),
+            "transm_up_dif": np.zeros(ga[0].shape),
+            "thermal_upwelling": np.zeros(ga[0].shape),
+            "thermal_downwelling": np.zeros(ga[0].shape),
             "solar_irr": np.zeros(self.wl.shape),
         }
         return combined
 
+    def to_emulator_points(self, in_points):
+        """Converts points organized based on lut_grid to the emulator's inputs, filling
+        in defaults for emulator inputs that are not part of the lut_grid
+
+        Args:
+            in_points (np.array): Input points, shape (n_points, n_lut_names) or (n_lut_names,)
+
+        Returns:
+            np.array: emulator input points, shape (n_points, n_emulator_inputs)
+        """
+        in_points = np.atleast_2d(in_points)
+        points = np.tile(self.default_fills, (in_points.shape[0], 1))
+        points[:, self.emulator_inds_to_point_inds] = in_points
+
+        # observer zenith in LUT grid comes in ANG OBS file convention.
+        # convert to MODTRAN convention as KF emulator is trained on that
+        i = self.emulator_names.index("observer_zenith")
+        points[:, i] = 180 - points[:, i]
+
+        return points
+
+    def emulate(self, in_points):
+        """Direct emulation: evaluates the emulator for a batch of points at once.
+        Unlike readSim, points outside of the emulator bounds are clipped to them, as
+        the LUT interpolators would do at the edges of the grid
+
+        Args:
+            in_points (np.array): Input points - organized based on lut_grid, not emulator
+
+        Returns:
+            dict: Dictionary of output values, each of shape (n_points, n_wl)
+        """
+        points = self.to_emulator_points(in_points)
+        points = np.clip(points, self.points_bound_min, self.points_bound_max)
+
+        ga = [self.predict_single_MVM(MVM, points) for MVM in self.MVMs]
+
+        return {
+            "rhoatm": ga[0],
+            "sphalb": ga[3],
+            "transm_down_dir": self.output_transfs[0](ga[1]),
+            "transm_down_dif": self.output_transfs[0](ga[2]),
+            "transm_up_dir": np.zeros(ga[0].shape),
+            "transm_up_dif": np.zeros(ga[0].shape),
+            "thermal_upwelling": np.zeros(ga[0].shape),
+            "thermal_downwelling": np.zeros(ga[0].shape),
+        }
+
     def predict(self, points):
 
         if np.any(points < self.points_bound_min) or np.any(
@@ -374,78 +487,37 @@ class KernelFlowsRT(RadiativeTransferEngine):
             outstr = f"Input points are out of bounds xmin: {self.points_bound_min}, xmax: {self.points_bound_max}"
             raise ValueError(outstr)
 
-        nMVMs = len(self.f.keys()) - 6
-        for i in range(1, 1 + nMVMs):
-            MVM = self.predict_single_MVM(
-                self.f["MVM" + str(i)], points, self.f["input_transfs"][i - 1, :]
-            )
-            self.ga.append(MVM)
+        ga = [self.predict_single_MVM(MVM, points) for MVM in self.MVMs]
 
         # back-transform some quantities from log space
         # ToDo: this might not always be needed,
         #  so we need an if-statement at some point
-        ga_1 = self.output_transfs[0](self.ga[1][:, :])
-        ga_2 = self.output_transfs[0](self.ga[2][:, :])
+        ga_1 = self.output_transfs[0](ga[1][:, :])
+        ga_2 = self.output_transfs[0](ga[2][:, :])
 
         combined = {
-            "rhoatm": self.ga[0],
-            "sphalb": self.ga[3],
+            "rhoatm": ga[0],
+            "sphalb": ga[3],
             "transm_down_dir": ga_1,
             "transm_down_dif": ga_2,
-            "transm_up_dir": np.zeros(self.ga[0].shape),
-            "transm_up_dif": np.zeros(self.ga[0].shape),
-            "thermal_upwelling": np.zeros(self.ga[0].shape),
-            "thermal_downwelling": np.zeros(self.ga[0].shape),
+            "transm_up_dir": np.zeros(ga[0].shape),
+            "transm_up_dif": np.zeros(ga[0].shape),
+            "thermal_upwelling": np.zeros(ga[0].shape),
+            "thermal_downwelling": np.zeros(ga[0].shape),
             "solar_irr": np.zeros(self.wl.shape),
             "wl": self.wl,
         }
         return combined
 
-    def predict_single_MVM(self, MVM, points, transfs):
-        points = np.copy(points)  # don't overwrite inputs
+    def predict_single_MVM(self, MVM, points):
+        points = np.array(points, dtype=float)  # don't overwrite inputs
         if len(points.shape) == 1:
             points = points.reshape(1, -1)
-        for i, j in enumerate(transfs):
+        for i, j in enumerate(MVM["transfs"]):
             if j == 1:
                 continue
             points[:, i] = self.input_transfs[j - 1](points[:, i])
 
-        nte = np.shape(points)[0]
-        nzycols = len(MVM.keys()) - 1  # take out GPGeometry from list of GPs
-        ZY_pred = np.zeros((nte, nzycols))
-
-        ZY_out = []
-        for i in range(nzycols):
-            M = MVM["M" + str(i + 1)]
-            G = MVM["G"]  # shorthand
-            M_Z = np.array(M["Z"])
-            M_lambda = np.array(M["lambda"])
-            M_theta = np.array(M["theta"])
-            M_h = np.array(M["h"])
-            G_Xproj_vectors = np.array(G["Xproj" + str(i + 1)]["vectors"])
-            G_Xproj_values = np.array(G["Xproj" + str(i + 1)]["values"])
-            G_Xmean = np.array(G["Xmean"])
-            G_Xstd = np.array(G["Xstd"])
-
-            ZY_out.append(
-                predict_M(
-                    M_Z,
-                    M_lambda,
-                    M_theta,
-                    M_h,
-                    points,
-                    G_Xproj_vectors,
-                    G_Xproj_values,
-                    G_Xmean,
-                    G_Xstd,
-                )
-            )
-        for i in range(len(ZY_out)):
-            ZY_pred[:, i] = ZY_out[i]
-        del ZY_out
-
-        # H is same as in recover() in dimension_reduction.jl
-        MP = self.srf_matrix @ G["Yproj"]["vectors"][:, :].T
-        H = MP * G["Yproj"]["values"][:]
-        srfmean = self.srf_matrix @ G["Ymean"]
-        return (ZY_pred @ H.T) * G["Ystd"] + srfmean
+        ZY_pred = predict_MVM(MVM, points)
+
+        return (ZY_pred @ MVM["H"].T) * MVM["Ystd"] + MVM["srfmean"]
@@ -50,6 +50,7 @@ class SRTMnetModel(torch.nn.Module):
         Args:
             input_file (str, optional): Path to the file containing model weights.
             key (str, optional): Key to select specific weights in the file (6c format). If '3c', read all (sRTMnet 3c format).
+                If '6c', read the weights of every 6c component at once (see predict_coupled).
             n_cores (int, optional): Number of CPU cores to use if using cpu.
         """
         super().__init__()
@@ -71,6 +72,15 @@ class SRTMnetModel(torch.nn.Module):
             self.product_name = key
         elif key == "3c":
             self.component_keys = ["transm_down_dif", "rhoatm", "sphalb"]
+        elif key == "6c":
+            self.component_keys = [
+                "transm_down_dir",
+                "transm_down_dif",
+                "transm_up_dir",
+                "transm_up_dif",
+                "rhoatm",
+                "sphalb",
+            ]
         else:
             self.component_keys = [key]
 
@@ -256,7 +266,7 @@ class SRTMnetModel(torch.nn.Module):
                     # For paired terms, convert to radiance and multiply
                     if is_paired:
                         if product is None:
-                            product = out
+                            product = out.copy()
                         else:
                             product *= out
                 else:
@@ -292,6 +302,106 @@ class SRTMnetModel(torch.nn.Module):
 
         return outdict
 
+    @torch.inference_mode()
+    def predict_coupled(
+        self,
+        surrogate_data,
+        surrogate_data_emulator_wl,
+        mapping,
+        batch_size=4096,
+        response_scaler=None,
+        response_offset=None,
+        resample_dict=None,
+    ):
+        """Predicts every component of a 6c model in a single pass per batch, along
+        with the coupled (paired) products defined by `mapping`.  Each component
+        network is evaluated once per batch, regardless of how many coupled products
+        it participates in, and all outputs are resampled with one matrix product.
+
+        Outputs match those of running predict() once per `mapping` key: transmittance
+        components and sphalb are left in transmittance units, while rhoatm and the
+        coupled products are converted to radiance before convolution.
+
+        Args:
+            surrogate_data (dict): component key -> input data as numpy or dask array
+            surrogate_data_emulator_wl (dict): component key -> input data at emulator
+                wavelengths (interpolated surrogate)
+            mapping (dict): output product name -> list of component keys. Products
+                with two components are computed as the product of both
+            batch_size (int, optional): Size of batch to process. Defaults to 4096.
+            response_scaler (dict, optional): component key -> scaler. Defaults to None.
+            response_offset (dict, optional): component key -> offset. Defaults to None.
+            resample_dict (dict, optional): dictionary containing resampling parameters. Defaults to None.
+
+        Returns:
+            dict: emulated output per component and coupled product
+        """
+        keys = list(self.weights.keys())
+
+        # Convert the surrogate inputs to tensors only once for all products
+        x_tensor = {}
+        for key in keys:
+            _x = surrogate_data[key]
+            if isinstance(_x, da.Array):
+                _x = _x.compute()
+            x_tensor[key] = torch.as_tensor(_x, dtype=torch.float32)
+        n = x_tensor[keys[0]].shape[0]
+
+        coupled = [name for name, pair in mapping.items() if len(pair) > 1]
+        products = keys + coupled
+        to_rdn = np.array([key == "rhoatm" or key in coupled for key in products])
+
+        if resample_dict is not None:
+            E_to_L = units.E_to_L(
+                resample_dict["emulator_sol_irr"], resample_dict["emulator_coszen"]
+            )
+            H_T = resample_dict["emulator_H"].T
+
+        outdict = {key: [] for key in products}
+        for i in range(0, n, batch_size):
+            batch_slice = slice(i, min(i + batch_size, n))
+
+            stacked = None
+            for _key, key in enumerate(keys):
+                batch = x_tensor[key][batch_slice].to(self.device)
+
+                out = self(batch, key).cpu().numpy()
+                if response_scaler is not None:
+                    out /= response_scaler[key]
+                if response_offset is not None:
+                    out += response_offset[key]
+                out += surrogate_data_emulator_wl[key][batch_slice]
+
+                if stacked is None:
+                    stacked = np.empty((len(products),) + out.shape)
+                stacked[_key] = out
+
+            # Coupled terms are formed in transmittance units at high resolution
+            for _prod, prod in enumerate(coupled, start=len(keys)):
+                first, second = mapping[prod]
+                np.multiply(
+                    stacked[keys.index(first)],
+                    stacked[keys.index(second)],
+                    out=stacked[_prod],
+                )
+
+            if resample_dict is not None:
+                stacked[to_rdn] *= E_to_L
+
+                # Fused resampling of all products: (products * batch, emu_wl) @ H.T
+                nprod, nbatch, nwl = stacked.shape
+                stacked = np.dot(stacked.reshape(-1, nwl), H_T)
+                stacked = stacked.reshape(nprod, nbatch, -1)
+
+            for _prod, prod in enumerate(products):
+                outdict[prod].append(stacked[_prod])
+
+        # Concatenate all outputs from all batches
+        for key in outdict.keys():
+            outdict[key] = np.concatenate(outdict[key], axis=0)
+
+        return outdict
+
 
 class SimulatedModtranRT(RadiativeTransferEngine):
     """
@@ -518,43 +628,34 @@ class SimulatedModtranRT(RadiativeTransferEngine):
                 "rhoatm": ["rhoatm"],
                 "sphalb": ["sphalb"],
             }
-            # for key in aux_rt_quantities:
-            for key in mapping.keys():
-                key_start_time = time.time()
-                Logger.debug(f"Loading emulator {key}")
-
-                emulator = SRTMnetModel(
-                    input_file=self.engine_config.emulator_file,
-                    key=key,
-                    n_cores=self.n_cores,
-                )
-
-                Logger.info(f"Emulating {key}")
-                response_scaler = [aux["response_scaler"][x] for x in mapping[key]]
-                response_offset = [aux["response_offset"][x] for x in mapping[key]]
-
-                lp = emulator.predict(
-                    [sixs[x].values for x in mapping[key]],  # surrogate data (6S)
-                    [
-                        resample[x].values for x in mapping[key]
-                    ],  #  6S data interpolated to emulator wl
-                    batch_size=self.engine_config.emulator_batch_size,
-                    response_scaler=response_scaler,
-                    response_offset=response_offset,
-                    resample_dict=resample_dict,
-                )
-                Logger.debug(f"Cleanup {key}")
-                del emulator
+            Logger.debug("Loading emulator (all 6c components)")
+            emulator = SRTMnetModel(
+                input_file=self.engine_config.emulator_file,
+                key="6c",
+                n_cores=self.n_cores,
+            )
 
-                outshape = (len(self.wl),) + tuple(
-                    len(self.lut_grid[n]) for n in self.lut_grid
-                )
-                for outkey in lp.keys():
-                    self.lut[outkey] = lp[outkey].T.reshape(outshape)
-                self.lut.flush()
+            Logger.info(f"Emulating {', '.join(mapping)}")
+            lp = emulator.predict_coupled(
+                {x: sixs[x].values for x in emulator.component_keys},  # 6S data
+                {
+                    x: resample[x].values for x in emulator.component_keys
+                },  # 6S data interpolated to emulator wl
+                mapping,
+                batch_size=self.engine_config.emulator_batch_size,
+                response_scaler=aux["response_scaler"],
+                response_offset=aux["response_offset"],
+                resample_dict=resample_dict,
+            )
+            Logger.debug("Cleanup emulator")
+            del emulator
 
-                elapsed_time = time.time() - key_start_time
-                Logger.debug(f"Predict time ({key}): {elapsed_time} seconds")
+            outshape = (len(self.wl),) + tuple(
+                len(self.lut_grid[n]) for n in self.lut_grid
+            )
+            for outkey in lp.keys():
+                self.lut[outkey] = lp[outkey].T.reshape(outshape)
+            self.lut.flush()
 
             # predicts.attrs["component_mode"] = "6c"
             elapsed_time = time.time() - total_start_time
@@ -23,6 +23,9 @@ class CustomRT(RadiativeTransferEngine):
     # Sleep a random amount of time up to max this value at the start of each streamSimulation
     max_buffer_time = 0  # Default in RadiativeTransferEngine
 
+    # Enabling requires defining emulate(), and allows the direct_emulation config option
+    _supports_direct_emulation = False  # Default in RadiativeTransferEngine
+
     def __init__(self, engine_config: RadiativeTransferEngineConfig, **kwargs):
         """
         Not required to be defined. Omit the function to use the default RadiativeTransferEngine.__init__
@@ -109,4 +112,26 @@ class CustomRT(RadiativeTransferEngine):
         """
         pass
 
+    def preEmulate(self):
+        """
+        Only used when direct_emulation is enabled. Not required to be defined
+
+        Called once at initialization in place of preSim, makeSim, readSim and postSim, as
+        no LUT is generated in this mode. May return a dictionary similar to preSim of the
+        variables not on the point dimension, such as coszen, solzen, or solar_irr.
+        """
+        pass
+
+    def emulate(self, points: np.array):
+        """
+        Only used when direct_emulation is enabled. Required if _supports_direct_emulation
+
+        Evaluates the emulator for a batch of points, shape (n_points, n_lut_names), during
+        the retrieval itself. Returns a dictionary of luts.Keys.alldim quantities, each of
+        shape (n_points, n_wl). Keys that are not modeled can be omitted and are filled as
+        a LUT file would be. Results are memoized by RadiativeTransferEngine, and the
+        perturbations of a Jacobian are passed in together as a single batch.
+        """
+        pass
+
     # Additional utility functions may be defined on the class and used within any of the above functions
@@ -50,6 +50,14 @@ class Keys:
         "dif-dif": 0,
     }
 
+    # Coupled terms and the pair of transmittances they are the product of
+    coupled = {
+        "dir-dir": ("transm_down_dir", "transm_up_dir"),
+        "dif-dir": ("transm_down_dif", "transm_up_dir"),
+        "dir-dif": ("transm_down_dir", "transm_up_dif"),
+        "dif-dif": ("transm_down_dif", "transm_up_dif"),
+    }
+
 
 class Create:
     def __init__(
@@ -528,12 +536,7 @@ def couple(ds, inplace=True):
     ds: xr.Dataset
         Dataset with coupled terms
     """
-    terms = {
-        "dir-dir": ("transm_down_dir", "transm_up_dir"),
-        "dif-dir": ("transm_down_dif", "transm_up_dir"),
-        "dir-dif": ("transm_down_dir", "transm_up_dif"),
-        "dif-dif": ("transm_down_dif", "transm_up_dif"),
-    }
+    terms = Keys.coupled
 
     # Detect if coupling needs to occur first
     data = ds.get(list(terms))
@@ -926,6 +929,124 @@ def extractGrid(ds: xr.Dataset) -> dict:
     return grid
 
 
+def intervalErrors(data: np.ndarray, vals: np.ndarray, axis: int) -> np.ndarray:
+    """
+    Estimates the linear interpolation error of each grid interval along one dimension
+    using leave-one-out checks: every interior node is predicted from its two neighbors
+    and compared to its simulated value. As linear interpolation error scales with the
+    squared interval width, the leave-one-out error is scaled down to both intervals
+    adjacent to the node
+
+    Parameters
+    ----------
+    data: np.ndarray
+        Unstacked LUT data, with the grid dimensions first
+    vals: np.ndarray
+        Node values along the dimension
+    axis: int
+        Axis of the dimension in `data`
+
+    Returns
+    -------
+    errors: np.ndarray
+        Maximum absolute error per interval, NaN where it cannot be estimated because
+        the dimension has less than three nodes
+    """
+    n = len(vals)
+    errors = np.full(n - 1, np.nan)
+    if n < 3:
+        return errors
+
+    data = np.moveaxis(data, axis, 0)
+    span = vals[2:] - vals[:-2]
+    w = ((vals[1:-1] - vals[:-2]) / span).reshape(-1, *[1] * (data.ndim - 1))
+
+    loo = np.abs(data[1:-1] - ((1 - w) * data[:-2] + w * data[2:]))
+    loo = np.nan_to_num(loo).reshape(n - 2, -1).max(axis=1)
+
+    left = loo * ((vals[1:-1] - vals[:-2]) / span) ** 2
+    right = loo * ((vals[2:] - vals[1:-1]) / span) ** 2
+    errors[:-1] = np.fmax(errors[:-1], left)
+    errors[1:] = np.fmax(errors[1:], right)
+
+    return errors
+
+
+def refineGrid(
+    ds: xr.Dataset,
+    grid: dict,
+    tolerance: float,
+    max_points: int = None,
+    keys: List[str] = None,
+) -> dict:
+    """
+    Refines a LUT grid where its linear interpolation error is high. Errors are
+    estimated per dimension and interval (see intervalErrors), relative to the largest
+    absolute value of each quantity, and a midpoint is inserted in every interval above
+    the tolerance. Intervals whose error cannot be estimated yet are always refined, as
+    their midpoints provide the estimate on the next pass. The grid remains a regular
+    grid with non-uniform spacing, so it is queried as usual by the VectorInterpolator
+
+    Parameters
+    ----------
+    ds: xr.Dataset
+        Populated LUT, stacked along the point dimension
+    grid: dict
+        LUT grid the dataset was simulated on
+    tolerance: float
+        Relative interpolation error above which an interval is refined
+    max_points: int, default=None
+        Total number of grid points not to exceed. Intervals with the highest errors
+        are refined first
+    keys: List[str], default=None
+        Quantities to estimate the error on. Defaults to all of Keys.alldim present
+
+    Returns
+    -------
+    refined: dict
+        Refined grid, equal to the input grid if nothing needs refinement
+    """
+    ds = ds.unstack("point").transpose(*grid, "wl")
+    keys = keys or [key for key in Keys.alldim if key in ds]
+
+    errors = {dim: np.zeros(len(vals) - 1) for dim, vals in grid.items()}
+    for key in keys:
+        data = ds[key].values
+        scale = np.nanmax(np.abs(data)) if np.isfinite(data).any() else 0
+        if not scale:
+            continue
+
+        for axis, (dim, vals) in enumerate(grid.items()):
+            error = intervalErrors(data / scale, np.asarray(vals, dtype=float), axis)
+            errors[dim] = np.where(np.isnan(error), np.inf, np.fmax(errors[dim], error))
+
+    candidates = [
+        (error[i], dim, i)
+        for dim, error in errors.items()
+        for i in np.flatnonzero(error > tolerance)
+    ]
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+    sizes = {dim: len(vals) for dim, vals in grid.items()}
+    refined = {dim: list(vals) for dim, vals in grid.items()}
+    for error, dim, i in candidates:
+        # Keep the precision used by the simulation file names
+        lower, upper = grid[dim][i], grid[dim][i + 1]
+        mid = round((lower + upper) / 2, 4)
+        if mid in (lower, upper):
+            continue
+
+        sizes[dim] += 1
+        if max_points and np.prod(list(sizes.values())) > max_points:
+            sizes[dim] -= 1
+            continue
+
+        Logger.debug(f"Refining {dim} in [{lower}, {upper}] (error: {error:.2e})")
+        refined[dim].append(mid)
+
+    return {dim: sorted(vals) for dim, vals in refined.items()}
+
+
 def saveDataset(file: str, ds: xr.Dataset) -> None:
     """
     Handles saving an xarray.Dataset to a NetCDF file for ISOFIT. Will detect if the
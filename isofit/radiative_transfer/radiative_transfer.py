@@ -143,6 +143,9 @@ class RadiativeTransfer:
 
         self.solar_irr = np.concatenate([RT.solar_irr for RT in self.rt_engines])
 
+        # Inputs and result of the latest drdn_dRT call, shared with drdn_dRTb
+        self.last_drdn_dRT = None
+
     def xa(self):
         """Pull the priors from each of the individual RTs."""
         return self.prior_mean
@@ -165,6 +168,14 @@ class RadiativeTransfer:
 
         return self.pack_arrays(ret)
 
+    def prefetch(self, x_RTs, geom):
+        """Evaluate several RT states at once in each RT engine, so that the following
+        lookups of these states are served from the engine caches. Only engines using
+        direct emulation evaluate anything.
+        """
+        for RT in self.rt_engines:
+            RT.prefetch(x_RTs, geom)
+
     @property
     def coszen(self):
         """
@@ -454,12 +465,14 @@ class RadiativeTransfer:
         We use a numerical approach to approximate dRT with a constant surface
         reflectance. This is a reasonable approx. for the multicomponent surface.
 
-        When using the glint model however, this does not take into account
-        the dependence of the surface reflectance on the atmosphere.
+        Surface reflectances, including the glint terms of the glint model,
+        depend only on the surface state and geometry, so holding them fixed
+        gives the full derivative.
         """
         # perturb each element of the RT state vector (finite difference)
         K_RT = []
         x_RTs_perturb = x_RT + np.eye(len(x_RT)) * eps
+        self.prefetch(x_RTs_perturb, geom)
         for x_RT_perturb in list(x_RTs_perturb):
             (
                 r,
@@ -488,6 +501,28 @@ class RadiativeTransfer:
 
         K_RT = np.array(K_RT).T
 
+        self.last_drdn_dRT = (
+            (geom, *[np.copy(v) for v in (x_RT, rho_dir_dir, rho_dif_dir, Ls)]),
+            K_RT,
+        )
+
+        return K_RT
+
+    def cached_drdn_dRT(self, x_RT, geom, rho_dir_dir, rho_dif_dir, Ls):
+        """Return the result of the latest drdn_dRT call if it was evaluated at
+        the same RT state, geometry and surface, else None.
+        """
+        if self.last_drdn_dRT is None:
+            return None
+
+        (geom_last, *inputs_last), K_RT = self.last_drdn_dRT
+        if geom_last is not geom:
+            return None
+
+        for last, current in zip(inputs_last, (x_RT, rho_dir_dir, rho_dif_dir, Ls)):
+            if not np.array_equal(last, current):
+                return None
+
         return K_RT
 
     def drdn_dRTb(self, x_RT, geom, rho_dir_dir, rho_dif_dir, Ls, rdn):
@@ -510,12 +545,19 @@ class RadiativeTransfer:
         else:
             # unknown parameters modeled as random variables per
             # Rodgers et al (2000) K_b matrix.  We calculate these derivatives
-            # by finite differences
+            # by finite differences. A relative perturbation of H2OSTR is the
+            # absolute one of drdn_dRT scaled by the state, so its column is reused
+            # when K was just evaluated at this state
             Kb_RT = []
             perturb = 1.0 + eps
+            K_RT = self.cached_drdn_dRT(x_RT, geom, rho_dir_dir, rho_dif_dir, Ls)
             for unknown in self.bvec:
                 if unknown == "H2O_ABSCO" and "H2OSTR" in self.statevec_names:
                     i = self.statevec_names.index("H2OSTR")
+                    if K_RT is not None:
+                        Kb_RT.append(K_RT[:, i] * x_RT[i])
+                        continue
+
                     x_RT_perturb = x_RT.copy()
                     x_RT_perturb[i] = x_RT[i] * perturb
                     (
@@ -26,6 +26,7 @@ import os
 import sys
 import time
 import multiprocessing
+from collections import OrderedDict
 from pathlib import Path
 from types import SimpleNamespace
 from typing import Callable
@@ -48,6 +49,9 @@ class RadiativeTransferEngine:
     # Can be set per custom engine
     max_buffer_time = 0
 
+    # Engines that can evaluate their emulator directly (see emulate) set this to True
+    _supports_direct_emulation = False
+
     # These are retrieved from the geom object
     geometry_input_names = [
         "observer_azimuth",
@@ -102,6 +106,22 @@ class RadiativeTransferEngine:
                 "Must provide either a prebuilt LUT file or a LUT grid"
             )
 
+        # Evaluate the emulator in the loop instead of interpolating a LUT
+        self.direct_emulation = engine_config.direct_emulation
+        if self.direct_emulation:
+            if not self._supports_direct_emulation:
+                raise AttributeError(
+                    f"{type(self).__name__} does not support direct emulation"
+                )
+            if lut_grid is None:
+                raise AttributeError(
+                    "Direct emulation requires a LUT grid to define the input dimensions"
+                )
+            # Never read or generate a LUT file in this mode
+            exists = False
+        self.emulator_cache = OrderedDict()
+        self.emulator_cache_size = engine_config.emulator_cache_size
+
         # Save parameters to instance
         self.interpolator_style = interpolator_style
         self.overwrite_interpolator = overwrite_interpolator
@@ -210,6 +230,11 @@ class RadiativeTransferEngine:
                 conv["fwhm"] = ("wl", fwhm)
                 # Exchange the lut with the resampled version
                 self.lut = conv
+        elif self.direct_emulation:
+            Logger.info("Direct emulation enabled, skipping the LUT simulations")
+            self.lut_grid = lut_grid
+            self.lut_names = list(lut_grid)
+            self.lut = self.initDirectEmulation()
         else:
             Logger.info(f"No LUT store found, beginning initialization and simulations")
             # Check if both wavelengths and fwhm are provided for building the LUT
@@ -247,18 +272,13 @@ class RadiativeTransferEngine:
                 )
             else:
                 Logger.info(f"Initializing LUT file")
-                self.lut = luts.Create(
-                    file=self.lut_path,
-                    wl=wl,
-                    grid=self.lut_grid,
-                    attrs={"RT_mode": self.rt_mode},
-                    onedim={"fwhm": fwhm},
-                    compression=engine_config.lut_compression,
-                    complevel=engine_config.lut_complevel,
-                )
+                self.lut = self.createLUT()
 
             # Create and populate a LUT file
-            self.runSimulations()
+            if engine_config.lut_refinement_tolerance is None:
+                self.runSimulations()
+            else:
+                self.refineSimulations()
 
         # Write the NetCDF information to the log file so devs have that info during debugging
         # Have to create a fileobj to capture the text because it doesn't return (prints straight to stdout by default)
@@ -340,6 +360,10 @@ class RadiativeTransferEngine:
         """
         self.luts = {}
 
+        if self.direct_emulation:
+            Logger.debug("Direct emulation enabled, no interpolators to build")
+            return
+
         ds = self.lut.unstack("point")
 
         # Make sure its in expected order, wl at the end
@@ -355,6 +379,112 @@ class RadiativeTransferEngine:
                 version=self.interpolator_style,
             )
 
+    def initDirectEmulation(self) -> xr.Dataset:
+        """
+        Prepares the engine for direct emulation. No simulations are executed; the
+        returned in-memory Dataset only holds the quantities that are not on the point
+        dimension (coszen, solzen, fwhm, solar_irr, ...), as returned by preEmulate()
+
+        Returns:
+            xr.Dataset: stand-in for the LUT, without the point dimension
+        """
+        ds = xr.Dataset(coords={"wl": self.wl}, attrs={"RT_mode": self.rt_mode})
+        for key, fill in luts.Keys.consts.items():
+            ds[key] = fill
+        for key, fill in luts.Keys.onedim.items():
+            ds[key] = ("wl", np.full(len(self.wl), fill))
+        ds["fwhm"] = ("wl", np.asarray(self.fwhm))
+
+        pre = self.preEmulate() or {}
+        Logger.debug(f"pre-emulation data contains keys: {pre.keys()}")
+        for key, value in pre.items():
+            if key in luts.Keys.onedim:
+                ds[key] = ("wl", np.asarray(value))
+            else:
+                ds[key] = value
+
+        return ds
+
+    def preEmulate(self):
+        """
+        This is an optional function that can be defined by a subclass RTE that
+        supports direct emulation. It is called once at initialization in place of
+        preSim() and may return a dict containing any single or non-dimensional
+        variables, as preSim() does
+        """
+        ...
+
+    def emulate(self, points: np.array) -> dict:
+        """
+        Evaluates the emulator directly for a batch of points. Must be defined by
+        subclass RTEs that set _supports_direct_emulation
+
+        Args:
+            points (np.array): conditions to evaluate, shape (n_points, n_lut_names)
+
+        Returns:
+            dict: luts.Keys.alldim quantities, each of shape (n_points, n_wl). Keys
+                that are not modeled should be omitted, they are filled the same way
+                as a LUT file would be
+        """
+        raise NotImplementedError(
+            "This method must be defined by the subclass RTE to support direct emulation"
+        )
+
+    def emulate_points(self, points: np.array) -> list:
+        """
+        Evaluates the emulator for several points using the memoization cache. Points
+        not found in the cache are evaluated together in one batched emulate() call
+
+        Args:
+            points (np.array): conditions to evaluate, shape (n_points, n_lut_names)
+
+        Returns:
+            list: dicts of RT quantities, one per point
+        """
+        keys = [point.tobytes() for point in points]
+
+        missing = {}
+        for i, key in enumerate(keys):
+            if key not in self.emulator_cache:
+                missing.setdefault(key, i)
+
+        if missing:
+            batch = self.emulate(points[list(missing.values())])
+
+            # Complete the quantities the same way a LUT file would be, see luts.couple
+            batch = {
+                key: batch.get(key, fill) for key, fill in luts.Keys.alldim.items()
+            }
+            if not all(np.any(batch[term]) for term in luts.Keys.coupled):
+                for term, (key1, key2) in luts.Keys.coupled.items():
+                    batch[term] = batch[key1] * batch[key2]
+
+            # Constant quantities collapse to a scalar, as with the VectorInterpolator
+            for name, data in batch.items():
+                if np.ndim(data):
+                    first = data.flat[0]
+                    if np.all(data == first) or np.isnan(data).all():
+                        batch[name] = first
+
+            for j, key in enumerate(missing):
+                self.emulator_cache[key] = {
+                    name: data[j] if np.ndim(data) else data
+                    for name, data in batch.items()
+                }
+
+        values = []
+        for key in keys:
+            self.emulator_cache.move_to_end(key)
+            values.append(self.emulator_cache[key])
+
+        # Always keep the latest batch so it can be consumed after a prefetch
+        size = max(self.emulator_cache_size, len(keys))
+        while len(self.emulator_cache) > size:
+            self.emulator_cache.popitem(last=False)
+
+        return values
+
     def preSim(self):
         """
         This is an optional function that can be defined by a subclass RTE to be called
@@ -425,6 +555,25 @@ class RadiativeTransferEngine:
         self.interpolate(point): dict
             ...
         """
+        return self.interpolate(self.build_point(x_RT, geom))
+
+    def build_point(self, x_RT: np.array, geom: Geometry) -> np.array:
+        """
+        Assembles the full point in LUT dimension order from the RT statevector and
+        the geometry
+
+        Parameters
+        ----------
+        x_RT: np.array
+            Radiative-transfer portion of the statevector
+        geom: Geometry
+            Local geometry conditions for lookup
+
+        Returns
+        -------
+        point: np.array
+            Point organized based on lut_names
+        """
         point = np.zeros(self.n_point)
 
         point[self.indices.x_RT] = x_RT
@@ -437,7 +586,23 @@ class RadiativeTransferEngine:
                 180.0 - point[self.indices.convert_observer_zenith]
             )
 
-        return self.interpolate(point)
+        return point
+
+    def prefetch(self, x_RTs: np.array, geom: Geometry) -> None:
+        """
+        Evaluates several RT states at once so that subsequent get() calls for them
+        are served from the cache, e.g. the perturbations of a Jacobian. This is only
+        beneficial for direct emulation; interpolation does not batch
+
+        Parameters
+        ----------
+        x_RTs: np.array
+            Radiative-transfer portions of the statevector, one per row
+        geom: Geometry
+            Local geometry conditions for lookup
+        """
+        if self.direct_emulation:
+            self.emulate_points(np.array([self.build_point(x, geom) for x in x_RTs]))
 
     def interpolate(self, point: np.array) -> dict:
         """
@@ -446,8 +611,11 @@ class RadiativeTransferEngine:
         if self.cached.point.size and (point == self.cached.point).all():
             return self.cached.value
 
-        # Run the interpolators
-        value = {key: lut(point) for key, lut in self.luts.items()}
+        if self.direct_emulation:
+            [value] = self.emulate_points(point[np.newaxis])
+        else:
+            # Run the interpolators
+            value = {key: lut(point) for key, lut in self.luts.items()}
 
         # Update the cache
         self.cached.point = point
@@ -455,10 +623,65 @@ class RadiativeTransferEngine:
 
         return value
 
-    def runSimulations(self) -> None:
+    def createLUT(self) -> luts.Create:
+        """
+        Initializes the LUT file for the current LUT grid
+        """
+        return luts.Create(
+            file=self.lut_path,
+            wl=self.wl,
+            grid=self.lut_grid,
+            attrs={"RT_mode": self.rt_mode},
+            onedim={"fwhm": self.fwhm},
+            compression=self.engine_config.lut_compression,
+            complevel=self.engine_config.lut_complevel,
+        )
+
+    def refineSimulations(self) -> None:
+        """
+        Builds the LUT adaptively: the lut_grid is simulated as a coarse starting grid,
+        then intervals of each dimension with a high interpolation error, as estimated
+        by luts.refineGrid, are refined with midpoints and only the new points are
+        simulated. This repeats until the error is within lut_refinement_tolerance, the
+        lut_refinement_max_points budget is reached, or after lut_refinement_iterations
+        """
+        config = self.engine_config
+        cache = {}
+
+        for iteration in range(config.lut_refinement_iterations + 1):
+            Logger.info(
+                f"LUT refinement pass {iteration}, grid sizes: "
+                + ", ".join(f"{k}={len(v)}" for k, v in self.lut_grid.items())
+            )
+            self.runSimulations(cache=cache)
+
+            if iteration == config.lut_refinement_iterations:
+                break
+
+            grid = luts.refineGrid(
+                self.lut,
+                self.lut_grid,
+                tolerance=config.lut_refinement_tolerance,
+                max_points=config.lut_refinement_max_points,
+            )
+            if grid == {key: list(vals) for key, vals in self.lut_grid.items()}:
+                Logger.info("LUT refinement converged")
+                break
+
+            # Start over on the refined grid, previous points are reused from the cache
+            self.lut.close()
+            self.lut_grid = grid
+            self.points = common.combos(grid.values())
+            self.lut = self.createLUT()
+
+    def runSimulations(self, cache: dict = None) -> None:
         """
         Run all simulations for the LUT grid.
 
+        Args:
+            cache (dict, optional): Previous simulation results per point, as
+                {tuple(point): data}. Cached points are written without being
+                simulated again, and new results are added to it
         """
         Logger.info(f"Running any pre-sim functions")
         pre = self.preSim()
@@ -474,6 +697,17 @@ class RadiativeTransferEngine:
         if not self._disable_makeSim:
             Logger.info("Executing parallel simulations")
 
+            points = self.points
+            if cache is not None:
+                points = [point for point in self.points if tuple(point) not in cache]
+                Logger.info(
+                    f"Reusing {len(self.points) - len(points)} previously simulated points"
+                )
+                for point in self.points:
+                    if tuple(point) in cache:
+                        self.lut.queuePoint(point, cache[tuple(point)])
+                self.lut.flush()
+
             # Place into shared memory space to avoid spilling
             lut_names = ray.put(self.lut_names)
             makeSim = ray.put(self.makeSim)
@@ -492,7 +726,7 @@ class RadiativeTransferEngine:
                     max_buffer_time=buffer_time,
                     rte_configure_and_exit=self.engine_config.rte_configure_and_exit,
                 )
-                for point in self.points
+                for point in points
             ]
 
             if self.engine_config.rte_configure_and_exit:
@@ -521,6 +755,8 @@ class RadiativeTransferEngine:
                     # If a simulation fails then it will return None
                     if ret:
                         self.lut.queuePoint(*ret)
+                        if cache is not None:
+                            cache[tuple(ret[0])] = ret[1]
 
                     if report(len(jobs)):
                         Logger.info("Flushing netCDF to disk")
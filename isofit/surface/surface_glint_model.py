@@ -73,6 +73,7 @@ class GlintModelSurface(MultiComponentSurface):
         self.Sa_inv_glint, self.Sa_inv_sqrt_glint = svd_inv_sqrt(
             Cov / np.mean(np.diag(Cov))
         )
+        self.Sa_inv_glint_components = {}
 
     def xa(self, x_surface, geom):
         """Mean of prior distribution, calculated at state x."""
@@ -92,11 +93,15 @@ class GlintModelSurface(MultiComponentSurface):
         Sa_unnormalized[self.sun_glint_ind, self.sun_glint_ind] = self.sun_glint_sigma
         Sa_unnormalized[self.sky_glint_ind, self.sky_glint_ind] = self.sky_glint_sigma
 
-        # Append normalized Sa inv and sqrt from glint model
-        Sa_inv_normalized = block_diag(Sa_inv_normalized, self.Sa_inv_glint)
-        Sa_inv_sqrt_normalized = block_diag(
-            Sa_inv_sqrt_normalized, self.Sa_inv_sqrt_glint
-        )
+        # Append normalized Sa inv and sqrt from glint model, once per
+        # component
+        ci = self.component(x_surface, geom)
+        if ci not in self.Sa_inv_glint_components:
+            self.Sa_inv_glint_components[ci] = (
+                block_diag(Sa_inv_normalized, self.Sa_inv_glint),
+                block_diag(Sa_inv_sqrt_normalized, self.Sa_inv_sqrt_glint),
+            )
+        Sa_inv_normalized, Sa_inv_sqrt_normalized = self.Sa_inv_glint_components[ci]
 
         return Sa_unnormalized, Sa_inv_normalized, Sa_inv_sqrt_normalized
 
@@ -231,12 +236,42 @@ class GlintModelSurface(MultiComponentSurface):
 
         return drfl
 
-    def drdn_dglint(self, L_tot, drdn_dgdd, s_alb, rho_dif_dir):
-        """Derivative of radiance with respect to
-        the direct and diffuse glint terms"""
-        drdn_dgdsf = (L_tot / ((1.0 - (s_alb * rho_dif_dir)) ** 2)) - drdn_dgdd
-
-        return drdn_dgdd, drdn_dgdsf
+    def drdn_dglint(
+        self,
+        L_tot,
+        s_alb,
+        rho_dir_dir,
+        rho_dif_dir,
+        L_dir_dir,
+        L_dir_dif,
+        L_dif_dir,
+        L_dif_dif,
+        bg_rfl=None,
+    ):
+        """Closed-form derivatives of radiance with respect to the direct
+        and diffuse reflectances, which carry the sun and sky glint terms
+        respectively, following RadiativeTransfer.calc_rdn. With a
+        1-component RT model, all paths see the direct reflectance, so the
+        diffuse one has no effect. A background reflectance replaces the
+        target in the paths that are diffuse on the way up."""
+
+        if not isinstance(L_dir_dir, np.ndarray) or len(L_dir_dir) == 1:
+            drdn_drho_dir = self.drdn_drfl(L_tot, s_alb, rho_dir_dir)
+            return drdn_drho_dir, np.zeros_like(drdn_drho_dir)
+
+        if isinstance(bg_rfl, np.ndarray):
+            return L_dir_dir, L_dif_dir / (1.0 - s_alb * bg_rfl)
+
+        # Diffuse terms are L * rho / (1 - S rho) and the multiple scattering
+        # L_tot * S * rho**2 / (1 - S rho)
+        drdn_drho_dir = L_dir_dir + L_dir_dif
+        drdn_drho_dif = (
+            L_dif_dir
+            + L_dif_dif
+            + L_tot * s_alb * rho_dif_dir * (2.0 - s_alb * rho_dif_dir)
+        ) / ((1.0 - s_alb * rho_dif_dir) ** 2)
+
+        return drdn_drho_dir, drdn_drho_dif
 
     def drdn_dsurface(
         self,
@@ -250,6 +285,8 @@ class GlintModelSurface(MultiComponentSurface):
         L_dir_dif=None,
         L_dif_dir=None,
         L_dif_dif=None,
+        rho_dir_dir=None,
+        bg_rfl=None,
     ):
         """Derivative of radiance with respect to
         full surface vector"""
@@ -257,25 +294,32 @@ class GlintModelSurface(MultiComponentSurface):
         # Dimensions should be (len(RT.wl), len(x_surface))
         # which is correctly handled by the instrument resampling
         drdn_dsurface = np.zeros(drfl_dsurface.shape)
-        drdn_drfl = self.drdn_drfl(L_tot, s_alb, rho_dif_dir)
-        drdn_dsurface[:, : self.n_wl] = np.multiply(
-            drdn_drfl[:, np.newaxis], drfl_dsurface[:, : self.n_wl]
-        )
 
         # Glint derivatives
-        drdn_dgdd, drdn_dgdsf = self.drdn_dglint(
+        drdn_drho_dir, drdn_drho_dif = self.drdn_dglint(
             L_tot=L_tot,
-            drdn_dgdd=(L_dir_dir + L_dir_dif),
             s_alb=s_alb,
+            rho_dir_dir=rho_dif_dir if rho_dir_dir is None else rho_dir_dir,
             rho_dif_dir=rho_dif_dir,
+            L_dir_dir=L_dir_dir,
+            L_dir_dif=L_dir_dif,
+            L_dif_dir=L_dif_dir,
+            L_dif_dif=L_dif_dif,
+            bg_rfl=bg_rfl,
+        )
+
+        # Lambertian reflectance enters both the direct and diffuse terms
+        drdn_dsurface[:, : self.n_wl] = np.multiply(
+            (drdn_drho_dir + drdn_drho_dif)[:, np.newaxis],
+            drfl_dsurface[:, : self.n_wl],
         )
 
-        # Store the glint derivatives as last two rows in drdn_drfl
+        # Sun glint only adds to the direct reflectance, sky glint to the diffuse
         drdn_dsurface[:, self.sun_glint_ind] = (
-            drdn_dgdd * drfl_dsurface[:, self.sun_glint_ind]
+            drdn_drho_dir * drfl_dsurface[:, self.sun_glint_ind]
         )
         drdn_dsurface[:, self.sky_glint_ind] = (
-            drdn_dgdsf * drfl_dsurface[:, self.sky_glint_ind]
+            drdn_drho_dif * drfl_dsurface[:, self.sky_glint_ind]
         )
 
         # Get the derivative w.r.t. surface emission
@@ -58,7 +58,7 @@ class LUTSurface(Surface):
         super().__init__(full_config)
 
         # Models are stored as dictionaries in .mat format
-        model_dict = loadmat(config.surface_file)
+        model_dict = self.model_dict
         self.lut_grid = [grid[0] for grid in model_dict["grids"][0]]
         self.lut_names = [name.strip() for name in model_dict["lut_names"]]
         self.statevec_names = [sv.strip() for sv in model_dict["statevec_names"]]
@@ -75,6 +75,19 @@ class LUTSurface(Surface):
         self.idx_lut = np.arange(self.n_state)
         self.idx_lamb = np.empty(shape=0)
 
+        # LUT dimension of each state vector element and of the geometry
+        self.lut_idx_state = np.array(
+            [self.lut_names.index(name) for name in self.statevec_names], dtype=int
+        )
+        self.lut_idx_geom = {
+            key: self.lut_names.index(name)
+            for key, name in (
+                ("solar_zenith", "SOLZEN"),
+                ("observer_zenith", "VIEWZEN"),
+            )
+            if name in self.lut_names
+        }
+
         # Cache some important computations
         Cov = np.diag(self.sigma**2)
         Cov_normalized = Cov / np.mean(np.diag(Cov))
@@ -140,26 +153,55 @@ class LUTSurface(Surface):
 
         return rho_dir_dir, rho_dif_dir
 
-    def calc_lamb(self, x_surface, geom):
-        """Lambertian reflectance.  Be sure to incorporate BRDF-related
-        LUT dimensions such as solar and view zenith."""
+    def lut_points(self, x_surfaces, geoms):
+        """LUT points for one or more surface states. geoms is a single
+        Geometry shared by all states, or one Geometry per state."""
+
+        x_surfaces = np.atleast_2d(x_surfaces)
+        if not isinstance(geoms, (list, tuple, np.ndarray)):
+            geoms = [geoms] * len(x_surfaces)
 
-        point = np.zeros(self.n_lut)
+        points = np.zeros((len(x_surfaces), self.n_lut))
+        points[:, self.lut_idx_state] = x_surfaces[:, : self.n_state]
 
-        for v, name in zip(x_surface, self.statevec_names):
-            point[self.lut_names.index(name)] = v
+        for key, ind in self.lut_idx_geom.items():
+            points[:, ind] = [getattr(geom, key) for geom in geoms]
 
-        if "SOLZEN" in self.lut_names:
-            solzen_ind = self.lut_names.index("SOLZEN")
-            point[solzen_ind] = geom.solar_zenith
+        return points
 
-        if "VIEWZEN" in self.lut_names:
-            viewzen_ind = self.lut_names.index("VIEWZEN")
-            point[viewzen_ind] = geom.observer_zenith
+    def calc_lamb_batch(self, x_surfaces, geoms, gradient=False):
+        """Lambertian reflectance of several surface states in one lookup.
+
+        Inputs:
+        x_surfaces : np.ndarray
+            (N, n_state) surface portions of the statevector
+        geoms : Geometry or list of Geometry
+            Shared geometry, or one per state
+        gradient : bool
+            Also return the derivatives with respect to the state
+
+        Outputs:
+        lamb : np.ndarray
+            (N, n_wl) reflectances
+        dlamb : np.ndarray
+            (N, n_wl, n_state) partial derivatives, if gradient
+        """
 
-        lamb = self.itp(point)
+        points = self.lut_points(x_surfaces, geoms)
 
-        return lamb
+        if not gradient:
+            return self.itp.multilinear_batch(points)
+
+        lamb, grads = self.itp.multilinear_batch(points, gradient=True)
+        dlamb = grads[:, self.lut_idx_state].transpose(0, 2, 1)
+
+        return lamb, dlamb
+
+    def calc_lamb(self, x_surface, geom):
+        """Lambertian reflectance.  Be sure to incorporate BRDF-related
+        LUT dimensions such as solar and view zenith."""
+
+        return self.calc_lamb_batch(x_surface, geom)[0]
 
     def drfl_dsurface(self, x_surface, geom):
         """Partial derivative of reflectance with respect to state vector,
@@ -169,23 +211,11 @@ class LUTSurface(Surface):
 
     def dlamb_dsurface(self, x_surface, geom):
         """Partial derivative of Lambertian reflectance with respect to
-        state vector, calculated at x_surface.  We calculate the
-        reflectance with multilinear interpolation so the finite
-        difference derivative is exact."""
-
-        eps = 1e-6
-        base = self.calc_lamb(x_surface, geom)
-        dlamb = []
-
-        for xi in range(self.n_state):
-            x_new = x_surface.copy()
-            x_new[xi] = x_new[xi] + eps
-            perturbed = self.calc_lamb(x_new, geom)
-            dlamb.append((perturbed - base) / eps)
-
-        dlamb = np.array(dlamb).T
+        state vector, calculated at x_surface.  The reflectance is a
+        multilinear interpolation, so its derivative is taken exactly
+        from the same lookup."""
 
-        return dlamb
+        return self.calc_lamb_batch(x_surface, geom, gradient=True)[1][0]
 
     def drdn_drfl(self, L_tot, s_alb, rho_dif_dir):
         """Partial derivative of radiance with respect to
@@ -224,6 +254,8 @@ class LUTSurface(Surface):
         L_dir_dif=None,
         L_dif_dir=None,
         L_dif_dif=None,
+        rho_dir_dir=None,
+        bg_rfl=None,
     ):
         """Derivative of radiance with respect to
         full surface vector"""
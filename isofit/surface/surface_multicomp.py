@@ -56,10 +56,13 @@ class MultiComponentSurface(Surface):
         self.normalize = self.model_dict["normalize"]
         if self.normalize == "Euclidean":
             self.norm = lambda r: norm(r)
+            self.norm_rows = lambda R: np.linalg.norm(R, axis=-1)
         elif self.normalize == "RMS":
             self.norm = lambda r: np.sqrt(np.mean(pow(r, 2)))
+            self.norm_rows = lambda R: np.sqrt(np.mean(pow(R, 2), axis=-1))
         elif self.normalize == "None":
             self.norm = lambda r: 1.0
+            self.norm_rows = lambda R: np.ones(R.shape[:-1])
         else:
             raise ValueError("Unrecognized Normalization: %s\n" % self.normalize)
 
@@ -114,6 +117,15 @@ class MultiComponentSurface(Surface):
             self.Sa_inv_normalized.append(Cinv_normalized)
             self.Sa_inv_sqrt_normalized.append(Cinv_sqrt_normalized)
 
+        # Component means at the reference wavelengths as one matrix, along
+        # with what the selection metrics need of them
+        self.mus_ref = np.array(self.mus)
+        self.mus_ref_sq = np.sum(self.mus_ref**2, axis=1)
+        self.mus_ref_grad = self.spectral_gradient(self.mus_ref)
+
+        # The latest component selection, shared by xa and Sa at the same state
+        self.last_selection = None
+
     def component(self, x, geom):
         """We pick a surface model component using a distance metric.
 
@@ -124,43 +136,93 @@ class MultiComponentSurface(Surface):
         geometry object.
         """
 
+        return self.selection(x, geom)[0]
+
+    def selection(self, x_surface, geom):
+        """The component selected at state x_surface, see component, and the
+        norm of its reference reflectance. The latest selection is memoized,
+        as xa and Sa are evaluated at the same state."""
+
+        # The selection also depends on what the geometry preserved of the
+        # initial solution
+        preserved = (
+            getattr(geom, "surf_cmp_init", None),
+            hasattr(geom, "x_surf_init"),
+        )
+        last = self.last_selection
+        if (
+            last is not None
+            and last[0] is geom
+            and last[2] == preserved
+            and np.array_equal(last[1], x_surface)
+        ):
+            return last[3]
+
+        lamb_ref = self.calc_lamb(x_surface, geom)[self.idx_ref]
+        lamb_norm = self.norm(lamb_ref)
+
         if self.n_comp <= 1:
-            return 0
+            ci = 0
         elif hasattr(geom, "surf_cmp_init"):
-            return geom.surf_cmp_init
-        elif self.select_on_init and hasattr(geom, "x_surf_init"):
-            x_surface = geom.x_surf_init
+            ci = geom.surf_cmp_init
         else:
-            x_surface = x
+            if self.select_on_init and hasattr(geom, "x_surf_init"):
+                lamb_ref = self.calc_lamb(geom.x_surf_init, geom)[self.idx_ref]
+                lamb_ref = lamb_ref / self.norm(lamb_ref)
+            else:
+                lamb_ref = lamb_ref / lamb_norm
+
+            ci = self.closest_components(lamb_ref[np.newaxis, :], normalized=True)[0]
+
+            if self.select_on_init and hasattr(geom, "x_surf_init"):
+                geom.surf_cmp_init = ci
+
+        preserved = (
+            getattr(geom, "surf_cmp_init", None),
+            hasattr(geom, "x_surf_init"),
+        )
+        self.last_selection = (
+            geom,
+            np.array(x_surface, copy=True),
+            preserved,
+            (ci, lamb_norm),
+        )
+
+        return ci, lamb_norm
+
+    def closest_components(self, lamb_refs, normalized=False):
+        """Select the closest component for each of N spectra at once.
 
-        # Get the (possibly normalized) reflectance
-        lamb = self.calc_lamb(x_surface, geom)
-        lamb_ref = lamb[self.idx_ref]
-        lamb_ref = lamb_ref / self.norm(lamb_ref)
+        Args:
+            lamb_refs: (N, n_ref) reflectances at the reference wavelengths
+            normalized: whether lamb_refs are already normalized
+
+        Returns:
+            np.array: index of the closest component of each spectrum
+        """
+
+        lamb_refs = np.atleast_2d(lamb_refs)
+        if not normalized:
+            lamb_refs = lamb_refs / self.norm_rows(lamb_refs)[:, np.newaxis]
 
         # Only support euclidean distance comparrison for now
         if self.selection_metric == "SGA":
-            mds = self.spectral_gradient_angle(lamb_ref, np.array(self.mus))
+            mds = self.spectral_angle_distances(
+                self.spectral_gradient(lamb_refs), self.mus_ref_grad
+            )
         elif self.selection_metric == "Euclidean":
-            mds = self.euclidean_distance(
-                lamb_ref,
-                np.array(self.mus),
+            # |l - mu|^2 = |l|^2 - 2 l.mu + |mu|^2, as one matrix product
+            mds = (
+                np.sum(lamb_refs**2, axis=1)[:, np.newaxis]
+                - 2 * lamb_refs @ self.mus_ref.T
+                + self.mus_ref_sq[np.newaxis, :]
             )
         else:
             raise ValueError(
                 "Surface component selection metric not valid:", self.selection_metric
             )
 
-        closest = np.argmin(mds)
-
-        if (
-            self.select_on_init
-            and hasattr(geom, "x_surf_init")
-            and (not hasattr(geom, "surf_cmp_init"))
-        ):
-            geom.surf_cmp_init = closest
-
-        return closest
+        return np.argmin(mds, axis=1)
 
     def xa(self, x_surface, geom):
         """Mean of prior distribution, calculated at state x. We find
@@ -168,12 +230,10 @@ class MultiComponentSurface(Surface):
         normalize the result for the calling function. This always uses the
         Lambertian (non-specular) version of the surface reflectance."""
 
-        lamb = self.calc_lamb(x_surface, geom)
-        lamb_ref = lamb[self.idx_ref]
         mu = np.zeros(self.n_state)
-        ci = self.component(x_surface, geom)
+        ci, lamb_norm = self.selection(x_surface, geom)
         lamb_mu = self.component_means[ci]
-        lamb_mu = lamb_mu * self.norm(lamb_ref)
+        lamb_mu = lamb_mu * lamb_norm
         mu[self.idx_lamb] = lamb_mu
 
         return mu
@@ -183,11 +243,9 @@ class MultiComponentSurface(Surface):
         the covariance in a normalized space (normalizing by z) and then un-
         normalize the result for the calling function."""
 
-        lamb = self.calc_lamb(x_surface, geom)
-        lamb_ref = lamb[self.idx_ref]
-        ci = self.component(x_surface, geom)
+        ci, lamb_norm = self.selection(x_surface, geom)
         Cov = self.component_covs[ci]
-        Sa_unnormalized = Cov * (self.norm(lamb_ref) ** 2)
+        Sa_unnormalized = Cov * (lamb_norm**2)
 
         # select the Sa inverse from the list of components
         Sa_inv_normalized = self.Sa_inv_normalized[ci]
@@ -309,6 +367,8 @@ class MultiComponentSurface(Surface):
         L_dir_dif=None,
         L_dif_dir=None,
         L_dif_dif=None,
+        rho_dir_dir=None,
+        bg_rfl=None,
     ):
         """Derivative of radiance with respect to
         full surface vector"""
@@ -374,13 +434,22 @@ class MultiComponentSurface(Surface):
 
         return np.arccos(np.clip(cos_theta, -1.0, 1.0))
 
-    def spectral_gradient_angle(self, lamb_ref, mus):
-        def gradient(wl, val, sigma=2):
-            val = gaussian_filter1d(val, sigma=sigma)
-            return np.gradient(val, wl)
+    @staticmethod
+    def spectral_angle_distances(lamb_refs, mus):
+        """Spectral angles between each of N spectra and each of the mus."""
+        cos_theta = (lamb_refs @ mus.T) / np.outer(
+            np.linalg.norm(lamb_refs, axis=1), np.linalg.norm(mus, axis=1)
+        )
+
+        return np.arccos(np.clip(cos_theta, -1.0, 1.0))
 
-        grads = np.array([gradient(self.wl[self.idx_ref], mu) for mu in mus])
+    def spectral_gradient(self, vals, sigma=2):
+        """Gradient of smoothed spectra at the reference wavelengths, along the
+        last axis."""
+        vals = gaussian_filter1d(vals, sigma=sigma, axis=-1)
+        return np.gradient(vals, self.wl[self.idx_ref], axis=-1)
 
-        return self.spectral_angle_distance(
-            gradient(self.wl[self.idx_ref], lamb_ref), grads
-        )
+    def spectral_gradient_angle(self, lamb_ref, mus):
+        grads = self.spectral_gradient(np.asarray(mus))
+
+        return self.spectral_angle_distance(self.spectral_gradient(lamb_ref), grads)
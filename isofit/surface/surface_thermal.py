@@ -57,6 +57,7 @@ class ThermalSurface(MultiComponentSurface):
         self.Sa_inv_thermal, self.Sa_inv_sqrt_thermal = svd_inv_sqrt(
             Cov / np.mean(np.diag(Cov))
         )
+        self.Sa_inv_thermal_components = {}
 
     def xa(self, x_surface, geom):
         """Mean of prior distribution, calculated at state x.  We find
@@ -78,11 +79,15 @@ class ThermalSurface(MultiComponentSurface):
             self.surface_T_prior_sigma_degK**2
         )
 
-        # Append normalized Sa inv and sqrt from thermal model
-        Sa_inv_normalized = block_diag(Sa_inv_normalized, self.Sa_inv_thermal)
-        Sa_inv_sqrt_normalized = block_diag(
-            Sa_inv_sqrt_normalized, self.Sa_inv_sqrt_thermal
-        )
+        # Append normalized Sa inv and sqrt from thermal model, once per
+        # component
+        ci = self.component(x_surface, geom)
+        if ci not in self.Sa_inv_thermal_components:
+            self.Sa_inv_thermal_components[ci] = (
+                block_diag(Sa_inv_normalized, self.Sa_inv_thermal),
+                block_diag(Sa_inv_sqrt_normalized, self.Sa_inv_sqrt_thermal),
+            )
+        Sa_inv_normalized, Sa_inv_sqrt_normalized = self.Sa_inv_thermal_components[ci]
 
         return Sa_unnormalized, Sa_inv_normalized, Sa_inv_sqrt_normalized
 
@@ -140,6 +145,8 @@ class ThermalSurface(MultiComponentSurface):
         L_dir_dif=None,
         L_dif_dir=None,
         L_dif_dif=None,
+        rho_dir_dir=None,
+        bg_rfl=None,
     ):
         """Derivative of radiance with respect to
         full surface vector"""
@@ -9,6 +9,7 @@ from isofit.core.common import (
     combos,
     eps,
     expand_path,
+    fill_spectral_gaps,
     get_absorption,
     load_spectrum,
     load_wavelen,
@@ -61,6 +62,25 @@ def test_spectral_response_function():
     assert abs(srf[1] - 0.817574476) < 0.0000001
 
 
+def test_fill_spectral_gaps():
+    rng = np.random.default_rng(0)
+    wl = np.linspace(400, 2500, 30)
+    spectra = rng.random((4, 30))
+    spectra[0, [0, 1, 7, 29]] = np.nan
+    spectra[1, 3:9] = np.nan
+    spectra[3, 1:] = np.nan
+
+    filled = fill_spectral_gaps(wl, spectra)
+    for x, y in zip(spectra[:2], filled[:2]):
+        ok = ~np.isnan(x)
+        interp = scipy.interpolate.interp1d(wl[ok], x[ok], fill_value="extrapolate")
+        assert np.allclose(y, interp(wl))
+
+    # Complete spectra, and those with a single value, are unchanged
+    assert np.array_equal(filled[2], spectra[2])
+    assert np.array_equal(np.isnan(filled[3]), np.isnan(spectra[3]))
+
+
 def test_load_spectrum():
     file = StringIO("0.123 0.132 0.426 \n 0.234 0.234 0.132 \n 0.123 0.423 0.435")
     spectrum_new, wavelength_new = load_spectrum(file)
@@ -177,3 +197,13 @@ def test_interpolators():
         res_orig.flatten(), res_new.flatten()
     )
     assert rvalue**2 > 1 - 1e-6
+
+    # Batched lookup agrees, and its gradient matches finite differences
+    res_batch, grads = v_new.multilinear_batch(input_test, gradient=True)
+    assert np.allclose(res_batch, res_orig)
+
+    for _n in range(len(grid_input)):
+        shifted = input_test.copy()
+        shifted[:, _n] += 1e-6
+        fd = (v_new.multilinear_batch(shifted) - res_batch) / 1e-6
+        assert np.allclose(grads[:, _n], fd, atol=1e-4)
@@ -0,0 +1,30 @@
+import numpy as np
+
+from isofit.core.covariance import Covariance
+
+
+def test_covariance():
+    rng = np.random.default_rng(0)
+    diag = rng.random(20) + 0.1
+    U = rng.standard_normal((20, 2))
+    single = np.diag(rng.random(20))
+
+    C = Covariance(diag).add_low_rank(np.hstack([single, U]))
+    dense = np.diag(diag) + single**2 + U @ U.T
+
+    # Columns with a single entry fold into the diagonal
+    assert C.U.shape == (20, 2)
+    assert np.allclose(C.full(), dense)
+
+    Cinv, Cinv_sqrt = C.inv_sqrt()
+    assert np.allclose(Cinv, np.linalg.inv(dense))
+    assert np.allclose(Cinv_sqrt @ Cinv_sqrt.T, Cinv)
+    assert np.allclose(C.solve(U), np.linalg.solve(dense, U))
+
+    idx = np.arange(5, 15)
+    assert np.allclose(C.window(idx).full(), dense[np.ix_(idx, idx)])
+
+    # Dense terms fall back to a full decomposition
+    C = C + np.eye(20)
+    assert not C.diagonal_base
+    assert np.allclose(C.inv(), np.linalg.inv(dense + np.eye(20)))
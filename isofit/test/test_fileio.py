@@ -1,6 +1,19 @@
+import time
+from types import SimpleNamespace
+
 import numpy as np
+from scipy.interpolate import interp1d
+from spectral.io import envi
 
-from isofit.core.fileio import max_frames_size, typemap
+from isofit.configs import configs
+from isofit.core.fileio import (
+    IO,
+    CompletionMask,
+    RowPrefetcher,
+    SpectrumFile,
+    max_frames_size,
+    typemap,
+)
 
 
 def test_typemap():
@@ -9,3 +22,194 @@ def test_typemap():
 
 def test_max_frames_size():
     assert max_frames_size == 100
+
+
+def test_background_writer(tmp_path):
+    fname = str(tmp_path / "out")
+    kwargs = dict(
+        write=True,
+        n_rows=6,
+        n_cols=3,
+        n_bands=2,
+        interleave="bip",
+        wavelengths=[1.0, 2.0],
+        fwhm=[1.0, 1.0],
+        band_names=["a", "b"],
+        max_writer_queue=1,
+    )
+
+    # Two writers share the file, like parallel workers
+    files = [SpectrumFile(fname, **kwargs), SpectrumFile(fname, **kwargs)]
+
+    # Rows that are only read are not dirty and are not written back
+    files[0].read_spectrum(5, 0)
+    for row in [0, 1, 2, 4]:
+        for col in range(3):
+            files[col % 2].write_spectrum(row, col, np.array([row, col]))
+        for fi in files:
+            fi.flush_buffers()
+    for fi in files:
+        fi.sync()
+
+    metrics = files[0].writer_metrics()
+    assert metrics["rows"] == 4 and metrics["depth"] == 0
+
+    data = envi.open(fname + ".hdr").open_memmap(interleave="bip")
+    assert np.array_equal(data[4, :, 0], [4, 4, 4])
+    assert np.array_equal(data[2, :, 1], [0, 1, 2])
+    assert np.all(data[3] == 0)
+
+    for fi in files:
+        fi.close()
+
+
+def test_row_prefetcher(tmp_path):
+    fname = str(tmp_path / "in")
+    meta = {"lines": 8, "samples": 3, "bands": 2, "interleave": "bip", "data type": 4}
+    img = envi.create_image(fname + ".hdr", meta, ext="", force=True)
+    data = np.random.random((8, 3, 2)).astype(np.float32)
+    img.open_memmap(interleave="bip", writable=True)[:] = data
+
+    fi = SpectrumFile(fname)
+    rows = [5, 5, 1, 7, 2]
+
+    # Budget for two rows ahead
+    fi.prefetcher = RowPrefetcher([fi], rows, budget=2 * 3 * 2 * 4)
+    while len(fi.prefetcher.ready) < 2:
+        time.sleep(0.01)
+    assert fi.prefetcher.max_rows == 2 and list(fi.prefetcher.ready) == [5, 1]
+
+    for row in rows:
+        assert np.array_equal(fi.read_spectrum(row, 2), data[row, 2])
+    assert fi.prefetcher.metrics["hits"] >= 2
+
+    # Input maps persist across flushes
+    memmap = fi.memmap
+    fi.flush_buffers()
+    assert fi.memmap is memmap and not fi.frames
+
+    fi.prefetcher.stop()
+
+
+def test_completion_mask(tmp_path):
+    fname = str(tmp_path / "out_complete")
+    mask = CompletionMask(fname, n_rows=4, n_cols=3)
+    mask.mark(np.array([[0, 1], [2, 2]]))
+
+    # Resuming keeps the marks, which workers read without writing
+    mask = CompletionMask(fname, n_rows=4, n_cols=3, resume=True)
+    assert mask.resumed and mask.count() == 2
+    reader = CompletionMask(fname)
+    assert list(reader.done(np.array([[0, 1], [0, 2], [2, 2]]))) == [1, 0, 1]
+
+    # A new run, or a mask of another size, starts over
+    assert CompletionMask(fname, n_rows=4, n_cols=3).count() == 0
+    mask.mark(np.array([[3, 0]]))
+    mask = CompletionMask(fname, n_rows=5, n_cols=3, resume=True)
+    assert not mask.resumed and mask.count() == 0
+
+
+def test_resumable_outputs():
+    """Only outputs that keep their contents when reopened can resume"""
+    outputs = {"estimated_state_file": "state", "estimated_reflectance_file": "rfl"}
+    assert IO.resumable_outputs(configs.Config({"output": outputs}))
+
+    for suffix in (".zarr", ".nc"):
+        outputs["estimated_reflectance_file"] = "rfl" + suffix
+        config = configs.Config({"output": outputs})
+        assert IO.resumable_outputs(config) == (suffix == ".zarr")
+
+
+def test_zarr_output(tmp_path):
+    fname = str(tmp_path / "out.zarr")
+    kwargs = dict(
+        write=True,
+        n_rows=4,
+        n_cols=3,
+        n_bands=2,
+        interleave="bip",
+        wavelengths=np.array([1.0, 2.0]),
+        fwhm=[1.0, 1.0],
+        band_names=["a", "b"],
+    )
+
+    # Writers of different pixels of the same chunks do not overwrite each other
+    files = [SpectrumFile(fname, **kwargs), SpectrumFile(fname, **kwargs)]
+    for row in range(3):
+        for col in range(3):
+            files[(row + col) % 2].write_spectrum(row, col, np.array([row, col]))
+    for fi in files:
+        fi.close()
+
+    fi = SpectrumFile(fname)
+    assert fi.format == "ZARR" and fi.memmap.chunks == (1, 3, 2)
+    assert fi.meta["band names"] == ["a", "b"]
+    assert np.array_equal(fi.read_spectrum(2, 1), [2, 1])
+    assert np.array_equal(fi.memmap[:3, :, 1], np.tile(np.arange(3), (3, 1)))
+    assert np.all(fi.memmap[3] == 0)
+
+
+def test_screen_pixels(tmp_path, monkeypatch):
+    """Screening keeps the pixels, and gives the measurements, of the
+    per-pixel checks and gap filling"""
+    monkeypatch.setattr(IO, "load_esd", staticmethod(lambda file=None: None))
+    rng = np.random.default_rng(0)
+    wl = np.linspace(400, 2500, 20)
+    rdn = (5 + rng.random((3, 4, 20))).astype(np.float32)
+    obs = (1 + rng.random((3, 4, 11))).astype(np.float32)
+
+    obs[0, 0] = -9999  # Flagged input
+    rdn[0, 1] = -60  # No measurement
+    rdn[0, 2, :6] = np.nan  # More than 25% gaps
+    rdn[1, 0, [0, 5, 6, 19]] = np.nan  # Filled gaps, including the edges
+
+    inputs = {}
+    for name, data in (("measured_radiance_file", rdn), ("obs_file", obs)):
+        inputs[name] = str(tmp_path / name)
+        envi.save_image(
+            inputs[name] + ".hdr",
+            data,
+            ext="",
+            interleave="bip",
+            metadata={"data ignore value": -9999},
+        )
+    engine = {"engine_name": "sRTMnet", "lut_path": str(tmp_path / "lut.nc")}
+    config = configs.Config(
+        {
+            "input": inputs,
+            "forward_model": {
+                "radiative_transfer": {
+                    "lut_grid": {"AOT550": [0.1, 0.2]},
+                    "radiative_transfer_engines": {"vswir": engine},
+                }
+            },
+        }
+    )
+    fm = SimpleNamespace(
+        instrument=SimpleNamespace(wl_init=wl, fwhm_init=wl * 0 + 10),
+        statevec=["RFL"],
+    )
+    io = IO(config, fm)
+
+    indices = np.argwhere(np.ones((3, 4)))
+    screened = io.screen_pixels(indices)
+
+    expected = {}
+    for row, col in indices:
+        data = io.get_components_at_index(row, col)
+        if data is None:
+            continue
+        meas = data.meas
+        gaps = np.isnan(meas)
+        if gaps.sum() > 0.25 * len(meas):
+            continue
+        if gaps.any():
+            meas = interp1d(wl[~gaps], meas[~gaps], fill_value="extrapolate")(wl)
+        expected[(row, col)] = meas
+
+    assert [tuple(index) for index in screened] == list(expected)
+    assert (0, 0) not in expected and (0, 1) not in expected
+    assert (0, 2) not in expected and (1, 0) in expected
+    for row, col in screened:
+        meas = io.get_components_at_index(row, col, screened=True).meas
+        assert np.allclose(meas, expected[(row, col)])
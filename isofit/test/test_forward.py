@@ -1,5 +1,121 @@
+from functools import partial
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from scipy.linalg import block_diag
+
+from isofit.configs import configs
+from isofit.core import forward
+from isofit.core.forward import ForwardModel
+from isofit.core.geometry import Geometry
 from isofit.inversion.inverse import error_code
+from isofit.surface.surface_glint_model import GlintModelSurface
+from isofit.surface.surface_multicomp import MultiComponentSurface
+from isofit.surface.surface_thermal import ThermalSurface
+from isofit.test.test_surface import spectra, surface_file
 
 
 def test_error_code():
     assert error_code == -1
+
+
+def block(n, rng):
+    """A random covariance block with its normalized inverses"""
+    A = rng.standard_normal((n, n))
+    Cov = A @ A.T + np.eye(n)
+    Cinv = np.linalg.inv(Cov / np.mean(np.diag(Cov)))
+    w, V = np.linalg.eigh(Cinv)
+    return SimpleNamespace(
+        Sa=lambda: Cov,
+        Sa_inv_normalized=Cinv,
+        Sa_inv_sqrt_normalized=V @ np.diag(np.sqrt(w)) @ V.T,
+    )
+
+
+def uncached_Sa(fm, x, geom):
+    """Sa assembled without any of the surface or forward model caches"""
+    surface = fm.surface
+    Sa_surface, Sa_surf_inv_norm, Sa_surf_inv_sqrt_norm = MultiComponentSurface.Sa(
+        surface, x[fm.idx_surface], geom
+    )
+    if isinstance(surface, GlintModelSurface):
+        i, j = surface.sky_glint_ind, surface.sun_glint_ind
+        Sa_surface[i, i] = surface.sky_glint_sigma
+        Sa_surface[j, j] = surface.sun_glint_sigma
+        Sa_surf_inv_norm = block_diag(Sa_surf_inv_norm, surface.Sa_inv_glint)
+        Sa_surf_inv_sqrt_norm = block_diag(
+            Sa_surf_inv_sqrt_norm, surface.Sa_inv_sqrt_glint
+        )
+    elif isinstance(surface, ThermalSurface):
+        i = surface.surf_temp_ind
+        Sa_surface[i, i] = surface.surface_T_prior_sigma_degK**2
+        Sa_surf_inv_norm = block_diag(Sa_surf_inv_norm, surface.Sa_inv_thermal)
+        Sa_surf_inv_sqrt_norm = block_diag(
+            Sa_surf_inv_sqrt_norm, surface.Sa_inv_sqrt_thermal
+        )
+
+    Sa_RT, Sa_instrument = fm.RT.Sa(), fm.instrument.Sa()
+    scale_surf = np.sqrt(np.mean(np.diag(Sa_surface)))
+    scale_RT = np.sqrt(np.mean(np.diag(Sa_RT)))
+    scale_inst = np.sqrt(np.mean(np.diag(Sa_instrument)))
+
+    return (
+        block_diag(Sa_surface, Sa_RT, Sa_instrument),
+        block_diag(
+            Sa_surf_inv_norm / scale_surf**2,
+            fm.RT.Sa_inv_normalized / scale_RT**2,
+            fm.instrument.Sa_inv_normalized / scale_inst**2,
+        ),
+        block_diag(
+            Sa_surf_inv_sqrt_norm / scale_surf,
+            fm.RT.Sa_inv_sqrt_normalized / scale_RT,
+            fm.instrument.Sa_inv_sqrt_normalized / scale_inst,
+        ),
+    )
+
+
+@pytest.mark.parametrize(
+    "Surface", [MultiComponentSurface, GlintModelSurface, ThermalSurface]
+)
+@pytest.mark.parametrize("max_templates", [64, 1])
+def test_Sa(tmp_path, monkeypatch, Surface, max_templates):
+    """Sa matches the uncached assembly across component switches, also when
+    templates are evicted"""
+    monkeypatch.setattr(forward, "max_Sa_templates", max_templates)
+
+    config = configs.Config(
+        {
+            "forward_model": {
+                "surface": {"surface_file": surface_file(tmp_path, n_comp=3)}
+            }
+        }
+    )
+    surface = Surface(config)
+
+    rng = np.random.default_rng(1)
+    fm = SimpleNamespace(
+        surface=surface,
+        idx_surface=np.arange(surface.n_state),
+        RT=block(2, rng),
+        instrument=block(3, rng),
+        Sa_templates=forward.OrderedDict(),
+    )
+    fm.Sa_template = partial(ForwardModel.Sa_template, fm)
+
+    X = spectra(surface.component_means, rng)
+    states = [
+        np.concatenate([x, surface.init[surface.n_wl :], [1, 2, 3, 4, 5]]) for x in X
+    ]
+    components = [surface.component(x[fm.idx_surface], Geometry()) for x in states]
+    assert len(set(components)) > 1
+
+    # Each state twice, switching components in between
+    for x in states + states[::-1]:
+        geom = Geometry()
+        for Sa, Sa_expected in zip(
+            ForwardModel.Sa(fm, x, geom), uncached_Sa(fm, x, geom)
+        ):
+            assert np.allclose(Sa, Sa_expected)
+
+    assert len(fm.Sa_templates) == min(max_templates, len(set(components)))
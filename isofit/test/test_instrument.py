@@ -1,5 +1,61 @@
-from isofit.core.instrument import wl_tol
+import numpy as np
+import pytest
+
+from isofit.configs import configs
+from isofit.core.instrument import Instrument, wl_tol
 
 
 def test_wl_tol():
     assert wl_tol == 0.01
+
+
+def element(init):
+    return {"bounds": [-10, 10], "scale": 1, "init": init, "prior_sigma": 1}
+
+
+@pytest.mark.parametrize(
+    "statevector",
+    [
+        {
+            "WL_SHIFT": element(0.3),
+            "WL_SPACE": element(1.01),
+            "GROW_FWHM": element(0.5),
+            "EOF_1": element(0.1),
+            "EOF_2": element(-0.2),
+        },
+        {
+            **{f"WLSPL_{c}": element(0.01 * c) for c in (10, 14, 18, 22)},
+            **{f"FWHMSPL_{c}": element(0.2) for c in (10, 14, 18, 22)},
+        },
+    ],
+)
+def test_dmeas_dinstrument(tmp_path, statevector):
+    """The analytic instrument Jacobian matches central differences"""
+    rng = np.random.default_rng(0)
+    wl = np.linspace(400, 1000, 25)
+    np.savetxt(tmp_path / "wl.txt", np.c_[np.arange(25), wl / 1000, wl * 0 + 0.03])
+    np.savetxt(tmp_path / "eof.txt", rng.standard_normal((25, 2)))
+
+    config = {
+        "wavelength_file": str(tmp_path / "wl.txt"),
+        "SNR": 300,
+        "statevector": statevector,
+    }
+    if "EOF_1" in statevector:
+        config["eof_path"] = str(tmp_path / "eof.txt")
+    instrument = Instrument(configs.Config({"forward_model": {"instrument": config}}))
+
+    wl_hi = np.arange(350, 1050, 1.0)
+    rdn_hi = 10 + np.sin(wl_hi / 23) + 0.5 * np.cos(wl_hi / 7)
+    x = np.array(instrument.init, dtype=float)
+
+    def meas(x):
+        return instrument.sample(x, wl_hi, rdn_hi) + instrument.eof_offset(x)
+
+    K = instrument.dmeas_dinstrument(x, wl_hi, rdn_hi)
+    for i, dx in enumerate(np.eye(len(x)) * 1e-4):
+        K_fd = (meas(x + dx) - meas(x - dx)) / 2e-4
+        assert np.allclose(K[:, i], K_fd, rtol=0, atol=1e-5 * np.abs(K_fd).max())
+
+    with pytest.raises(ValueError):
+        instrument.dmeas_dinstrument(x, wl_hi, np.tile(rdn_hi, (2, 1)))
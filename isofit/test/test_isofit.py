@@ -0,0 +1,180 @@
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from spectral.io import envi
+
+from isofit.configs import configs
+from isofit.core import isofit
+from isofit.core.fileio import CompletionMask
+from isofit.debug import ray_bypass
+
+
+class StubIO:
+    """Output files of a Worker configuration, counting closes"""
+
+    closed = 0
+
+    def __init__(self, config, fm, full_statevec=None):
+        pass
+
+    def close(self):
+        StubIO.closed += 1
+
+    @staticmethod
+    def completion_mask_file(config):
+        return None
+
+
+@pytest.fixture
+def bypass(monkeypatch):
+    """Run the Worker actors of core.isofit in process, through ray_bypass,
+    without output files or inversions"""
+    Worker = isofit.Worker
+    if isinstance(Worker, ray_bypass.Remote):
+        Worker = Worker.obj
+    else:
+        Worker = Worker.__ray_actor_class__
+
+    monkeypatch.setattr(isofit, "ray", ray_bypass)
+    monkeypatch.setattr(isofit, "Worker", ray_bypass.remote(Worker))
+    monkeypatch.setattr(isofit, "IO", StubIO)
+    monkeypatch.setattr(isofit, "Inversion", lambda config, fm: None)
+    StubIO.closed = 0
+
+    return Worker
+
+
+def surface_models(RT):
+    """Forward models of two classes sharing RT, on a uniform surface"""
+    config = configs.Config({"forward_model": {"surface": {}}})
+    return {
+        name: (config, SimpleNamespace(RT=RT, statevec=["RFL"]))
+        for name in ("base", "cloud")
+    }
+
+
+def test_worker_pool(bypass):
+    """The radiative transfer model is only sent to actors without it"""
+    pool = isofit.WorkerPool()
+    RT = object()
+    pool.configure(surface_models(RT), [], 10, 2, "key")
+
+    workers = [actor.instance().obj for actor in pool.actors]
+    for worker in workers:
+        assert worker.RT is RT
+        assert all(fm.RT is RT for _, fm in worker.surface_models.values())
+
+    # Reconfigured actors get light models, and a new actor the full ones
+    models = surface_models(object())
+    pool.configure(models, [], 10, 3, "key")
+    assert StubIO.closed == 2
+    assert all(fm.RT is not None for _, fm in models.values())
+
+    workers = [actor.instance().obj for actor in pool.actors]
+    for worker in workers[:2]:
+        assert worker.RT is RT
+        assert all(fm.RT is RT for _, fm in worker.surface_models.values())
+    assert workers[2].RT is models["base"][1].RT
+
+    # Another key sends the model to every actor
+    other = object()
+    pool.configure(surface_models(other), [], 10, 3, "other")
+    assert all(actor.instance().obj.RT is other for actor in pool.actors)
+
+    pool.release()
+    assert StubIO.closed == 2 + 3 + 3
+
+    pool.shutdown()
+    assert pool.actors == [] and pool.rt_keys == []
+
+
+def test_worker_rt_key(bypass):
+    """A Worker only reuses its radiative transfer model for the same key"""
+    worker = bypass("INFO", None)
+    worker.configure(surface_models(object()), rt_key="key")
+
+    with pytest.raises(ValueError):
+        worker.configure(surface_models(None), rt_key="other")
+
+
+def test_radiative_transfer_key(tmp_path):
+    """The key changes with the modification time of the LUT file"""
+    lut = tmp_path / "lut.nc"
+    lut.touch()
+    engine = {"engine_name": "sRTMnet", "lut_path": str(lut)}
+    config = configs.Config(
+        {
+            "forward_model": {
+                "instrument": {"SNR": 300},
+                "radiative_transfer": {
+                    "lut_grid": {"AOT550": [0.1, 0.2]},
+                    "radiative_transfer_engines": {"vswir": engine},
+                },
+            }
+        }
+    )
+
+    key = isofit.radiative_transfer_key(config)
+    assert isofit.radiative_transfer_key(config) == key
+
+    os.utime(lut, (1, 1))
+    assert isofit.radiative_transfer_key(config) != key
+
+
+def test_run_tile_completion_mask(bypass, tmp_path):
+    """Tiles only run the pixels the completion mask has not marked"""
+    worker = bypass("INFO", None)
+    worker.configure(surface_models(object()), rt_key="key")
+
+    runs = []
+    worker.run_set_of_spectra = runs.append
+
+    mask = CompletionMask(str(tmp_path / "complete"), n_rows=4, n_cols=3)
+    mask.mark(np.array([[1, 0], [1, 2], [2, 1]]))
+    worker.mask = CompletionMask(mask.fname)
+
+    result = worker.run_tile((1, 3, 0, 3), "base")
+    expected = [[1, 1], [2, 0], [2, 2]]
+    assert result["pixels"] == 3 and result["indices"].tolist() == expected
+    assert [indices.tolist() for indices in runs] == [expected]
+
+    mask.mark(np.array(expected))
+    assert worker.run_tile((1, 3, 0, 3), "base")["pixels"] == 0
+    assert len(runs) == 1
+
+
+def test_run_tile_classes(bypass, tmp_path, monkeypatch):
+    """Workers open the classification once, and run the pixels of a class"""
+    classes = np.array([[0, 1, 1], [1, 0, 0]], dtype=np.uint8)
+    class_file = str(tmp_path / "classes")
+    envi.save_image(
+        class_file + ".hdr", classes[..., np.newaxis], ext="", interleave="bip"
+    )
+    surface = {
+        "surface_class_file": class_file,
+        "Surfaces": {"multicomponent_surface": {}, "glint_model_surface": {}},
+    }
+    config = configs.Config({"forward_model": {"surface": surface}})
+    models = {
+        name: (config, SimpleNamespace(RT=object(), statevec=["RFL"]))
+        for name in surface["Surfaces"]
+    }
+
+    opened = []
+    memmap = isofit.surface_classes_memmap
+    monkeypatch.setattr(
+        isofit, "surface_classes_memmap", lambda c: opened.append(c) or memmap(c)
+    )
+
+    worker = bypass("INFO", None)
+    worker.configure(models, rt_key="key")
+    worker.run_set_of_spectra = lambda indices: None
+
+    tile = (0, 2, 0, 3)
+    result = worker.run_tile(tile, "glint_model_surface")
+    assert result["indices"].tolist() == [[0, 1], [0, 2], [1, 0]]
+    result = worker.run_tile(tile, "multicomponent_surface")
+    assert result["indices"].tolist() == [[0, 0], [1, 1], [1, 2]]
+    assert len(opened) == 1
@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from isofit.radiative_transfer.engines.kernel_flows import (
+    KernelFlowsRT,
+    predict_MVM,
+    stack_MVM,
+)
+
+
+def synthetic_MVM(rng, nx, dims, ntrains, nwl):
+    """An MVM whose component GPs differ in input dimension and training size"""
+    G = {
+        "Xmean": rng.random(nx),
+        "Xstd": 0.5 + rng.random(nx),
+        "Yproj": {
+            "vectors": rng.standard_normal((len(dims), nwl)),
+            "values": 1 + rng.random(len(dims)),
+        },
+        "Ymean": rng.random(nwl),
+        "Ystd": 2.0,
+    }
+    MVM = {"G": G}
+    for i, (d, n) in enumerate(zip(dims, ntrains)):
+        G[f"Xproj{i + 1}"] = {
+            "vectors": rng.standard_normal((d, nx)),
+            "values": 1 + rng.random(d),
+        }
+        MVM[f"M{i + 1}"] = {
+            "Z": rng.standard_normal((d, n)),
+            "lambda": 0.5 + rng.random(d),
+            "theta": np.concatenate([0.5 + rng.random(3), [0.1]]),
+            "h": rng.standard_normal(n),
+        }
+    return MVM
+
+
+def predict_M(M, Xproj, G, points):
+    """Prediction of a single component GP"""
+    Z_tr = M["Z"].T
+    Z_te = (points - G["Xmean"]) / G["Xstd"] @ (Xproj["vectors"].T / Xproj["values"])
+    Z_te = Z_te * M["lambda"]
+    theta = M["theta"]
+
+    wb = np.sqrt(
+        (-2 * (Z_tr @ Z_te.T).T + np.sum(Z_tr * Z_tr, axis=1)).T
+        + np.sum(Z_te * Z_te, axis=1)
+    )
+    wb = np.sqrt(3.0) / theta[1] * wb
+    wb = theta[0] * (1.0 + wb) * np.exp(-wb)
+    wb2 = theta[2] * Z_tr @ Z_te.T
+    return (wb + wb2).T @ M["h"]
+
+
+def test_predict_MVM():
+    """The stacked, zero padded MVM matches each component GP on its own"""
+    rng = np.random.default_rng(0)
+    dims, ntrains = [2, 4, 3], [5, 9, 7]
+    MVM = synthetic_MVM(rng, 4, dims, ntrains, 12)
+    points = 1 + rng.random((6, 4))
+
+    stacked = stack_MVM(MVM, [1, 2, 1, 1])
+    assert stacked["Z"].shape == (3, max(ntrains), max(dims))
+
+    ZY_pred = predict_MVM(stacked, points)
+    assert ZY_pred.shape == (len(points), len(dims))
+    for i in range(len(dims)):
+        ZY = predict_M(MVM[f"M{i + 1}"], MVM["G"][f"Xproj{i + 1}"], MVM["G"], points)
+        assert np.allclose(ZY_pred[:, i], ZY, rtol=1e-10, atol=1e-12)
+
+    # Through the input transformations and the output reconstruction
+    srf_matrix = rng.random((8, 12))
+    MP = srf_matrix @ MVM["G"]["Yproj"]["vectors"].T
+    stacked["H"] = MP * MVM["G"]["Yproj"]["values"]
+    stacked["srfmean"] = srf_matrix @ MVM["G"]["Ymean"]
+    engine = SimpleNamespace(input_transfs=[None, np.log])
+
+    transformed = points.copy()
+    transformed[:, 1] = np.log(points[:, 1])
+    ZY = np.array(
+        [
+            predict_M(
+                MVM[f"M{i + 1}"], MVM["G"][f"Xproj{i + 1}"], MVM["G"], transformed
+            )
+            for i in range(len(dims))
+        ]
+    ).T
+    expected = (ZY @ stacked["H"].T) * MVM["G"]["Ystd"] + stacked["srfmean"]
+
+    assert np.allclose(
+        KernelFlowsRT.predict_single_MVM(engine, stacked, points), expected
+    )
+    assert np.allclose(
+        KernelFlowsRT.predict_single_MVM(engine, stacked, points[0]), expected[:1]
+    )
@@ -20,10 +20,19 @@
 #          James Montgomery, j.montgomery@jpl.nasa.gov
 #
 
+import itertools
+
+import numpy as np
 import pytest
+import xarray as xr
 
 from isofit.configs import configs
+from isofit.configs.sections.radiative_transfer_config import (
+    RadiativeTransferEngineConfig,
+)
+from isofit.radiative_transfer import luts
 from isofit.radiative_transfer.engines import ModtranRT
+from isofit.radiative_transfer.radiative_transfer_engine import RadiativeTransferEngine
 
 
 @pytest.mark.xfail
@@ -54,3 +63,87 @@ def test_combined(monkeypatch):
     # Second, we use the just built LUT file and initialize the engine class again
     print("Initialize radiative transfer engine with prebuilt LUT file.")
     ModtranRT(engine_config=engine_config, interpolator_style="mlg")
+
+
+def test_refineGrid():
+    """Refinement only adds nodes where the quantity is not linear."""
+    grid = {"AOT550": [0.0, 0.5, 1.0], "H2OSTR": [0.0, 1.0, 2.0, 4.0]}
+    aot, h2o = np.meshgrid(*grid.values(), indexing="ij")
+    data = np.stack([aot + h2o**2, aot], axis=-1)
+
+    ds = xr.Dataset(
+        {"rhoatm": ((*grid, "wl"), data)},
+        coords={**grid, "wl": [500.0, 600.0]},
+    ).stack(point=list(grid))
+
+    refined = luts.refineGrid(ds, grid, tolerance=0.01)
+    assert refined["AOT550"] == grid["AOT550"]
+    assert refined["H2OSTR"] == [0.0, 0.5, 1.0, 1.5, 2.0, 3.0, 4.0]
+
+    # The budget keeps the intervals with the highest errors
+    refined = luts.refineGrid(ds, grid, tolerance=0.01, max_points=15)
+    assert refined["H2OSTR"] == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+
+class CountingEngine(RadiativeTransferEngine):
+    """Stub engine whose emulator records the size of each batch"""
+
+    _supports_direct_emulation = True
+
+    def emulate(self, points):
+        self.calls.append(len(points))
+        s = points.sum(axis=1)[:, None] + self.wl / 1000
+        return {
+            "rhoatm": 0.01 * s,
+            "transm_down_dir": 0.5 + 0.01 * s,
+            "transm_down_dif": 0.1 * s,
+            "transm_up_dir": 0.8 + 0 * s,
+            "transm_up_dif": 0.02 * s,
+        }
+
+
+def test_direct_emulation(tmp_path):
+    """Direct emulation batches and caches its points, and completes the
+    quantities the emulator omits the same way as loading a LUT file"""
+    grid = {"AOT550": [0.0, 1.0], "H2OSTR": [1.0, 2.0, 3.0]}
+    wl = np.array([500.0, 600.0])
+    config = RadiativeTransferEngineConfig(
+        {
+            "engine_name": "stub",
+            "direct_emulation": True,
+            "emulator_cache_size": 3,
+            "lut_path": str(tmp_path / "unused.nc"),
+        }
+    )
+    engine = CountingEngine(config, lut_grid=grid, wl=wl, fwhm=np.full(2, 10.0))
+    engine.calls = []
+
+    # One prefetch is a single batch, whose points are then cache hits
+    x_RTs = np.array([[0.1, 1.0], [0.2, 1.0], [0.3, 1.0]])
+    engine.prefetch(x_RTs, None)
+    for x_RT in x_RTs:
+        engine.get(x_RT, None)
+    assert engine.calls == [3]
+
+    # A new point evicts the least recently used one
+    engine.emulate_points(np.array([[0.4, 1.0]]))
+    assert len(engine.emulator_cache) == 3
+    engine.emulate_points(x_RTs[1:])
+    assert engine.calls == [3, 1]
+    engine.emulate_points(x_RTs[:1])
+    assert engine.calls == [3, 1, 1]
+
+    # Compare against a LUT file of the same emulator outputs
+    file = str(tmp_path / "stub.nc")
+    lut = luts.Create(file, wl=wl, grid=grid)
+    points = np.array(list(itertools.product(*grid.values())))
+    outputs = engine.emulate(points)
+    for i, point in enumerate(points):
+        lut.writePoint(point, {key: data[i] for key, data in outputs.items()})
+    lut.finalize()
+
+    ds = luts.load(file)
+    values = engine.emulate_points(luts.extractPoints(ds))
+    for key in luts.Keys.alldim:
+        emulated = [np.broadcast_to(value[key], wl.shape) for value in values]
+        assert np.allclose(emulated, ds[key].transpose("point", "wl"), equal_nan=True)
@@ -0,0 +1,64 @@
+import numpy as np
+from spectral.io import envi
+
+from isofit.configs import configs
+from isofit.core.multistate import (
+    count_spectra_by_surface,
+    index_tile_by_surface,
+    surface_classes_memmap,
+)
+
+SURFACES = ("multicomponent_surface", "glint_model_surface")
+
+
+def surface_config(tmp_path, classes=None):
+    """Config of the surfaces, with a class file of the given classes"""
+    surface = {}
+    if classes is not None:
+        class_file = str(tmp_path / "classes")
+        envi.save_image(
+            class_file + ".hdr", classes[..., np.newaxis], ext="", interleave="bip"
+        )
+        surface["surface_class_file"] = class_file
+        surface["Surfaces"] = {name: {} for name in SURFACES}
+    return configs.Config({"forward_model": {"surface": surface}})
+
+
+def test_count_spectra_by_surface(tmp_path):
+    """Counts cover the row and column window, without the done pixels"""
+    rng = np.random.default_rng(0)
+    classes = rng.integers(2, size=(9, 7)).astype(np.uint8)
+    done = rng.random((9, 7)) < 0.3
+    rows, cols = range(2, 8), range(1, 6)
+    window = (slice(2, 8), slice(1, 6))
+
+    config = surface_config(tmp_path)
+    assert count_spectra_by_surface(config, rows, cols) == {"uniform_surface": 30}
+    counts = count_spectra_by_surface(config, rows, cols, done=done)
+    assert counts == {"uniform_surface": np.count_nonzero(~done[window])}
+
+    config = surface_config(tmp_path, classes)
+    for done_mask in (None, done):
+        counts = count_spectra_by_surface(
+            config, rows, cols, block_size=4, done=done_mask
+        )
+        todo = np.ones_like(done) if done_mask is None else ~done_mask
+        for i, name in enumerate(SURFACES):
+            assert counts[name] == np.count_nonzero(
+                (classes == i)[window] & todo[window]
+            )
+
+
+def test_index_tile_by_surface(tmp_path):
+    """Tiles give the pixels of a class in row-major order"""
+    rng = np.random.default_rng(0)
+    classes = rng.integers(2, size=(9, 7)).astype(np.uint8)
+    memmap = surface_classes_memmap(surface_config(tmp_path, classes))
+    tile = (2, 8, 1, 6)
+
+    pixels = [[row, col] for row in range(2, 8) for col in range(1, 6)]
+    assert index_tile_by_surface(None, tile, "uniform_surface").tolist() == pixels
+
+    for i, name in enumerate(SURFACES):
+        indices = index_tile_by_surface(memmap, tile, name)
+        assert indices.tolist() == [[r, c] for r, c in pixels if classes[r, c] == i]
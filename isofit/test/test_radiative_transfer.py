@@ -0,0 +1,83 @@
+import numpy as np
+
+from isofit.core.geometry import Geometry
+from isofit.radiative_transfer.radiative_transfer import RadiativeTransfer
+
+
+class SmoothRT(RadiativeTransfer):
+    """Radiative transfer with an analytic dependence on its state, counting
+    the evaluations of the RT quantities"""
+
+    def __init__(self, wl):
+        self.wl = wl
+        self.statevec_names = ["AOT550", "H2OSTR"]
+        self.bvec = ["H2O_ABSCO"]
+        self.last_drdn_dRT = None
+        self.calls = 0
+
+    def prefetch(self, x_RTs, geom):
+        pass
+
+    def calc_RT_quantities(self, x_RT, geom):
+        self.calls += 1
+        aot, h2o = x_RT
+        absorption = np.exp(-((self.wl / 1000) ** 2) * h2o - 0.2 * aot)
+        r = {"sphalb": 0.1 + 0.02 * aot + 0 * self.wl}
+        return r, 10 * absorption, 0, 0, 0, 0
+
+    def get_L_atm(self, x_RT, geom):
+        return 0.5 * x_RT[0] * (1 + 0 * self.wl)
+
+    def get_upward_transm(self, r, geom):
+        return np.ones(len(self.wl))
+
+
+def rdn(RT, x_RT, geom, rho, Ls):
+    r, *L = RT.calc_RT_quantities(x_RT, geom)
+    return RT.calc_rdn(x_RT, rho, rho, Ls, *L, r, geom)
+
+
+def test_drdn_dRTb():
+    """The H2O_ABSCO column reuses the H2OSTR derivative of the last
+    drdn_dRT, and equals the separate relative perturbation"""
+    wl = np.linspace(400, 2500, 15)
+    RT, geom = SmoothRT(wl), Geometry()
+    x_RT, rho, Ls = np.array([0.1, 1.5]), 0.2 + 0 * wl, 0 * wl
+    rdn0 = rdn(RT, x_RT, geom, rho, Ls)
+
+    RT.drdn_dRT(x_RT, geom, rho, rho, Ls, rdn0)
+    calls = RT.calls
+    Kb = RT.drdn_dRTb(x_RT, geom, rho, rho, Ls, rdn0)
+    assert RT.calls == calls
+
+    RT.last_drdn_dRT = None
+    Kb_perturbed = RT.drdn_dRTb(x_RT, geom, rho, rho, Ls, rdn0)
+    assert RT.calls == calls + 1
+    assert Kb.shape == Kb_perturbed.shape == (len(wl), 1)
+    assert np.allclose(Kb, Kb_perturbed, rtol=1e-4, atol=0)
+
+
+def test_cached_drdn_dRT():
+    """The last drdn_dRT is only reused at the same state, geometry and
+    surface"""
+    wl = np.linspace(400, 2500, 15)
+    RT, geom = SmoothRT(wl), Geometry()
+    x_RT, rho, Ls = np.array([0.1, 1.5]), 0.2 + 0 * wl, 0 * wl
+    assert RT.cached_drdn_dRT(x_RT, geom, rho, rho, Ls) is None
+
+    K = RT.drdn_dRT(x_RT, geom, rho, rho, Ls, rdn(RT, x_RT, geom, rho, Ls))
+    inputs = (x_RT, geom, rho, rho, Ls)
+    assert RT.cached_drdn_dRT(x_RT.copy(), geom, rho.copy(), rho.copy(), Ls.copy()) is K
+
+    # Changing the arguments in place must not alias the cache
+    x_RT[1] += 0.1
+    assert RT.cached_drdn_dRT(*inputs) is None
+    x_RT[1] -= 0.1
+    assert RT.cached_drdn_dRT(*inputs) is K
+
+    for i, changed in enumerate(
+        [x_RT + [0, 0.1], Geometry(), rho + 0.01, rho + 0.01, Ls + 1]
+    ):
+        args = list(inputs)
+        args[i] = changed
+        assert RT.cached_drdn_dRT(*args) is None
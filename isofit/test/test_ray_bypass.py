@@ -57,3 +57,26 @@ def test_classes(name="test", w=4, n=10):
     results = workers.map_unordered(lambda a, b: a.some_func.remote(b), range(n))
 
     assert list(results) == [f"{name}{i}" for i in range(n)]
+
+
+class Counter:
+    def __init__(self):
+        self.count = 0
+
+    def add(self, n):
+        self.count += n
+        return self.count
+
+
+def test_persistent_actors():
+    """
+    Tests actors that keep their state across pools, as in core.isofit.
+    """
+    actor = ray.remote()(Counter).remote()
+    assert ray.get([actor.add.remote(5)]) == [5]
+
+    workers = ray.util.ActorPool([actor])
+    results = workers.map_unordered(lambda a, b: a.add.remote(b), [1, 1])
+
+    assert list(results) == [6, 7]
+    ray.kill(actor)
@@ -0,0 +1,64 @@
+import numpy as np
+
+from isofit.core.scheduler import (
+    guided_blocks,
+    line_blocks,
+    load_balance,
+    surface_tasks,
+)
+
+
+def test_line_blocks():
+    rows, cols = range(2, 12), range(3, 8)
+
+    # Blocks of whole lines cover the window once, in row-major order
+    tiles = line_blocks(rows, cols, 4)
+    assert len(tiles) == 4
+    assert all(tile[2:] == (3, 8) for tile in tiles)
+    assert tiles[0][0] == 2 and tiles[-1][1] == 12
+    assert all(a[1] == b[0] for a, b in zip(tiles[:-1], tiles[1:]))
+
+    # Fewer lines than tasks splits the lines across columns
+    tiles = line_blocks(range(0, 2), cols, 6)
+    assert len(tiles) == 6
+    covered = np.zeros((2, 5), dtype=int)
+    for row_start, row_end, col_start, col_end in tiles:
+        covered[row_start:row_end, col_start - 3 : col_end - 3] += 1
+    assert np.all(covered == 1)
+
+
+def test_guided_blocks():
+    tiles = guided_blocks(range(0, 100), range(0, 4), n_workers=4, factor=2)
+
+    # Tiles cover the lines once and shrink as the queue drains
+    sizes = [end - start for start, end, *_ in tiles]
+    assert tiles[0][0] == 0 and tiles[-1][1] == 100 and sum(sizes) == 100
+    assert sizes[0] == 13 and sizes[-1] == 1
+    assert all(a >= b for a, b in zip(sizes[:-1], sizes[1:]))
+
+    stats = [
+        {"worker": 0, "pixels": 10, "time": 3.0},
+        {"worker": 1, "pixels": 5, "time": 1.0},
+        {"worker": 0, "pixels": 2, "time": 1.0},
+    ]
+    balance = load_balance(stats)
+    assert balance["workers"][0] == {"tasks": 2, "pixels": 12, "time": 4.0}
+    assert np.isclose(balance["imbalance"], 1.6)
+
+
+def test_surface_tasks():
+    rows, cols = range(0, 40), range(0, 10)
+    counts = {"base": 360, "water": 40, "cloud": 0}
+
+    # Classes share one queue, with the small class filling in at the end
+    tasks = surface_tasks(rows, cols, counts, n_workers=4, n_tasks=16)
+    assert {name for _, name in tasks} == {"base", "water"}
+    assert tasks[0] == ((0, 5, 0, 10), "base")
+    assert tasks[-1][1] == "water"
+    for name in ["base", "water"]:
+        lines = sum(t[1] - t[0] for t, n in tasks if n == name)
+        assert lines == 40
+
+    # Static tiles keep the class order
+    tasks = surface_tasks(rows, cols, counts, 4, 16, scheduling="static")
+    assert len(tasks) == 32 and tasks[0][1] == "base" and tasks[-1][1] == "water"
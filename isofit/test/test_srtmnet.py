@@ -0,0 +1,87 @@
+import h5py
+import numpy as np
+import pytest
+
+from isofit.core.common import calculate_resample_matrix
+from isofit.radiative_transfer.engines.sRTMnet import SRTMnetModel
+
+COMPONENTS = [
+    "transm_down_dir",
+    "transm_down_dif",
+    "transm_up_dir",
+    "transm_up_dif",
+    "rhoatm",
+    "sphalb",
+]
+
+MAPPING = {
+    "dir-dir": ["transm_down_dir", "transm_up_dir"],
+    "dir-dif": ["transm_down_dir", "transm_up_dif"],
+    "dif-dir": ["transm_down_dif", "transm_up_dir"],
+    "dif-dif": ["transm_down_dif", "transm_up_dif"],
+    "rhoatm": ["rhoatm"],
+    "sphalb": ["sphalb"],
+}
+
+
+def emulator_file(tmp_path, n_in, n_emu):
+    """Write a small random two layer 6c emulator"""
+    rng = np.random.default_rng(0)
+    file = str(tmp_path / "emulator.h5")
+    with h5py.File(file, "w") as model:
+        for key in COMPONENTS:
+            for layer, shape in enumerate([(n_in, 16), (16, n_emu)]):
+                model[f"weights_{key}/{layer}"] = 0.1 * rng.standard_normal(shape)
+                model[f"biases_{key}/{layer}"] = 0.1 * rng.standard_normal(shape[1])
+    return file
+
+
+@pytest.mark.parametrize("resample", [False, True])
+def test_predict_coupled(tmp_path, resample):
+    """The coupled prediction matches predicting each mapping key on its own"""
+    n, n_in, n_emu = 11, 6, 40
+    file = emulator_file(tmp_path, n_in, n_emu)
+
+    rng = np.random.default_rng(1)
+    sixs = {key: rng.random((n, n_in)) for key in COMPONENTS}
+    sixs_emu = {key: rng.random((n, n_emu)) for key in COMPONENTS}
+    scaler = {key: 1 + rng.random() for key in COMPONENTS}
+    offset = {key: rng.random() for key in COMPONENTS}
+
+    resample_dict = None
+    if resample:
+        emu_wl = np.linspace(400, 2500, n_emu)
+        wl = np.linspace(450, 2450, 15)
+        fwhm = np.full(len(wl), 120.0)
+        resample_dict = {
+            "emu_wl": emu_wl,
+            "wl": wl,
+            "fwhm": fwhm,
+            "emulator_H": calculate_resample_matrix(emu_wl, wl, fwhm),
+            "emulator_sol_irr": 100 + 50 * rng.random(n_emu),
+            "emulator_coszen": 0.7,
+        }
+
+    # Batches that do not divide the number of points
+    coupled = SRTMnetModel(file, key="6c").predict_coupled(
+        sixs,
+        sixs_emu,
+        MAPPING,
+        batch_size=4,
+        response_scaler=scaler,
+        response_offset=offset,
+        resample_dict=resample_dict,
+    )
+    assert set(coupled) == set(COMPONENTS) | set(MAPPING)
+
+    for key, components in MAPPING.items():
+        lp = SRTMnetModel(file, key=key).predict(
+            [sixs[x] for x in components],
+            [sixs_emu[x] for x in components],
+            batch_size=4,
+            response_scaler=[scaler[x] for x in components],
+            response_offset=[offset[x] for x in components],
+            resample_dict=resample_dict,
+        )
+        for outkey, out in lp.items():
+            assert np.allclose(coupled[outkey], out, rtol=1e-5, atol=0)
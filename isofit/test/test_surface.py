@@ -0,0 +1,213 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import scipy.io
+from scipy.ndimage import gaussian_filter1d
+
+from isofit.configs import configs
+from isofit.core.geometry import Geometry
+from isofit.core.multistate import SurfaceMapping
+from isofit.radiative_transfer.radiative_transfer import RadiativeTransfer
+from isofit.surface.surface_glint_model import GlintModelSurface
+from isofit.surface.surface_multicomp import MultiComponentSurface
+from isofit.utils.multicomponent_classification import Component
+
+
+def surface_file(tmp_path, n_wl=12, n_comp=2):
+    """Write a small multicomponent surface model"""
+    rng = np.random.default_rng(0)
+    wl = np.linspace(400, 2500, n_wl)
+    A = rng.standard_normal((n_comp, n_wl, n_wl)) * 0.01
+    model = {
+        "means": 0.2 + 0.05 * rng.random((n_comp, n_wl)),
+        "covs": A @ A.transpose(0, 2, 1) + np.eye(n_wl) * 1e-4,
+        "wl": wl,
+        "normalize": "Euclidean",
+        "refwl": wl,
+    }
+    file = str(tmp_path / "surface.mat")
+    scipy.io.savemat(file, model)
+    return file
+
+
+@pytest.mark.parametrize(
+    "four_component,background", [(False, False), (True, False), (True, True)]
+)
+def test_glint_drdn_dsurface(tmp_path, four_component, background):
+    """Glint radiance derivatives match finite differences of calc_rdn"""
+    config = configs.Config(
+        {"forward_model": {"surface": {"surface_file": surface_file(tmp_path)}}}
+    )
+    surface = GlintModelSurface(config)
+    n_wl = surface.n_wl
+
+    rng = np.random.default_rng(1)
+    geom = Geometry()
+    if background:
+        geom.bg_rfl = 0.1 + 0.2 * rng.random(n_wl)
+
+    x = np.concatenate([0.1 + 0.3 * rng.random(n_wl), [0.3, 0.05]])
+    s_alb = 0.1 + 0.1 * rng.random(n_wl)
+    L_tot = 5 + rng.random(n_wl)
+    L_dir_dir, L_dir_dif, L_dif_dir, L_dif_dif = (
+        rng.random((4, n_wl)) if four_component else np.zeros((4, 1))
+    )
+
+    # Only the surface dependent part of calc_rdn matters here
+    RT = SimpleNamespace(
+        get_L_atm=lambda x_RT, geom: np.ones(n_wl),
+        get_upward_transm=lambda r, geom: np.ones(n_wl),
+    )
+
+    def rdn(x):
+        rho_dir_dir, rho_dif_dir = surface.calc_rfl(x, geom)
+        return RadiativeTransfer.calc_rdn(
+            RT,
+            None,
+            rho_dir_dir,
+            rho_dif_dir,
+            Ls=np.zeros(n_wl),
+            L_tot=L_tot,
+            L_dir_dir=L_dir_dir,
+            L_dif_dir=L_dif_dir,
+            L_dir_dif=L_dir_dif,
+            L_dif_dif=L_dif_dif,
+            r={"sphalb": s_alb},
+            geom=geom,
+        )
+
+    rho_dir_dir, rho_dif_dir = surface.calc_rfl(x, geom)
+    K = surface.drdn_dsurface(
+        rho_dif_dir=rho_dif_dir,
+        drfl_dsurface=surface.drfl_dsurface(x, geom),
+        dLs_dsurface=surface.dLs_dsurface(x, geom),
+        s_alb=s_alb,
+        t_total_up=np.ones(n_wl),
+        L_tot=L_tot,
+        L_dir_dir=L_dir_dir,
+        L_dir_dif=L_dir_dif,
+        L_dif_dir=L_dif_dir,
+        L_dif_dif=L_dif_dif,
+        rho_dir_dir=rho_dir_dir,
+        bg_rfl=geom.bg_rfl,
+    )
+
+    K_fd = np.array(
+        [(rdn(x + dx) - rdn(x - dx)) / 2e-6 for dx in np.eye(len(x)) * 1e-6]
+    ).T
+    assert np.allclose(K, K_fd, rtol=1e-6, atol=1e-8)
+
+
+def spectra(means, rng, n=3):
+    """Scaled and perturbed spectra around each of the means"""
+    return np.concatenate(
+        [
+            mu
+            * rng.uniform(0.5, 2, (n, 1))
+            * (1 + 0.05 * rng.standard_normal((n, len(mu))))
+            for mu in means
+        ]
+    )
+
+
+def closest_component(surface, x):
+    """Per spectrum component selection, as before batching"""
+    lamb_ref = surface.calc_lamb(x, None)[surface.idx_ref]
+    lamb_ref = lamb_ref / surface.norm(lamb_ref)
+    mus = np.array(surface.mus)
+    if surface.selection_metric == "SGA":
+
+        def gradient(val):
+            val = gaussian_filter1d(val, sigma=2)
+            return np.gradient(val, surface.wl[surface.idx_ref])
+
+        grads = np.array([gradient(mu) for mu in mus])
+        return np.argmin(surface.spectral_angle_distance(gradient(lamb_ref), grads))
+    return np.argmin(surface.euclidean_distance(lamb_ref, mus))
+
+
+@pytest.mark.parametrize("metric", ["Euclidean", "SGA"])
+def test_closest_components(tmp_path, metric):
+    """Batched component selection matches the per spectrum selection"""
+    config = configs.Config(
+        {
+            "forward_model": {
+                "surface": {
+                    "surface_file": surface_file(tmp_path, n_comp=3),
+                    "selection_metric": metric,
+                }
+            }
+        }
+    )
+    surface = MultiComponentSurface(config)
+    X = spectra(surface.component_means, np.random.default_rng(1))
+
+    expected = [closest_component(surface, x) for x in X]
+    assert len(set(expected)) > 1
+
+    assert np.array_equal(surface.closest_components(X[:, surface.idx_ref]), expected)
+    assert [surface.component(x, Geometry()) for x in X] == expected
+
+
+def test_selection_memo(tmp_path):
+    """The memoized selection follows changes of the state and geometry"""
+    config = configs.Config(
+        {
+            "forward_model": {
+                "surface": {"surface_file": surface_file(tmp_path, n_comp=3)}
+            }
+        }
+    )
+    surface = MultiComponentSurface(config)
+    X = spectra(surface.component_means, np.random.default_rng(1))
+    expected = [closest_component(surface, x) for x in X]
+    a, b = X[0], X[next(i for i, c in enumerate(expected) if c != expected[0])]
+    ca, cb = closest_component(surface, a), closest_component(surface, b)
+    other = next(c for c in range(surface.n_comp) if c != cb)
+
+    # The state changing in place
+    geom = Geometry()
+    x = a.copy()
+    assert surface.selection(x, geom) == (ca, surface.norm(x))
+    x[:] = b
+    assert surface.selection(x, geom) == (cb, surface.norm(x))
+
+    # The geometry preserving a component, or changing altogether
+    geom.surf_cmp_init = other
+    assert surface.component(x, geom) == other
+    assert surface.component(x, Geometry()) == cb
+
+    # The geometry preserving the initial solution, which then selects
+    geom = Geometry()
+    assert surface.component(x, geom) == cb
+    geom.x_surf_init = a
+    assert surface.component(x, geom) == ca
+    assert geom.surf_cmp_init == ca
+
+
+def test_pick_closest_batch(tmp_path):
+    """Batched classification matches the per pixel classification"""
+    model_dict = scipy.io.loadmat(surface_file(tmp_path, n_comp=3))
+    model_dict["surface_categories"] = np.array(
+        ["multicomponent_surface", "glint_model_surface", "multicomponent_surface"]
+    )
+    component = Component(model_dict)
+    X = spectra(model_dict["means"], np.random.default_rng(1))
+    X = X + 0.02 * np.random.default_rng(2).standard_normal(X.shape)
+
+    def pick_closest(x):
+        lamb_ref = x[component.idx_ref]
+        lamb_ref = (lamb_ref - np.min(lamb_ref)) / (np.max(lamb_ref) - np.min(lamb_ref))
+        mds = []
+        for mu in component.mus:
+            mu = (mu - np.min(mu)) / (np.max(mu) - np.min(mu))
+            mds.append(sum(pow(lamb_ref - mu, 2)))
+        category = component.surface_categories[np.argmin(mds)].strip()
+        return SurfaceMapping[category]
+
+    expected = [pick_closest(x) for x in X]
+    assert len(set(expected)) > 1
+
+    assert np.array_equal(component.pickClosestBatch(X), expected)
+    assert [component.pickClosest(x, None) for x in X] == expected
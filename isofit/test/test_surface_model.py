@@ -0,0 +1,77 @@
+import json
+
+import numpy as np
+import scipy.io
+from spectral.io import envi
+
+from isofit import ray
+from isofit.utils.surface_model import RunningMoments, surface_model
+
+
+def test_running_moments():
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((200, 5)) @ rng.standard_normal((5, 5)) + 3
+    chunks = np.split(X, [7, 50, 51, 120])
+
+    # Chunks folded in one at a time, and two halves merged together
+    total = RunningMoments(5)
+    for chunk in chunks:
+        total.update(chunk)
+
+    first, second = RunningMoments(5), RunningMoments(5)
+    for chunk in chunks[:2]:
+        first.update(chunk)
+    for chunk in chunks[2:]:
+        second.update(chunk)
+    merged = first.merge(second).merge(RunningMoments(5))
+
+    for moments in (total, merged):
+        assert moments.n == len(X)
+        assert np.allclose(moments.mean, np.mean(X, axis=0))
+        assert np.allclose(moments.cov(), np.cov(X, rowvar=False))
+
+
+def test_streaming_surface_model(tmp_path):
+    """Streaming the libraries in chunks gives the in-memory model"""
+    rng = np.random.default_rng(0)
+    wl = np.linspace(400, 2500, 12)
+    np.savetxt(tmp_path / "wl.txt", np.c_[np.arange(len(wl)), wl / 1000, wl * 0])
+
+    files = []
+    for i, lines in enumerate((4, 3)):
+        name = str(tmp_path / f"library{i}")
+        metadata = {"wavelength": [str(w) for w in wl], "interleave": "bip"}
+        rfl = 0.3 + 0.05 * rng.standard_normal((lines, 5, len(wl)))
+        envi.save_image(name + ".hdr", rfl, metadata=metadata, ext="", force=True)
+        files.append(name)
+
+    config = {
+        "output_model_file": str(tmp_path / "unused.mat"),
+        "wavelength_file": str(tmp_path / "wl.txt"),
+        "normalize": "Euclidean",
+        "reference_windows": [[400, 2500]],
+        "sources": [
+            {
+                "input_spectrum_files": files,
+                "n_components": 1,
+                "windows": [
+                    {"interval": [300, 2600], "regularizer": 1e-6, "correlation": "EM"}
+                ],
+            }
+        ],
+    }
+    config_path = str(tmp_path / "surface.json")
+    with open(config_path, "w") as f:
+        json.dump(config, f)
+
+    surface_model(config_path, output_path=str(tmp_path / "memory.mat"))
+    stream = str(tmp_path / "stream.mat")
+    try:
+        surface_model(config_path, output_path=stream, chunk_size=10, n_cores=2)
+    finally:
+        ray.shutdown()
+
+    memory = scipy.io.loadmat(tmp_path / "memory.mat")
+    stream = scipy.io.loadmat(stream)
+    assert np.allclose(stream["means"], memory["means"], rtol=1e-12, atol=0)
+    assert np.allclose(stream["covs"], memory["covs"], rtol=1e-9, atol=0)
@@ -658,180 +658,195 @@ def apply_oe(
         "segmentation_size": segmentation_size,
         "terrain_style": terrain_style,
     }
-    if presolve:
-        # write modtran presolve template
-        tmpl.write_modtran_template(
-            atmosphere_type=atmosphere_type,
-            fid=paths.fid,
-            altitude_km=mean_altitude_km,
-            dayofyear=dayofyear,
-            to_sensor_azimuth=mean_to_sensor_azimuth,
-            to_sensor_zenith=mean_to_sensor_zenith,
-            to_sun_zenith=mean_to_sun_zenith,
-            relative_azimuth=mean_relative_azimuth,
-            gmtime=gmtime,
-            elevation_km=mean_elevation_km,
-            output_file=paths.h2o_template_path,
-            ihaze_type="AER_NONE",
-        )
 
-        if emulator_base is None and prebuilt_lut is None:
-            max_water = tmpl.calc_modtran_max_water(paths)
-        else:
-            max_water = 6
+    # Workers started for the presolve are reconfigured for the full retrieval,
+    # unless it has to build its LUT first and they are stopped to free cores
+    pool = isofit.WorkerPool("INFO", log_file)
+
+    try:
+        if presolve:
+            # write modtran presolve template
+            tmpl.write_modtran_template(
+                atmosphere_type=atmosphere_type,
+                fid=paths.fid,
+                altitude_km=mean_altitude_km,
+                dayofyear=dayofyear,
+                to_sensor_azimuth=mean_to_sensor_azimuth,
+                to_sensor_zenith=mean_to_sensor_zenith,
+                to_sun_zenith=mean_to_sun_zenith,
+                relative_azimuth=mean_relative_azimuth,
+                gmtime=gmtime,
+                elevation_km=mean_elevation_km,
+                output_file=paths.h2o_template_path,
+                ihaze_type="AER_NONE",
+            )
+
+            if emulator_base is None and prebuilt_lut is None:
+                max_water = tmpl.calc_modtran_max_water(paths)
+            else:
+                max_water = 6
+
+            # run H2O grid as necessary
+            if not exists(envi_header(paths.h2o_subs_path)) or not exists(
+                paths.h2o_subs_path
+            ):
+                # Write the presolve connfiguration file
+                h2o_grid = np.linspace(0.2, max_water - 0.01, 10).round(2)
+                logging.info(f"Pre-solve H2O grid: {h2o_grid}")
+                logging.info("Writing H2O pre-solve configuration file.")
+
+                tmpl.build_config(
+                    h2o_lut_grid=h2o_grid,
+                    presolve=True,
+                    **config_params,
+                )
+                """Currently not running presolve with either
+                multisurface-mode or topography mode. Could easily change
+                this"""
+
+                # Run modtran retrieval
+                logging.info("Run ISOFIT initial guess")
+                retrieval_h2o = isofit.Isofit(
+                    paths.h2o_config_path,
+                    level="INFO",
+                    logfile=log_file,
+                    pool=pool,
+                )
+                retrieval_h2o.run()
+                del retrieval_h2o
+
+                # clean up unneeded storage
+                if emulator_base is None:
+                    for to_rm in RTM_CLEANUP_LIST:
+                        cmd = "rm " + join(paths.lut_h2o_directory, to_rm)
+                        logging.info(cmd)
+                        subprocess.call(cmd, shell=True)
+            else:
+                logging.info("Existing h2o-presolve solutions found, using those.")
+
+            h2o = envi.open(envi_header(paths.h2o_subs_path))
+            # Find the band that is H2O. Should be stable with constant H2O name
+            h2o_band = [
+                i
+                for i, name in enumerate(h2o.metadata["band names"])
+                if name == "H2OSTR"
+            ][0]
+            h2o_est = h2o.read_band(h2o_band)[:].flatten()
+
+            p05 = np.percentile(h2o_est[h2o_est > lut_params.h2o_min], 2)
+            p95 = np.percentile(h2o_est[h2o_est > lut_params.h2o_min], 98)
+            margin = (p95 - p05) * 0.5
+
+            lut_params.h2o_range[0] = max(lut_params.h2o_min, p05 - margin)
+            lut_params.h2o_range[1] = min(
+                max_water, max(lut_params.h2o_min, p95 + margin)
+            )
+
+        h2o_lut_grid = lut_params.get_grid(
+            lut_params.h2o_range[0],
+            lut_params.h2o_range[1],
+            lut_params.h2o_spacing,
+            lut_params.h2o_spacing_min,
+        )
 
-        # run H2O grid as necessary
-        if not exists(envi_header(paths.h2o_subs_path)) or not exists(
-            paths.h2o_subs_path
+        logging.info("Full (non-aerosol) LUTs:")
+        logging.info(f"Elevation: {elevation_lut_grid}")
+        logging.info(f"To-sensor zenith: {to_sensor_zenith_lut_grid}")
+        logging.info(f"To-sun zenith: {to_sun_zenith_lut_grid}")
+        logging.info(f"Relative to-sun azimuth: {relative_azimuth_lut_grid}")
+        logging.info(f"H2O Vapor: {h2o_lut_grid}")
+
+        if (
+            not exists(paths.state_subs_path)
+            or not exists(paths.uncert_subs_path)
+            or not exists(paths.rfl_subs_path)
         ):
-            # Write the presolve connfiguration file
-            h2o_grid = np.linspace(0.2, max_water - 0.01, 10).round(2)
-            logging.info(f"Pre-solve H2O grid: {h2o_grid}")
-            logging.info("Writing H2O pre-solve configuration file.")
+            tmpl.write_modtran_template(
+                atmosphere_type=atmosphere_type,
+                fid=paths.fid,
+                altitude_km=mean_altitude_km,
+                dayofyear=dayofyear,
+                to_sensor_azimuth=mean_to_sensor_azimuth,
+                to_sensor_zenith=mean_to_sensor_zenith,
+                to_sun_zenith=mean_to_sun_zenith,
+                relative_azimuth=mean_relative_azimuth,
+                gmtime=gmtime,
+                elevation_km=mean_elevation_km,
+                output_file=paths.modtran_template_path,
+            )
+
+            logging.info("Writing main configuration file.")
+
+            # add aerosol elements from climatology
+            aerosol_state_vector, aerosol_lut_grid, aerosol_model_path = (
+                tmpl.load_climatology(
+                    paths.aerosol_climatology,
+                    mean_latitude,
+                    mean_longitude,
+                    dt,
+                    lut_params=lut_params,
+                )
+            )
+            config_params["aerosol_model_file"] = aerosol_model_path
+            config_params["aerosol_lut_grid"] = aerosol_lut_grid
+            config_params["aerosol_state_vector"] = aerosol_state_vector
+
+            for gridkey, grid, mean in zip(
+                [
+                    "elevation_lut_grid",
+                    "to_sensor_zenith_lut_grid",
+                    "to_sun_zenith_lut_grid",
+                    "relative_azimuth_lut_grid",
+                ],
+                [
+                    elevation_lut_grid,
+                    to_sensor_zenith_lut_grid,
+                    to_sun_zenith_lut_grid,
+                    relative_azimuth_lut_grid,
+                ],
+                [
+                    mean_elevation_km,
+                    mean_to_sensor_zenith,
+                    mean_to_sun_zenith,
+                    mean_relative_azimuth,
+                ],
+            ):
+
+                config_params[gridkey] = grid if grid is not None else [mean]
+
+            config_params["multiple_restarts"] = (multiple_restarts,)
+            config_params["pressure_elevation"] = pressure_elevation
+            if retrieve_co2:
+                config_params["co2_lut_grid"] = lut_params.co2_range
+                config_params["retrieve_co2"] = True
 
             tmpl.build_config(
-                h2o_lut_grid=h2o_grid,
-                presolve=True,
+                h2o_lut_grid=h2o_lut_grid,
                 **config_params,
             )
-            """Currently not running presolve with either
-            multisurface-mode or topography mode. Could easily change
-            this"""
-
-            # Run modtran retrieval
-            logging.info("Run ISOFIT initial guess")
-            retrieval_h2o = isofit.Isofit(
-                paths.h2o_config_path,
-                level="INFO",
-                logfile=log_file,
+
+            if config_only:
+                logging.info("`config_only` enabled, exiting early")
+                return
+
+            # Run retrieval
+            logging.info("Running ISOFIT with full LUT")
+            retrieval_full = isofit.Isofit(
+                paths.isofit_full_config_path, level="INFO", logfile=log_file, pool=pool
             )
-            retrieval_h2o.run()
-            del retrieval_h2o
+            retrieval_full.run()
+            del retrieval_full
 
             # clean up unneeded storage
             if emulator_base is None:
                 for to_rm in RTM_CLEANUP_LIST:
-                    cmd = "rm " + join(paths.lut_h2o_directory, to_rm)
+                    cmd = "rm " + join(paths.full_lut_directory, to_rm)
                     logging.info(cmd)
                     subprocess.call(cmd, shell=True)
-        else:
-            logging.info("Existing h2o-presolve solutions found, using those.")
-
-        h2o = envi.open(envi_header(paths.h2o_subs_path))
-        # Find the band that is H2O. Should be stable with constant H2O name
-        h2o_band = [
-            i for i, name in enumerate(h2o.metadata["band names"]) if name == "H2OSTR"
-        ][0]
-        h2o_est = h2o.read_band(h2o_band)[:].flatten()
-
-        p05 = np.percentile(h2o_est[h2o_est > lut_params.h2o_min], 2)
-        p95 = np.percentile(h2o_est[h2o_est > lut_params.h2o_min], 98)
-        margin = (p95 - p05) * 0.5
-
-        lut_params.h2o_range[0] = max(lut_params.h2o_min, p05 - margin)
-        lut_params.h2o_range[1] = min(max_water, max(lut_params.h2o_min, p95 + margin))
-
-    h2o_lut_grid = lut_params.get_grid(
-        lut_params.h2o_range[0],
-        lut_params.h2o_range[1],
-        lut_params.h2o_spacing,
-        lut_params.h2o_spacing_min,
-    )
-
-    logging.info("Full (non-aerosol) LUTs:")
-    logging.info(f"Elevation: {elevation_lut_grid}")
-    logging.info(f"To-sensor zenith: {to_sensor_zenith_lut_grid}")
-    logging.info(f"To-sun zenith: {to_sun_zenith_lut_grid}")
-    logging.info(f"Relative to-sun azimuth: {relative_azimuth_lut_grid}")
-    logging.info(f"H2O Vapor: {h2o_lut_grid}")
-
-    if (
-        not exists(paths.state_subs_path)
-        or not exists(paths.uncert_subs_path)
-        or not exists(paths.rfl_subs_path)
-    ):
-        tmpl.write_modtran_template(
-            atmosphere_type=atmosphere_type,
-            fid=paths.fid,
-            altitude_km=mean_altitude_km,
-            dayofyear=dayofyear,
-            to_sensor_azimuth=mean_to_sensor_azimuth,
-            to_sensor_zenith=mean_to_sensor_zenith,
-            to_sun_zenith=mean_to_sun_zenith,
-            relative_azimuth=mean_relative_azimuth,
-            gmtime=gmtime,
-            elevation_km=mean_elevation_km,
-            output_file=paths.modtran_template_path,
-        )
-
-        logging.info("Writing main configuration file.")
-
-        # add aerosol elements from climatology
-        aerosol_state_vector, aerosol_lut_grid, aerosol_model_path = (
-            tmpl.load_climatology(
-                paths.aerosol_climatology,
-                mean_latitude,
-                mean_longitude,
-                dt,
-                lut_params=lut_params,
-            )
-        )
-        config_params["aerosol_model_file"] = aerosol_model_path
-        config_params["aerosol_lut_grid"] = aerosol_lut_grid
-        config_params["aerosol_state_vector"] = aerosol_state_vector
-
-        for gridkey, grid, mean in zip(
-            [
-                "elevation_lut_grid",
-                "to_sensor_zenith_lut_grid",
-                "to_sun_zenith_lut_grid",
-                "relative_azimuth_lut_grid",
-            ],
-            [
-                elevation_lut_grid,
-                to_sensor_zenith_lut_grid,
-                to_sun_zenith_lut_grid,
-                relative_azimuth_lut_grid,
-            ],
-            [
-                mean_elevation_km,
-                mean_to_sensor_zenith,
-                mean_to_sun_zenith,
-                mean_relative_azimuth,
-            ],
-        ):
-
-            config_params[gridkey] = grid if grid is not None else [mean]
-
-        config_params["multiple_restarts"] = (multiple_restarts,)
-        config_params["pressure_elevation"] = pressure_elevation
-        if retrieve_co2:
-            config_params["co2_lut_grid"] = lut_params.co2_range
-            config_params["retrieve_co2"] = True
-
-        tmpl.build_config(
-            h2o_lut_grid=h2o_lut_grid,
-            **config_params,
-        )
-
-        if config_only:
-            logging.info("`config_only` enabled, exiting early")
-            return
-
-        # Run retrieval
-        logging.info("Running ISOFIT with full LUT")
-        retrieval_full = isofit.Isofit(
-            paths.isofit_full_config_path, level="INFO", logfile=log_file
-        )
-        retrieval_full.run()
-        del retrieval_full
-
-        # clean up unneeded storage
-        if emulator_base is None:
-            for to_rm in RTM_CLEANUP_LIST:
-                cmd = "rm " + join(paths.full_lut_directory, to_rm)
-                logging.info(cmd)
-                subprocess.call(cmd, shell=True)
+    finally:
+        # Free the cores for the workers of the line inference, or after
+        # a failed retrieval
+        pool.shutdown()
 
     if not exists(paths.rfl_working_path) or not exists(paths.uncert_working_path):
         # Determine the number of neighbors to use.  Provides backwards stability and works
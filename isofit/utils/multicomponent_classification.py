@@ -17,7 +17,6 @@ import isofit.utils.template_construction as tmpl
 from isofit import ray
 from isofit.core.common import envi_header, resample_spectrum, svd_inv
 from isofit.core.fileio import IO, initialize_output, write_bil_chunk
-from isofit.core.geometry import Geometry
 from isofit.core.multistate import SurfaceMapping
 from isofit.data import env
 
@@ -56,22 +55,39 @@ class Component:
             self.Cinvs.append(svd_inv(self.Covs[-1]))
             self.mus.append(self.components[i][0][self.idx_ref])
 
+        # Min-max scaled component means, for the distances of pickClosest
+        self.mus_scaled = self.minmax(np.array(self.mus))
+        self.mus_scaled_sq = np.sum(self.mus_scaled**2, axis=1)
+
+    @staticmethod
+    def minmax(X):
+        """Scale each row of X to the range 0 to 1."""
+        X_min = np.min(X, axis=-1, keepdims=True)
+        X_max = np.max(X, axis=-1, keepdims=True)
+        return (X - X_min) / (X_max - X_min)
+
     def pickClosest(self, x, geom):
-        lamb_ref = x[self.idx_ref]
+        return self.pickClosestBatch(x[np.newaxis, :])[0]
 
-        lamb_ref = (lamb_ref - np.min(lamb_ref)) / (np.max(lamb_ref) - np.min(lamb_ref))
+    def pickClosestBatch(self, X):
+        """Surface category index of the closest component for each row of the
+        (N, n_wl) reflectances X, with one matrix product for all distances."""
+        lamb_refs = self.minmax(X[:, self.idx_ref])
 
-        mds = []
-        for ci in range(self.n_comp):
-            ref_mu = self.mus[ci]
-            ref_mu = (ref_mu - np.min(ref_mu)) / (np.max(ref_mu) - np.min(ref_mu))
-            mds.append(sum(pow(lamb_ref - ref_mu, 2)))
-        closest = np.argmin(mds)
+        mds = (
+            np.sum(lamb_refs**2, axis=1)[:, np.newaxis]
+            - 2 * lamb_refs @ self.mus_scaled.T
+            + self.mus_scaled_sq[np.newaxis, :]
+        )
+        closest = np.argmin(mds, axis=1)
 
-        surface_category = self.surface_categories[closest].strip()
-        surface_idx = SurfaceMapping[surface_category]
+        # Map each selected component to its surface category index
+        selected, inverse = np.unique(closest, return_inverse=True)
+        surface_idx = np.array(
+            [SurfaceMapping[self.surface_categories[c].strip()] for c in selected]
+        )
 
-        return surface_idx
+        return surface_idx[inverse]
 
 
 @ray.remote(num_cpus=1)
@@ -128,18 +144,16 @@ class Worker(object):
         start_line, stop_line = startstop
         output = self.out[start_line:stop_line, ...]
         for r in range(start_line, stop_line):
-            for c in range(output.shape[1]):
-                meas = self.rdn[r, c, :]
-                geom = Geometry(
-                    obs=self.obs[r, c, :], loc=self.loc[r, c, :], esd=self.esd
-                )
-                coszen = np.cos(np.deg2rad(geom.solar_zenith))
+            # Classify the whole line at once, the solar zenith being the
+            # fifth band of the observation file as read by Geometry
+            meas = np.array(self.rdn[r, :, :])
+            coszen = np.cos(np.deg2rad(self.obs[r, :, 4]))
 
-                num = meas * np.pi
-                denom = self.solar_irr * coszen
+            num = meas * np.pi
+            denom = self.solar_irr[np.newaxis, :] * coszen[:, np.newaxis]
 
-                x = num / denom
-                output[r - start_line, c, :] = self.component.pickClosest(x, geom)
+            x = num / denom
+            output[r - start_line, :, 0] = self.component.pickClosestBatch(x)
 
             unique, counts = np.unique(output[r - start_line, ...], return_counts=True)
             logging.debug(f"Elements: {unique}")
@@ -18,6 +18,8 @@
 # Author: David R Thompson, david.r.thompson@jpl.nasa.gov
 #
 
+from __future__ import annotations
+
 import os
 from types import SimpleNamespace
 
@@ -25,9 +27,10 @@ import click
 import numpy as np
 import scipy
 from scipy.linalg import inv
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from spectral.io import envi
 
+from isofit import ray
 from isofit.core import units
 from isofit.core.common import envi_header, expand_path, json_load_ascii, svd_inv
 
@@ -45,12 +48,449 @@ def next_diag_val(C: np.ndarray, starting_index, direction):
     return None
 
 
+class RunningMoments:
+    """Mean and covariance of samples seen in chunks. Each chunk is folded in
+    with Welford's update, and partial results from separate workers are
+    combined with Chan's parallel formula, so the samples never need to be
+    in memory together.
+
+    Args:
+        n_dims: number of variables
+    """
+
+    def __init__(self, n_dims: int):
+        self.n = 0
+        self.mean = np.zeros(n_dims)
+        self.M2 = np.zeros((n_dims, n_dims))
+
+    def update(self, X: np.ndarray):
+        """Add the rows of X as samples"""
+        if len(X) == 0:
+            return self
+
+        chunk = RunningMoments(X.shape[1])
+        chunk.n = len(X)
+        chunk.mean = X.mean(axis=0)
+        centered = X - chunk.mean
+        chunk.M2 = centered.T @ centered
+
+        return self.merge(chunk)
+
+    def merge(self, other: RunningMoments):
+        """Combine with the moments of another set of samples"""
+        if other.n == 0:
+            return self
+
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.n / n
+        self.M2 = self.M2 + other.M2 + np.outer(delta, delta) * self.n * other.n / n
+        self.n = n
+
+        return self
+
+    def cov(self):
+        """Sample covariance, as np.cov"""
+        return self.M2 / (self.n - 1)
+
+
+def resample_spectra(swl, x, wl):
+    """Linearly resample the rows of x from wavelengths swl to wl"""
+    p = scipy.interpolate.interp1d(
+        swl, x, kind="linear", axis=1, bounds_error=False, fill_value="extrapolate"
+    )
+    return p(wl)
+
+
+def library_chunks(
+    infile, attribute_file, wl, chunk_size, mixtures=0, seed=13, file_index=0
+):
+    """Read a spectral library from its memmap a block of lines at a time.
+
+    Args:
+        infile: ENVI reflectance library
+        attribute_file: optional ENVI attribute library matching infile
+        wl: wavelengths to resample the spectra to
+        chunk_size: approximate number of spectra per chunk
+        mixtures: fraction of synthetic mixtures to add, drawn within each chunk
+        seed: seed for the mixtures, combined with file_index and the chunk
+            position so that repeated reads give the same chunks
+
+    Yields:
+        spectra: (n, len(wl)) finite resampled spectra
+        attributes: (n, n_attributes) matching attributes, or None
+    """
+    rfl = envi.open(envi_header(infile), infile)
+    nl, nb, ns = [int(rfl.metadata[n]) for n in ("lines", "bands", "samples")]
+    swl = np.array([float(f) for f in rfl.metadata["wavelength"]])
+
+    # Maybe convert to nanometers
+    if swl[0] < 100:
+        swl = units.micron_to_nm(swl)
+
+    rfl_mm = rfl.open_memmap(interleave="bip", writable=False)
+
+    attr_mm = None
+    if attribute_file is not None:
+        attr = envi.open(envi_header(attribute_file), attribute_file)
+        nla, nba, nsa = [int(attr.metadata[n]) for n in ("lines", "bands", "samples")]
+        if nla * nsa != nl * ns:
+            raise IndexError("Mismatch in number of spectra vs. attributes")
+        attr_mm = attr.open_memmap(interleave="bip", writable=False).reshape(
+            nla * nsa, nba
+        )
+
+    lines = max(1, int(chunk_size) // ns)
+    for start in range(0, nl, lines):
+        x = np.array(rfl_mm[start : start + lines, :, :]).reshape(-1, nb)
+        spectra = resample_spectra(swl, x, wl)
+
+        attributes = None
+        if attr_mm is not None:
+            attributes = np.array(attr_mm[start * ns : start * ns + len(x)])
+
+        nmix = int(len(spectra) * mixtures)
+        if nmix > 0:
+            rng = np.random.default_rng([seed, file_index, start])
+            s1, s2 = rng.integers(len(spectra), size=(2, nmix))
+            m1 = rng.random(nmix)[:, np.newaxis]
+            mixed = m1 * spectra[s1] + (1.0 - m1) * spectra[s2]
+            spectra = np.concatenate((spectra, mixed))
+
+        # Flag bad data
+        use = np.all(np.isfinite(spectra), axis=1)
+        if attributes is not None:
+            attributes = attributes[use]
+
+        yield spectra[use], attributes
+
+
+@ray.remote(num_cpus=1)
+def accumulate_file(
+    infile, attribute_file, wl, chunk_size, mixtures, seed, file_index, kmeans
+):
+    """Per-cluster moments of the spectra, and of the spectra and attributes
+    together, of one library file"""
+    ncomp = kmeans.n_clusters
+    moments = [RunningMoments(len(wl)) for _ in range(ncomp)]
+    attr_moments = None
+
+    for spectra, attributes in library_chunks(
+        infile, attribute_file, wl, chunk_size, mixtures, seed, file_index
+    ):
+        if len(spectra) == 0:
+            continue
+
+        Z = kmeans.predict(spectra)
+        if attributes is not None:
+            spectra_attr = np.concatenate((spectra, attributes), axis=1)
+            if attr_moments is None:
+                attr_moments = [
+                    RunningMoments(spectra_attr.shape[1]) for _ in range(ncomp)
+                ]
+
+        for ci in np.unique(Z):
+            moments[ci].update(spectra[Z == ci])
+            if attributes is not None:
+                attr_moments[ci].update(spectra_attr[Z == ci])
+
+    return moments, attr_moments
+
+
+def streaming_clusters(
+    infiles, infiles_attributes, wl, ncomp, chunk_size, mixtures, seed
+):
+    """Cluster a spectral library and compute per-cluster means and
+    covariances without loading it into memory. The clusters are fit with
+    mini-batch k-means over one pass of the chunks. A second pass, run in
+    parallel across files, accumulates the cluster moments.
+
+    Returns:
+        list of (mean, covariance, attribute mean, attribute covariance) per
+        cluster, the attribute terms being None without attribute files
+    """
+    kmeans = MiniBatchKMeans(
+        init="k-means++", n_clusters=ncomp, n_init=10, random_state=seed
+    )
+
+    pending = []
+    for fi, (infile, attribute_file) in enumerate(zip(infiles, infiles_attributes)):
+        for spectra, _ in library_chunks(
+            infile, None, wl, chunk_size, mixtures, seed, fi
+        ):
+            pending.append(spectra)
+
+            # Every batch needs at least one sample per cluster
+            if sum(len(p) for p in pending) >= ncomp:
+                kmeans.partial_fit(np.concatenate(pending))
+                pending = []
+
+    if pending and hasattr(kmeans, "cluster_centers_"):
+        kmeans.partial_fit(np.concatenate(pending))
+    elif not hasattr(kmeans, "cluster_centers_"):
+        raise ValueError(
+            f"Fewer valid spectra than the {ncomp} components in {infiles}"
+        )
+
+    kmeans_id = ray.put(kmeans)
+    jobs = [
+        accumulate_file.remote(
+            infile, attribute_file, wl, chunk_size, mixtures, seed, fi, kmeans_id
+        )
+        for fi, (infile, attribute_file) in enumerate(zip(infiles, infiles_attributes))
+    ]
+
+    moments = [RunningMoments(len(wl)) for _ in range(ncomp)]
+    attr_moments = None
+    for file_moments, file_attr_moments in ray.get(jobs):
+        for ci in range(ncomp):
+            moments[ci].merge(file_moments[ci])
+
+        if file_attr_moments is not None:
+            if attr_moments is None:
+                attr_moments = file_attr_moments
+            else:
+                for ci in range(ncomp):
+                    attr_moments[ci].merge(file_attr_moments[ci])
+
+    clusters = []
+    for ci in range(ncomp):
+        if attr_moments is None:
+            m_attr, C_attr = None, None
+        else:
+            m_attr, C_attr = attr_moments[ci].mean, attr_moments[ci].cov()
+        clusters.append((moments[ci].mean, moments[ci].cov(), m_attr, C_attr))
+
+    return clusters
+
+
+def load_clusters(model, infiles, infiles_attributes, wl, ncomp, mixtures, seed):
+    """Load a spectral library into memory, cluster it with k-means, and
+    compute the per-cluster means and covariances. Sets the attribute names
+    in model, if any.
+
+    Returns:
+        list of (mean, covariance, attribute mean, attribute covariance) per
+        cluster, the attribute terms being None without attribute files
+    """
+    # load spectra
+    spectra, attributes = [], []
+    for infile, attribute_file in zip(infiles, infiles_attributes):
+        rfl = envi.open(envi_header(infile), infile)
+        nl, nb, ns = [int(rfl.metadata[n]) for n in ("lines", "bands", "samples")]
+        swl = np.array([float(f) for f in rfl.metadata["wavelength"]])
+
+        # Maybe convert to nanometers
+        if swl[0] < 100:
+            swl = units.micron_to_nm(swl)
+
+        # Load library and adjust interleave, if needed
+        rfl_mm = rfl.open_memmap(interleave="bip", writable=False)
+        x = np.array(rfl_mm[:, :, :])
+        x = x.reshape(nl * ns, nb)
+
+        # import spectra and resample
+        spectra.extend(resample_spectra(swl, x, wl))
+
+        # Load attributes
+        if attribute_file is not None:
+            attr = envi.open(envi_header(attribute_file), attribute_file)
+            nla, nba, nsa = [
+                int(attr.metadata[n]) for n in ("lines", "bands", "samples")
+            ]
+
+            # Load library and adjust interleave, if needed
+            attr_mm = attr.open_memmap(interleave="bip", writable=False)
+            x = np.array(attr_mm[:, :, :])
+            x = x.reshape(nla * nsa, nba)
+            model["attributes"] = attr.metadata["band names"]
+
+            # import spectra and resample
+            for x1 in x:
+                attributes.append(x1)
+
+    if len(attributes) > 0 and len(attributes) != len(spectra):
+        raise IndexError("Mismatch in number of spectra vs. attributes")
+
+    # calculate mixtures, if needed
+    if len(attributes) > 0 and mixtures > 0:
+        raise ValueError("Synthetic mixtures w/ attributes is not advised")
+
+    n = float(len(spectra))
+    nmix = int(n * mixtures)
+    for mi in range(nmix):
+        s1, m1 = spectra[int(np.random.rand() * n)], np.random.rand()
+        s2, m2 = spectra[int(np.random.rand() * n)], 1.0 - m1
+        spectra.append(m1 * s1 + m2 * s2)
+
+    # Lists to arrays
+    spectra = np.array(spectra)
+    attributes = np.array(attributes)
+
+    # Flag bad data
+    use = np.all(np.isfinite(spectra), axis=1)
+    spectra = spectra[use, :]
+    if len(attributes) > 0:
+        attributes = attributes[use, :]
+
+    # Two step model generation.  First step is k-means clustering.
+    # This is more "stable" than Expectation Maximization with an
+    # unconstrained covariance matrix
+    kmeans = KMeans(init="k-means++", n_clusters=ncomp, n_init=10, random_state=seed)
+    kmeans.fit(spectra)
+    Z = kmeans.predict(spectra)
+
+    # Build a combined dataset of attributes and spectra
+    if len(attributes) > 0:
+        spectra_attr = np.concatenate((spectra, attributes), axis=1)
+
+    clusters = []
+    for ci in range(ncomp):
+        m = np.mean(spectra[Z == ci, :], axis=0)
+        C = np.cov(spectra[Z == ci, :], rowvar=False)
+
+        m_attr, C_attr = None, None
+        if len(attributes) > 0:
+            m_attr = np.mean(spectra_attr[Z == ci, :], axis=0)
+            C_attr = np.cov(spectra_attr[Z == ci, :], rowvar=False)
+
+        clusters.append((m, C, m_attr, C_attr))
+
+    return clusters
+
+
+def component_model(m, C, wl, windows, normind, normalize):
+    """Shape the covariance of one cluster following the spectral windows
+    rules, feather across windows, and normalize the cluster.
+
+    Args:
+        m: cluster mean
+        C: cluster sample covariance
+        wl: model wavelengths
+        windows: window rules of the source
+        normind: indices of the reference wavelengths
+        normalize: normalization, one of Euclidean, RMS or None
+
+    Returns:
+        m: normalized mean
+        C: normalized covariance
+    """
+    C_base = C.copy()
+    C = C.copy()
+
+    # for i in range(nchan):
+    for window in windows:
+        window_idx = np.where(
+            np.logical_and(wl >= window["interval"][0], wl < window["interval"][1])
+        )[0]
+        if len(window_idx) == 0:
+            continue
+        window_range = slice(window_idx[0], window_idx[-1] + 1)
+
+        # To minimize bias, leave the channels independent
+        # and uncorrelated
+        if window["correlation"] == "decorrelated":
+            c_diag = (
+                C[window_range, window_range] + float(window["regularizer"])
+            ) * np.eye(len(window_idx))
+            C[window_range, :] = 0
+            C[:, window_range] = 0
+            C[window_range, window_range] = c_diag
+
+    for window in windows:
+        window_idx = np.where(
+            np.logical_and(wl >= window["interval"][0], wl < window["interval"][1])
+        )[0]
+        if len(window_idx) == 0:
+            continue
+        window_range = slice(window_idx[0], window_idx[-1] + 1)
+
+        # Each spectral interval, or window, is constructed
+        # using one of several rules.  We can draw the covariance
+        # directly from the data...
+        if window["correlation"] in ["EM", "EM-gauss"]:
+            cdiag = (
+                C_base[window_range, window_range]
+                + np.eye(len(window_idx)) * float(window["regularizer"])
+            ).copy()
+            if "isolated" in list(window.keys()) and window["isolated"] == 1:
+                C[window_range, :] = 0
+                C[:, window_range] = 0
+            C[window_range, window_range] = cdiag
+        window_idx = np.where(
+            np.logical_and(wl >= window["interval"][0], wl < window["interval"][1])
+        )[0]
+        if len(window_idx) == 0:
+            continue
+        window_range = slice(window_idx[0], window_idx[-1] + 1)
+
+        if window["correlation"] == "GP":
+            for i in window_idx:
+                # Alternatively, we can use a band diagonal form,
+                # a Gaussian process that promotes local smoothness.
+                width = float(window["gp_width"])
+                magnitude = float(window["gp_magnitude"])
+                kernel = scipy.stats.norm.pdf((wl - wl[i]) / width)
+                kernel = kernel / kernel.sum() * magnitude
+                C[i, :] = kernel
+                C[:, i] = kernel
+                C[i, i] = C[i, i] + float(window["regularizer"])
+
+        elif window["correlation"] in ["decorrelated", "EM"]:
+            # already handled
+            continue
+
+        else:
+            raise ValueError("I do not recognize the method " + window["correlation"])
+
+    # Now do any cross-block feathering by augmenting the precision matrix
+    P = inv(C)
+    for window in windows:
+        window_idx = np.where(
+            np.logical_and(wl >= window["interval"][0], wl < window["interval"][1])
+        )[0]
+        if len(window_idx) == 0:
+            continue
+
+        # Look for the "feather_forward" or "feather_backward" options
+        if window["correlation"] in ["EM", "decorrelated"]:
+            if "feather_backward" in list(window.keys()):
+                P[window_idx[0] - 1, window_idx[0]] -= 1.0 / window["feather_backward"]
+                P[window_idx[0], window_idx[0] - 1] -= 1.0 / window["feather_backward"]
+            if "feather_forward" in list(window.keys()):
+                P[window_idx[-1] + 1, window_idx[-1]] -= 1.0 / window["feather_forward"]
+                P[window_idx[-1], window_idx[-1] + 1] -= 1.0 / window["feather_forward"]
+    C = inv(P)
+
+    # Normalize the component spectrum if desired
+    if normalize == "Euclidean":
+        z = np.sqrt(np.sum(pow(m[normind], 2)))
+    elif normalize == "RMS":
+        z = np.sqrt(np.mean(pow(m[normind], 2)))
+    elif normalize == "None":
+        z = 1.0
+    else:
+        raise ValueError("Unrecognized normalization: %s\n" % normalize)
+    m = m / z
+    C = C / (z**2)
+
+    return m, C
+
+
+@ray.remote(num_cpus=1)
+def build_component(*args):
+    """Remote component_model"""
+    return component_model(*args)
+
+
 def surface_model(
     config_path: str,
     wavelength_path: str = None,
     output_path: str = None,
     seed: int = 13,
     multisurface: bool = False,
+    chunk_size: int = None,
+    n_cores: int = 1,
 ) -> None:
     """The surface model tool contains everything you need to build basic
     multicomponent (i.e. colleciton of Gaussian) surface priors for the
@@ -63,6 +503,13 @@ def surface_model(
         output_path: optional path to the destination .mat file, overriding
            the configuration file settings
         seed: seed used for clustering
+        multisurface: write one model file per surface category
+        chunk_size: if set, stream the spectral libraries in chunks of about
+           this many spectra instead of loading them into memory. Clusters are
+           then fit with mini-batch k-means, and synthetic mixtures are drawn
+           within each chunk
+        n_cores: number of cores to parallelize streaming across files and
+           components with
     Returns:
         None
     """
@@ -140,6 +587,14 @@ def surface_model(
         "surface_categories": [],
     }
 
+    if chunk_size:
+        ray.init(
+            ignore_reinit_error=True,
+            local_mode=n_cores == 1,
+            include_dashboard=False,
+            num_cpus=n_cores,
+        )
+
     # each "source" (i.e. spectral library) is treated separately
     for si, source_config in enumerate(config["sources"]):
         # Determine source parameters
@@ -184,215 +639,40 @@ def surface_model(
         # Surface model handling
         surface_category = source_config.get("surface_category", "")
 
-        # load spectra
-        spectra, attributes = [], []
-        for infile, attribute_file in zip(infiles, infiles_attributes):
-            rfl = envi.open(envi_header(infile), infile)
-            nl, nb, ns = [int(rfl.metadata[n]) for n in ("lines", "bands", "samples")]
-            swl = np.array([float(f) for f in rfl.metadata["wavelength"]])
-
-            # Maybe convert to nanometers
-            if swl[0] < 100:
-                swl = units.micron_to_nm(swl)
-
-            # Load library and adjust interleave, if needed
-            rfl_mm = rfl.open_memmap(interleave="bip", writable=False)
-            x = np.array(rfl_mm[:, :, :])
-            x = x.reshape(nl * ns, nb)
-
-            # import spectra and resample
-            for x1 in x:
-                p = scipy.interpolate.interp1d(
-                    swl, x1, kind="linear", bounds_error=False, fill_value="extrapolate"
-                )
-                spectra.append(p(wl))
-
-            # Load attributes
-            if attribute_file is not None:
-                attr = envi.open(envi_header(attribute_file), attribute_file)
-                nla, nba, nsa = [
-                    int(attr.metadata[n]) for n in ("lines", "bands", "samples")
-                ]
-
-                # Load library and adjust interleave, if needed
-                attr_mm = attr.open_memmap(interleave="bip", writable=False)
-                x = np.array(attr_mm[:, :, :])
-                x = x.reshape(nla * nsa, nba)
-                model["attributes"] = attr.metadata["band names"]
-
-                # import spectra and resample
-                for x1 in x:
-                    attributes.append(x1)
-
-        if len(attributes) > 0 and len(attributes) != len(spectra):
-            raise IndexError("Mismatch in number of spectra vs. attributes")
-
-        # calculate mixtures, if needed
-        if len(attributes) > 0 and mixtures > 0:
-            raise ValueError("Synthetic mixtures w/ attributes is not advised")
-
-        n = float(len(spectra))
-        nmix = int(n * mixtures)
-        for mi in range(nmix):
-            s1, m1 = spectra[int(np.random.rand() * n)], np.random.rand()
-            s2, m2 = spectra[int(np.random.rand() * n)], 1.0 - m1
-            spectra.append(m1 * s1 + m2 * s2)
+        if chunk_size:
+            if mixtures > 0 and "input_attribute_files" in source_config:
+                raise ValueError("Synthetic mixtures w/ attributes is not advised")
 
-        # Lists to arrays
-        spectra = np.array(spectra)
-        attributes = np.array(attributes)
-
-        # Flag bad data
-        use = np.all(np.isfinite(spectra), axis=1)
-        spectra = spectra[use, :]
-        if len(attributes) > 0:
-            attributes = attributes[use, :]
-
-        ## Accumulate total list of window indices
-        # window_idx = -np.ones((nchan), dtype=int)
-        # for wi, win in enumerate(windows):
-        #    active_wl = np.logical_and(wl >= win['interval'][0], wl < win['interval'][1])
-        #    window_idx[active_wl] = wi
-
-        # Two step model generation.  First step is k-means clustering.
-        # This is more "stable" than Expectation Maximization with an
-        # unconstrained covariance matrix
-        kmeans = KMeans(
-            init="k-means++", n_clusters=ncomp, n_init=10, random_state=seed
-        )
-        kmeans.fit(spectra)
-        Z = kmeans.predict(spectra)
-
-        # Build a combined dataset of attributes and spectra
-        if len(attributes) > 0:
-            spectra_attr = np.concatenate((spectra, attributes), axis=1)
+            # Stream the libraries, clustering and accumulating the component
+            # moments chunk by chunk, in parallel across files and components
+            clusters = streaming_clusters(
+                infiles, infiles_attributes, wl, ncomp, chunk_size, mixtures, seed
+            )
+            if infiles_attributes[-1] is not None:
+                model["attributes"] = envi.read_envi_header(
+                    envi_header(infiles_attributes[-1])
+                )["band names"]
+
+            jobs = [
+                build_component.remote(m, C, wl, windows, normind, normalize)
+                for m, C, _, _ in clusters
+            ]
+            components = ray.get(jobs)
+        else:
+            clusters = load_clusters(
+                model, infiles, infiles_attributes, wl, ncomp, mixtures, seed
+            )
+            components = [
+                component_model(m, C, wl, windows, normind, normalize)
+                for m, C, _, _ in clusters
+            ]
 
-        # now fit the full covariance for each component
-        for ci in range(ncomp):
+        # now add the full covariance for each component
+        for ci, ((m, C), (_, _, m_attr, C_attr)) in enumerate(
+            zip(components, clusters)
+        ):
             print(ci, source_config["input_spectrum_files"])
 
-            m = np.mean(spectra[Z == ci, :], axis=0)
-            C = np.cov(spectra[Z == ci, :], rowvar=False)
-            C_base = C.copy()
-
-            if len(attributes) > 0:
-                m_attr = np.mean(spectra_attr[Z == ci, :], axis=0)
-                C_attr = np.cov(spectra_attr[Z == ci, :], rowvar=False)
-
-            # for i in range(nchan):
-            for window in windows:
-                window_idx = np.where(
-                    np.logical_and(
-                        wl >= window["interval"][0], wl < window["interval"][1]
-                    )
-                )[0]
-                if len(window_idx) == 0:
-                    continue
-                window_range = slice(window_idx[0], window_idx[-1] + 1)
-
-                # To minimize bias, leave the channels independent
-                # and uncorrelated
-                if window["correlation"] == "decorrelated":
-                    c_diag = (
-                        C[window_range, window_range] + float(window["regularizer"])
-                    ) * np.eye(len(window_idx))
-                    C[window_range, :] = 0
-                    C[:, window_range] = 0
-                    C[window_range, window_range] = c_diag
-
-            for window in windows:
-                window_idx = np.where(
-                    np.logical_and(
-                        wl >= window["interval"][0], wl < window["interval"][1]
-                    )
-                )[0]
-                if len(window_idx) == 0:
-                    continue
-                window_range = slice(window_idx[0], window_idx[-1] + 1)
-
-                # Each spectral interval, or window, is constructed
-                # using one of several rules.  We can draw the covariance
-                # directly from the data...
-                if window["correlation"] in ["EM", "EM-gauss"]:
-                    cdiag = (
-                        C_base[window_range, window_range]
-                        + np.eye(len(window_idx)) * float(window["regularizer"])
-                    ).copy()
-                    if "isolated" in list(window.keys()) and window["isolated"] == 1:
-                        C[window_range, :] = 0
-                        C[:, window_range] = 0
-                    C[window_range, window_range] = cdiag
-                window_idx = np.where(
-                    np.logical_and(
-                        wl >= window["interval"][0], wl < window["interval"][1]
-                    )
-                )[0]
-                if len(window_idx) == 0:
-                    continue
-                window_range = slice(window_idx[0], window_idx[-1] + 1)
-
-                if window["correlation"] == "GP":
-                    for i in window_idx:
-                        # Alternatively, we can use a band diagonal form,
-                        # a Gaussian process that promotes local smoothness.
-                        width = float(window["gp_width"])
-                        magnitude = float(window["gp_magnitude"])
-                        kernel = scipy.stats.norm.pdf((wl - wl[i]) / width)
-                        kernel = kernel / kernel.sum() * magnitude
-                        C[i, :] = kernel
-                        C[:, i] = kernel
-                        C[i, i] = C[i, i] + float(window["regularizer"])
-
-                elif window["correlation"] in ["decorrelated", "EM"]:
-                    # already handled
-                    continue
-
-                else:
-                    raise ValueError(
-                        "I do not recognize the method " + window["correlation"]
-                    )
-
-            # Now do any cross-block feathering by augmenting the precision matrix
-            P = inv(C)
-            for window in windows:
-                window_idx = np.where(
-                    np.logical_and(
-                        wl >= window["interval"][0], wl < window["interval"][1]
-                    )
-                )[0]
-                if len(window_idx) == 0:
-                    continue
-
-                # Look for the "feather_forward" or "feather_backward" options
-                if window["correlation"] in ["EM", "decorrelated"]:
-                    if "feather_backward" in list(window.keys()):
-                        P[window_idx[0] - 1, window_idx[0]] -= (
-                            1.0 / window["feather_backward"]
-                        )
-                        P[window_idx[0], window_idx[0] - 1] -= (
-                            1.0 / window["feather_backward"]
-                        )
-                    if "feather_forward" in list(window.keys()):
-                        P[window_idx[-1] + 1, window_idx[-1]] -= (
-                            1.0 / window["feather_forward"]
-                        )
-                        P[window_idx[-1], window_idx[-1] + 1] -= (
-                            1.0 / window["feather_forward"]
-                        )
-            C = inv(P)
-
-            # Normalize the component spectrum if desired
-            if normalize == "Euclidean":
-                z = np.sqrt(np.sum(pow(m[normind], 2)))
-            elif normalize == "RMS":
-                z = np.sqrt(np.mean(pow(m[normind], 2)))
-            elif normalize == "None":
-                z = 1.0
-            else:
-                raise ValueError("Unrecognized normalization: %s\n" % normalize)
-            m = m / z
-            C = C / (z**2)
-
             try:
                 Cinv = svd_inv(C)
             except:
@@ -402,7 +682,7 @@ def surface_model(
             model["means"].append(m)
             model["covs"].append(C)
 
-            if len(attributes) > 0:
+            if m_attr is not None:
                 model["attribute_means"].append(m_attr)
                 model["attribute_covs"].append(C_attr)
 
@@ -451,6 +731,14 @@ def surface_model(
 )
 @click.option("--output_path", help="Path to write the created surface model to")
 @click.option("--seed", default=13, type=int, help="Seed for reproducibility")
+@click.option(
+    "--chunk_size",
+    type=int,
+    help="Stream the spectral libraries in chunks of about this many spectra",
+)
+@click.option(
+    "--n_cores", default=1, type=int, help="Number of cores to use when streaming"
+)
 def cli(**kwargs):
     """Build a new surface model to a block of data"""
 